@@ -0,0 +1,513 @@
+"""
+Async (ASGI) serving mode.
+
+Serves the same routes as main.py on Starlette, so a single process can keep
+hundreds of questions in flight while they wait on Groq:
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 8080 --workers 2
+    gunicorn -k uvicorn.workers.UvicornWorker -w 2 -b 0.0.0.0:8080 asgi_app:app
+
+The retrieval pipeline (encoder, index, caches) is shared with main.py. Its
+CPU-bound steps run in a thread pool; the Groq call uses the async client,
+through the same LLMGateway (concurrency, queue, rate limits, deadline and
+retries) as main.py's calls.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import groq
+from authlib.integrations.starlette_client import OAuth
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+from starlette.templating import Jinja2Templates
+
+import main
+from metrics import record, registry, span, trace
+from startup import NotReady
+from llm_gateway import GatewayRejected
+from query_cache import normalize_question
+from main import (
+    ANSWER_DEADLINE, MAX_ANSWER_TOKENS, SLOW_REQUEST_SECONDS, STARTUP_WAIT_SECONDS, admin_authorized, answer_cache,
+    build_messages, build_sources, collect_stats, count_answer, build_context, cached_answer, chat_store,
+    estimate_tokens, fallback_answer, llm_gateway, relevant_passages, reload_index, retrieve, sse_event, startup,
+    truncate_sources, upstream_overloaded, single_flight,
+)
+
+# CPU-bound work (encoding, search, row lookup) runs here, off the event loop
+cpu_pool = ThreadPoolExecutor(max_workers=int(os.getenv("CPU_POOL_SIZE", str(os.cpu_count() or 4))))
+
+# Retries and timeouts come from llm_gateway, as for main.client
+aclient = groq.AsyncGroq(api_key=main.api_key, base_url=os.getenv("GROQ_BASE_URL") or None, max_retries=0)
+
+oauth = OAuth()
+oauth.register(
+    name='google',
+    client_id=os.getenv("GOOGLE_CLIENT_ID"),
+    client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
+    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+    client_kwargs={
+        'scope': 'openid email profile'
+    }
+)
+
+templates = Jinja2Templates(directory='templates')
+# index.html uses Flask's url_for('static', filename=...)
+templates.env.globals['url_for'] = lambda endpoint, filename='': f"/{endpoint}/{filename}"
+
+
+async def run_cpu(fn, *args):
+    # Run in a copy of the caller's context so timing spans reach its request trace
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(cpu_pool, context.run, fn, *args)
+
+
+def current_user(request):
+    return request.session.get('user')
+
+
+def auth_required():
+    return JSONResponse({'error': 'Authentication required', 'redirect': '/login'}, status_code=401)
+
+
+def busy_response(e):
+    return JSONResponse({'error': 'Server is busy, please retry shortly.', 'reason': e.reason}, status_code=503,
+                        headers={'Retry-After': str(max(1, int(round(e.retry_after))))})
+
+
+def not_ready_response(e):
+    return JSONResponse({'error': str(e), 'state': e.state}, status_code=503,
+                        headers={'Retry-After': str(max(1, int(round(e.retry_after))))})
+
+
+def lookup_rows(question, top_results=7):
+    """
+    Retrieval, row lookup and context packing, run together in the CPU pool.
+
+    Returns (question_embedding, top_indices, corpus_version, passages, cached)
+    where passages is (relevant_df, context, packed_df), or None on a cache hit.
+    """
+    question_embedding, top_indices, loaded = retrieve(question, top_results)
+    corpus_version = loaded.version
+    cached = cached_answer(question_embedding, top_indices, corpus_version)
+    if cached is not None:
+        return question_embedding, top_indices, corpus_version, None, cached
+    relevant_df = relevant_passages(loaded, top_indices)
+    context, packed_df = build_context(question, relevant_df)
+    return question_embedding, top_indices, corpus_version, (relevant_df, context, packed_df), None
+
+
+async def query_groq_async(question, context):
+    """Async version of main.query_groq; raises GatewayRejected like it."""
+    messages = build_messages(question, context)
+    try:
+        with span('llm'):
+            response = await llm_gateway.call_async(
+                lambda timeout: aclient.chat.completions.create(
+                    model="llama-3.3-70b-versatile",
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=MAX_ANSWER_TOKENS,
+                    timeout=timeout
+                ),
+                cost_tokens=estimate_tokens(messages)
+            )
+        return response.choices[0].message.content
+    except GatewayRejected:
+        raise
+    except Exception as e:
+        rejected = upstream_overloaded(e)
+        if rejected is not None:
+            raise rejected
+        error_msg = f"Error querying Groq API: {str(e)}"
+        print(error_msg)
+        return error_msg
+
+
+async def stream_groq_async(question, context):
+    """Async version of main.stream_groq: yields answer text pieces, holding a gateway slot until closed."""
+    messages = build_messages(question, context)
+    async with llm_gateway.admit_async(estimate_tokens(messages)) as expires_at:
+        try:
+            stream = await llm_gateway.retrying_async(
+                lambda timeout: aclient.chat.completions.create(
+                    model="llama-3.3-70b-versatile",
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=MAX_ANSWER_TOKENS,
+                    stream=True,
+                    timeout=timeout
+                ),
+                expires_at
+            )
+        except Exception as e:
+            rejected = upstream_overloaded(e)
+            if rejected is not None:
+                raise rejected
+            raise
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+# Groq calls that outlived their request; the event loop only keeps weak
+# references to tasks, so they are held here until they finish
+late_answers = set()
+
+
+def store_when_done(call, store):
+    """Pass the answer of a Groq call that missed its deadline to store() once it arrives."""
+    late_answers.add(call)
+
+    def done(call):
+        late_answers.discard(call)
+        if call.cancelled() or call.exception() is not None:
+            return
+        if not call.result().startswith("Error querying Groq API"):
+            store(call.result())
+
+    call.add_done_callback(done)
+
+
+async def process_question_async(question, top_results=7):
+    """Async version of main.process_question, coalesced through the same SingleFlight."""
+    if not question.strip():
+        return None, "Please enter a valid question!", None
+
+    key = f"{top_results}:{normalize_question(question)}"
+    answer, sources, index_version = await single_flight.do_async(
+        key, lambda: answer_question_async(question, top_results)
+    )
+    return answer, sources, index_version
+
+
+async def answer_question_async(question, top_results=7):
+    """Async version of main.answer_question."""
+    question_embedding, top_indices, corpus_version, passages, cached = await run_cpu(
+        lookup_rows, question, top_results
+    )
+    if cached is not None:
+        return (*cached, corpus_version)
+
+    relevant_df, context, packed_df = passages
+    sources = build_sources(packed_df)
+
+    def store(answer):
+        answer_cache.store(question_embedding, top_indices, answer, sources, version=corpus_version)
+
+    # Shielded, so a deadline miss (or a client going away) leaves the call
+    # running and its answer is still cached, as on the sync path
+    call = asyncio.ensure_future(query_groq_async(question, context))
+    try:
+        with span('generate'):
+            answer = await asyncio.wait_for(asyncio.shield(call), ANSWER_DEADLINE or None)
+    except asyncio.TimeoutError:
+        store_when_done(call, store)
+        return fallback_answer(question, relevant_df, f"no answer within {ANSWER_DEADLINE:g}s"), sources, corpus_version
+    except asyncio.CancelledError:
+        store_when_done(call, store)
+        raise
+
+    if answer.startswith("Error querying Groq API"):
+        return fallback_answer(question, relevant_df, answer), sources, corpus_version
+    count_answer('llm')
+    store(answer)
+    return answer, sources, corpus_version
+
+
+async def stream_question_async(question, top_results=7):
+    """Async version of main.stream_question."""
+    question_embedding, top_indices, corpus_version, passages, cached = await run_cpu(
+        lookup_rows, question, top_results
+    )
+    if cached is not None:
+        answer, sources = cached
+        yield sse_event('sources', {'sources': truncate_sources(sources), 'question': question,
+                                    'index_version': corpus_version})
+        yield sse_event('token', {'text': answer})
+        startup.served()
+        yield sse_event('done', {'cached': True})
+        return
+
+    relevant_df, context, packed_df = passages
+    sources = build_sources(packed_df)
+    yield sse_event('sources', {'sources': truncate_sources(sources), 'question': question,
+                                'index_version': corpus_version})
+
+    pieces = stream_groq_async(question, context)
+    parts = []
+    started = time.perf_counter()
+    try:
+        # Only the first token is deadline-bound, as in main.stream_question
+        try:
+            first = await asyncio.wait_for(pieces.__anext__(), ANSWER_DEADLINE or None)
+        except StopAsyncIteration:
+            first = None
+        record('first_token', time.perf_counter() - started)
+        if first is not None:
+            parts.append(first)
+            yield sse_event('token', {'text': first})
+            async for piece in pieces:
+                parts.append(piece)
+                yield sse_event('token', {'text': piece})
+    except GatewayRejected as e:
+        yield sse_event('error', {'error': 'Server is busy, please retry shortly.', 'retry_after': e.retry_after})
+        return
+    except Exception as e:
+        error_msg = f"Error querying Groq API: {str(e) or type(e).__name__}"
+        print(error_msg)
+        if not parts:
+            yield sse_event('token', {'text': fallback_answer(question, relevant_df, error_msg)})
+            startup.served()
+            yield sse_event('done', {'cached': False, 'fallback': True})
+            return
+        yield sse_event('error', {'error': error_msg})
+        return
+    finally:
+        # Releases the gateway slot if the client went away or the deadline passed
+        await pieces.aclose()
+
+    record('llm', time.perf_counter() - started)
+    count_answer('llm')
+    answer_cache.store(question_embedding, top_indices, "".join(parts), sources, version=corpus_version)
+    startup.served()
+    yield sse_event('done', {'cached': False})
+
+
+async def traced_async(endpoint, events):
+    """Async version of metrics.traced."""
+    with trace(endpoint, SLOW_REQUEST_SECONDS):
+        async for event in events:
+            yield event
+
+
+async def read_json(request):
+    """Request body as a dict, {} when it is missing or not JSON (like get_json(silent=True))."""
+    try:
+        data = await request.json()
+    except json.JSONDecodeError:
+        data = {}
+    return data if isinstance(data, dict) else {}
+
+
+async def read_question(request):
+    return (await read_json(request)).get('question', '').strip()
+
+
+# AUTHENTICATION ROUTES
+
+async def login(request):
+    """Redirect to Google OAuth login."""
+    redirect_uri = request.url_for('authorize')
+    return await oauth.google.authorize_redirect(request, str(redirect_uri))
+
+
+async def authorize(request):
+    """Handle OAuth callback."""
+    try:
+        token = await oauth.google.authorize_access_token(request)
+        user_info = token.get('userinfo')
+        if user_info:
+            request.session['user'] = {
+                'email': user_info['email'],
+                'name': user_info.get('name', 'User'),
+                'picture': user_info.get('picture', '')
+            }
+            return RedirectResponse('/')
+        return RedirectResponse('/login')
+    except Exception as e:
+        print(f"OAuth error: {str(e)}")
+        return RedirectResponse('/login')
+
+
+async def logout(request):
+    """Logout user."""
+    request.session.clear()
+    return RedirectResponse('/')
+
+
+async def get_user(request):
+    """Get current user info."""
+    return JSONResponse(current_user(request))
+
+
+# APP ROUTES
+
+async def index(request):
+    """Render the main page."""
+    return templates.TemplateResponse(request, 'index.html')
+
+
+async def query_endpoint(request):
+    """Handle user queries via API."""
+    try:
+        question = await read_question(request)
+        if not question:
+            return JSONResponse({'error': 'Question is required'}, status_code=400)
+
+        with trace('/query', SLOW_REQUEST_SECONDS):
+            answer, sources, index_version = await process_question_async(question)
+        if answer is None:
+            return JSONResponse({'error': sources}, status_code=400)
+
+        startup.served()
+        return JSONResponse({
+            'answer': answer,
+            'sources': truncate_sources(sources),
+            'question': question,
+            'index_version': index_version
+        })
+    except GatewayRejected as e:
+        return busy_response(e)
+    except NotReady as e:
+        return not_ready_response(e)
+    except Exception as e:
+        print(f"Error in /query: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def query_stream_endpoint(request):
+    """Handle user queries, streaming the answer as server-sent events."""
+    question = await read_question(request)
+    if not question:
+        return JSONResponse({'error': 'Question is required'}, status_code=400)
+    # Wait for the model before the stream's 200 status is sent
+    try:
+        await run_cpu(startup.wait, STARTUP_WAIT_SECONDS)
+    except NotReady as e:
+        return not_ready_response(e)
+    return StreamingResponse(
+        traced_async('/query/stream', stream_question_async(question)),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def chats(request):
+    """List the current user's chats, or replace them all (the old whole-history upload)."""
+    user = current_user(request)
+    if not user:
+        return auth_required()
+    try:
+        if request.method == 'POST':
+            await run_cpu(chat_store.replace_chats, user['email'], await request.json())
+            return JSONResponse({'success': True})
+        page = await run_cpu(chat_store.list_chats, user['email'],
+                             request.query_params.get('offset', 0), request.query_params.get('limit'))
+        return JSONResponse(page)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def chat(request):
+    """Create or rename (PUT) or delete (DELETE) one chat."""
+    user = current_user(request)
+    if not user:
+        return auth_required()
+    chat_id = request.path_params['chat_id']
+    try:
+        if request.method == 'DELETE':
+            await run_cpu(chat_store.delete_chat, user['email'], chat_id)
+        else:
+            data = await read_json(request)
+            await run_cpu(chat_store.save_chat, user['email'], chat_id, data.get('title'), data.get('createdAt'))
+        return JSONResponse({'success': True})
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def chat_messages(request):
+    """Page through a chat's messages (GET ?after=&limit=) or append one (POST)."""
+    user = current_user(request)
+    if not user:
+        return auth_required()
+    chat_id = request.path_params['chat_id']
+    try:
+        if request.method == 'POST':
+            data = await read_json(request)
+            message_id = await run_cpu(
+                chat_store.append_message, user['email'], chat_id, data.get('role'), data.get('message'),
+                data.get('sources'), data.get('timestamp')
+            )
+            return JSONResponse({'success': True, 'id': message_id})
+        page = await run_cpu(chat_store.messages, user['email'], chat_id,
+                             request.query_params.get('after', 0), request.query_params.get('limit'))
+        return JSONResponse(page)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def stats(request):
+    """Get statistics about the database."""
+    try:
+        return JSONResponse(collect_stats())
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def admin_reload(request):
+    """Swap in a newly published index now, as main.admin_reload."""
+    if not admin_authorized(request.headers.get('Authorization')):
+        return JSONResponse({'error': 'Admin token required'}, status_code=403)
+    try:
+        data = await read_json(request)
+        # Opening and warming up the new index blocks, so it runs in the CPU pool
+        payload, status = await run_cpu(reload_index, bool(data.get('force')))
+        return JSONResponse(payload, status_code=status)
+    except NotReady as e:
+        return not_ready_response(e)
+
+
+async def healthz(request):
+    """Liveness, as main.healthz."""
+    return JSONResponse({'status': 'ok'})
+
+
+async def readyz(request):
+    """Readiness, as main.readyz."""
+    startup.start()
+    status = startup.status()
+    return JSONResponse(status, status_code=200 if status['ready'] else 503)
+
+
+async def metrics(request):
+    """Prometheus metrics, as main.metrics."""
+    return PlainTextResponse(await run_cpu(registry.render), media_type='text/plain; version=0.0.4')
+
+
+routes = [
+    Route('/', index),
+    Route('/login', login),
+    Route('/authorize', authorize),
+    Route('/logout', logout),
+    Route('/api/user', get_user),
+    Route('/query', query_endpoint, methods=['POST']),
+    Route('/query/stream', query_stream_endpoint, methods=['POST']),
+    Route('/chats', chats, methods=['GET', 'POST']),
+    Route('/chats/{chat_id}', chat, methods=['PUT', 'DELETE']),
+    Route('/chats/{chat_id}/messages', chat_messages, methods=['GET', 'POST']),
+    Route('/stats', stats),
+    Route('/admin/reload', admin_reload, methods=['POST']),
+    Route('/healthz', healthz),
+    Route('/readyz', readyz),
+    Route('/metrics', metrics),
+    Mount('/static', StaticFiles(directory='static'), name='static'),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(SessionMiddleware, secret_key=os.getenv("FLASK_SECRET_KEY", "supersecretkey"))],
+)
@@ -0,0 +1,81 @@
+"""
+Recall@k versus latency of the IVF backend against exact search.
+
+Uses a synthetic clustered corpus (transcript embeddings are strongly
+clustered by topic, unlike uniform random vectors) or an existing index
+directory:
+
+    python -m benchmarks.ann_bench --size 100000 --nprobe 1 4 8 16 32
+    python -m benchmarks.ann_bench --index index --nprobe 1 2 4 8
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ivf_index import IVFIndex
+from retrieval import normalize_rows, top_k_indices
+
+DIM = 384
+
+
+def synthetic_corpus(size, n_topics, rng):
+    """Unit vectors drawn around n_topics random topic directions."""
+    topics = normalize_rows(rng.standard_normal((n_topics, DIM)).astype(np.float32))
+    labels = rng.integers(0, n_topics, size)
+    noise = rng.standard_normal((size, DIM)).astype(np.float32) * 0.06
+    return normalize_rows(topics[labels] + noise)
+
+
+def make_queries(matrix, n_queries, rng):
+    """Perturbed corpus vectors, so every query has close true neighbours."""
+    picks = rng.choice(matrix.shape[0], n_queries, replace=False)
+    noise = rng.standard_normal((n_queries, matrix.shape[1])).astype(np.float32) * 0.03
+    return normalize_rows(np.asarray(matrix[picks]) + noise)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--index', default=None, help='use vectors.npy from this index directory')
+    parser.add_argument('--size', type=int, default=100_000)
+    parser.add_argument('--topics', type=int, default=2_000)
+    parser.add_argument('--n-lists', type=int, default=None)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.index:
+        matrix = np.load(f"{args.index}/vectors.npy")
+    else:
+        matrix = synthetic_corpus(args.size, args.topics, rng)
+    queries = make_queries(matrix, min(args.queries, matrix.shape[0]), rng)
+
+    start = time.perf_counter()
+    ivf = IVFIndex.build(matrix, n_lists=args.n_lists)
+    print(f"{matrix.shape[0]:,} vectors | {ivf.n_lists} lists | build {time.perf_counter() - start:.1f} s\n")
+
+    exact_ids, exact_times = [], []
+    for q in queries:
+        t = time.perf_counter()
+        exact_ids.append(set(top_k_indices(matrix @ q, args.top_k).tolist()))
+        exact_times.append((time.perf_counter() - t) * 1000)
+    print(f"{'exact':>10} | recall@{args.top_k} 1.000 | "
+          f"p50 {np.percentile(exact_times, 50):7.3f} ms | p99 {np.percentile(exact_times, 99):7.3f} ms")
+
+    for nprobe in args.nprobe:
+        hits, times = 0, []
+        for q, truth in zip(queries, exact_ids):
+            t = time.perf_counter()
+            ids, _ = ivf.search(matrix, q, args.top_k, nprobe)
+            times.append((time.perf_counter() - t) * 1000)
+            hits += len(truth & set(ids.tolist()))
+        recall = hits / (len(queries) * args.top_k)
+        print(f"{'nprobe=' + str(nprobe):>10} | recall@{args.top_k} {recall:.3f} | "
+              f"p50 {np.percentile(times, 50):7.3f} ms | p99 {np.percentile(times, 99):7.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Chunking throughput on long transcripts.
+
+Builds synthetic caption tracks of the given lengths (an entry every 2-6
+seconds, punctuated every few entries) and times each chunking strategy,
+plus the chunker the harvester used before chunking.py, in caption entries
+per second. The time strategy is checked against it: the same chunks,
+except the shorter ones the old loop repeated inside the last full one.
+
+    python -m benchmarks.chunking_bench --hours 1 4 12
+"""
+import argparse
+import random
+import re
+import time
+
+from chunking import Chunk, chunk_transcript
+from harvester import Entry
+
+WORDS = ("so today we are going to talk about sugar cancer sleep health the body heart brain "
+         "doctors research study people food exercise why this matters and what you can do").split()
+
+
+def synthetic_entries(hours, seed=0):
+    rng = random.Random(seed)
+    entries, start = [], 0.0
+    while start < hours * 3600:
+        length = round(rng.uniform(2.0, 6.0), 2)
+        text = ' '.join(rng.choices(WORDS, k=rng.randint(4, 14)))
+        if rng.random() < 0.3:
+            text += rng.choice('.?!')
+        entries.append(Entry(text + ('\n' if rng.random() < 0.2 else ''), round(start, 2), length))
+        start += length
+    return entries
+
+
+def legacy_clean_text(text):
+    text = text.replace('\n', ' ')
+    text = text.replace('\\', '')
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+
+def legacy_chunks(transcript_list, chunk_duration_seconds=30, overlap_seconds=5):
+    """The previous harvester chunker: rescans and re-cleans entries for every chunk."""
+    chunks = []
+    chunk_id = 1
+    i = 0
+    while i < len(transcript_list):
+        chunk_start_time = transcript_list[i].start
+        chunk_text = ""
+        chunk_entries = []
+        j = i
+        while j < len(transcript_list):
+            entry = transcript_list[j]
+            if entry.start - chunk_start_time < chunk_duration_seconds:
+                cleaned_text = legacy_clean_text(entry.text)
+                if chunk_text:
+                    chunk_text += " " + cleaned_text
+                else:
+                    chunk_text = cleaned_text
+                chunk_entries.append(entry)
+                j += 1
+            else:
+                break
+        if chunk_text:
+            chunk_end_time = chunk_entries[-1].start + chunk_entries[-1].duration
+            chunks.append(Chunk(chunk_id, chunk_text, round(chunk_start_time / 60, 2),
+                                round(chunk_end_time / 60, 2)))
+            chunk_id += 1
+        overlap_start_time = chunk_start_time + chunk_duration_seconds - overlap_seconds
+        next_i = i
+        for k in range(i, len(transcript_list)):
+            if transcript_list[k].start >= overlap_start_time:
+                next_i = k
+                break
+        else:
+            next_i = len(transcript_list)
+        if next_i <= i:
+            next_i = i + 1
+        i = next_i
+    return chunks
+
+
+def timed(fn, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=float, nargs='+', default=[1, 4, 12])
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--overlap', type=float, default=5)
+    parser.add_argument('--max-tokens', type=int, default=128)
+    parser.add_argument('--overlap-tokens', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    runs = {
+        'legacy': lambda e: legacy_chunks(e, args.duration, args.overlap),
+        'time': lambda e: chunk_transcript(e, 'time', duration=args.duration, overlap=args.overlap),
+        'tokens': lambda e: chunk_transcript(e, 'tokens', max_tokens=args.max_tokens,
+                                             overlap_tokens=args.overlap_tokens),
+        'sentences': lambda e: chunk_transcript(e, 'sentences', duration=args.duration, overlap=args.overlap),
+    }
+    for hours in args.hours:
+        entries = synthetic_entries(hours)
+        results = {}
+        for name, run in runs.items():
+            seconds, chunks = timed(lambda: run(entries), args.repeat)
+            results[name] = chunks
+            words = [len(c.text.split()) for c in chunks]
+            print(f"{hours:>5g} h {len(entries):>7} entries | {name:>9} | {seconds * 1000:8.1f} ms | "
+                  f"{len(entries) / seconds:>10.0f} entries/s | {len(chunks):>6} chunks | "
+                  f"words/chunk {min(words)}-{max(words)}")
+        legacy, current = results['legacy'], results['time']
+        same = legacy[:len(current)] == current and all(
+            c.end_time <= current[-1].end_time for c in legacy[len(current):])
+        print(f"{'':>24} time == legacy (less {len(legacy) - len(current)} repeated chunks): {same}")
+
+
+if __name__ == '__main__':
+    main()
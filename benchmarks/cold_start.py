@@ -0,0 +1,152 @@
+"""
+Cold start: time from launching gunicorn to the first served query.
+
+For each worker class, startup mode and preload setting, starts the app
+against the local fake Groq server and records, from the moment gunicorn
+is spawned:
+
+    healthz       first 200 from /healthz (the process serves requests)
+    readyz        first 200 from /readyz (encoder and index loaded, warmed up)
+    first query   first 200 from POST /query
+
+plus the RSS and PSS of every worker once it is ready. PSS splits shared
+pages between the processes mapping them, so with --preload the model
+pages shared copy-on-write show up as a lower PSS per worker:
+
+    python -m benchmarks.cold_start --modes sync async --startup eager background lazy --preload 0 1 --workers 2
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_groq import FakeGroqServer
+from benchmarks.loadgen import SECRET_KEY, SERVER_MODES, child_pids, rss_kb, stop_server
+
+
+def pss_kb(pid):
+    """Proportional set size of pid (Linux smaps_rollup), or None."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def probe(port, method, path, body=None, timeout=60):
+    """Status of one request, or None if the server is not accepting connections yet."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                     headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    except OSError:
+        return None
+    finally:
+        conn.close()
+
+
+def log_tail(log_path, size=2000):
+    with open(log_path, 'rb') as f:
+        f.seek(max(0, os.path.getsize(log_path) - size))
+        return f.read().decode('utf-8', 'replace')
+
+
+def wait_for(proc, port, method, path, log_path, body=None, deadline=300, interval=0.05):
+    """Seconds until path first answers 200, measured by the caller's clock."""
+    stop_at = time.time() + deadline
+    while time.time() < stop_at:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited: {log_tail(log_path)}")
+        if probe(port, method, path, body) == 200:
+            return
+        time.sleep(interval)
+    # Usually the encoder could not be loaded (e.g. no network to download it)
+    raise RuntimeError(f"{path} did not answer 200 within {deadline}s; server log:\n{log_tail(log_path)}")
+
+
+def measure(mode, startup, preload, workers, port, groq_url, deadline=300):
+    cmd = [part.format(port=port, workers=workers, threads=8) for part in SERVER_MODES[mode]]
+    data_dir = tempfile.mkdtemp(prefix='cold-start-')
+    env = {**os.environ, 'GROQ_BASE_URL': groq_url, 'GROQ_API_KEY': os.getenv('GROQ_API_KEY', 'fake'),
+           'STARTUP_MODE': startup, 'GUNICORN_PRELOAD': '1' if preload else '0',
+           'ANSWER_CACHE_SIZE': '0', 'LLM_REQUESTS_PER_MINUTE': '0', 'LLM_TOKENS_PER_MINUTE': '0',
+           'FLASK_SECRET_KEY': SECRET_KEY,
+           'CHAT_DB': os.path.join(data_dir, 'chats.sqlite3'),
+           'SINGLE_FLIGHT_DB': os.path.join(data_dir, 'single-flight.sqlite3')}
+    # The server log goes to a file: an undrained pipe would stall a chatty server
+    log_path = os.path.join(data_dir, 'server.log')
+    log = open(log_path, 'wb')
+    start = time.time()
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=log)
+    try:
+        wait_for(proc, port, 'GET', '/healthz', log_path, deadline=deadline)
+        healthz = time.time() - start
+        # A lazy worker only starts loading when probed, so /readyz is polled
+        # before /query in every mode to keep the comparison fair
+        wait_for(proc, port, 'GET', '/readyz', log_path, deadline=deadline)
+        readyz = time.time() - start
+        wait_for(proc, port, 'POST', '/query', log_path, {'question': 'What is planned obsolescence?'}, deadline)
+        first_query = time.time() - start
+        pids = child_pids(proc.pid)
+        return {
+            'mode': mode, 'startup': startup, 'preload': preload, 'workers': workers,
+            'healthz_seconds': round(healthz, 2),
+            'readyz_seconds': round(readyz, 2),
+            'first_query_seconds': round(first_query, 2),
+            'worker_rss_mb': [round((rss_kb(pid) or 0) / 1024, 1) for pid in pids],
+            'worker_pss_mb': [round((pss_kb(pid) or 0) / 1024, 1) for pid in pids],
+        }
+    finally:
+        stop_server(proc)
+        log.close()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=sorted(SERVER_MODES), default=['sync'])
+    parser.add_argument('--startup', nargs='+', choices=['eager', 'background', 'lazy'],
+                        default=['eager', 'background', 'lazy'])
+    parser.add_argument('--preload', type=int, nargs='+', choices=[0, 1], default=[0, 1])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--llm-ms', type=float, default=50, help='fake Groq latency to the first token')
+    parser.add_argument('--port', type=int, default=8092)
+    parser.add_argument('--deadline', type=float, default=300, help='seconds to wait for each stage before giving up')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    fake = FakeGroqServer(first_token_ms=args.llm_ms, token_ms=0).start()
+    results = []
+    try:
+        for mode in args.modes:
+            for preload in args.preload:
+                # Preloading always loads in the master, whatever STARTUP_MODE says
+                for startup in (['preload'] if preload else args.startup):
+                    r = measure(mode, startup, bool(preload), args.workers, args.port, fake.base_url, args.deadline)
+                    results.append(r)
+                    if not args.json:
+                        print(f"{mode:>7} {startup:>10} preload={int(preload)} w={args.workers} | "
+                              f"healthz {r['healthz_seconds']:6.2f}s | readyz {r['readyz_seconds']:6.2f}s | "
+                              f"first query {r['first_query_seconds']:6.2f}s | "
+                              f"RSS {' '.join(f'{mb:.0f}' for mb in r['worker_rss_mb'])} MB | "
+                              f"PSS {' '.join(f'{mb:.0f}' for mb in r['worker_pss_mb'])} MB")
+    finally:
+        fake.stop()
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Context size before and after MMR selection, adjacent-chunk merging and
+token-budget packing.
+
+Queries are corpus chunks with a little noise added, so
+every query has a known source chunk. For each query the top_k passages are
+formatted with format_context (the original prompt layout), or packed with
+pack_context as main.build_context does:
+
+    python -m benchmarks.context_bench --index index --queries 300
+    python -m benchmarks.context_bench --index index --candidates 20 --diversity 0.1 0.3 0.5
+    python -m benchmarks.context_bench --index index --budget 600 900 1200 --tokenizer sentence-transformers/all-MiniLM-L6-v2
+
+Tokens are counted with --tokenizer (a Hugging Face tokenizer name or path)
+or estimated at 4 characters per token. "source kept" counts the source
+chunk as kept only if it reached the context.
+"""
+import argparse
+
+import numpy as np
+
+from passages import TokenCounter, merge_adjacent, mmr_select, pack_context
+from retrieval import RetrievalEngine, normalize_rows
+
+
+def format_context(relevant_df):
+    """The original prompt layout: every chunk in full, with its video title, URL and timestamps."""
+    context_parts = []
+    for idx, row in relevant_df.iterrows():
+        context_parts.append(
+            f"Video: {row['video_title']}\n"
+            f"Video URL: {row['video_url']}\n"
+            f"Timestamp: [{row['start_time']:.2f} - {row['end_time']:.2f} minutes]\n"
+            f"Content: {row['text']}\n"
+        )
+    return "\n---\n".join(context_parts)
+
+
+def run(engine, queries, sources, top_k, candidates, diversity, merge, counter, budget=None):
+    tokens, passages, videos, kept = [], [], [], 0
+    for query, source in zip(queries, sources):
+        # Middle words of the source chunk; found in the context only if that part of it was sent
+        words = engine.rows([source])['text'].iloc[0].split()
+        probe = ' '.join(words[len(words) // 2 - 4:len(words) // 2 + 4])
+        if diversity > 0:
+            indices, scores = engine.search(query, max(top_k, candidates))
+            indices = indices[mmr_select(engine.vectors(indices), scores, top_k, diversity)]
+        else:
+            indices, _ = engine.search(query, top_k)
+        rows = engine.rows(indices)
+        if merge:
+            rows = merge_adjacent(rows)
+        if budget is None:
+            context = format_context(rows)
+        else:
+            context, rows, _ = pack_context(rows, budget, counter)
+        kept += int(any(probe in ' '.join(text.split()) for text in rows['text']))
+        tokens.append(counter.count(context))
+        passages.append(len(rows))
+        videos.append(rows['video_url'].nunique())
+    return {
+        'tokens': float(np.mean(tokens)),
+        'passages': float(np.mean(passages)),
+        'videos': float(np.mean(videos)),
+        'source_kept': kept / len(sources),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--index', default='index', help='index directory written by index_store')
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--top-k', type=int, default=7)
+    parser.add_argument('--candidates', type=int, default=20)
+    parser.add_argument('--diversity', type=float, nargs='+', default=[0.3])
+    parser.add_argument('--budget', type=int, nargs='*', default=[1200], help='context token budgets to pack into')
+    parser.add_argument('--tokenizer', default=None, help='Hugging Face tokenizer used to count tokens')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tokenizer = None
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    counter = TokenCounter(tokenizer)
+
+    engine = RetrievalEngine.from_index(args.index)
+    rng = np.random.default_rng(args.seed)
+    n = min(args.queries, len(engine))
+    sources = rng.choice(len(engine), n, replace=False)
+    vectors = engine.vectors(sources)
+    queries = normalize_rows(vectors + rng.standard_normal(vectors.shape).astype(np.float32) * 0.03)
+
+    def measure(diversity, merge, budget=None):
+        return run(engine, queries, sources, args.top_k, args.candidates, diversity, merge, counter, budget)
+
+    baseline = measure(0, merge=False)
+    rows = [('top-k (baseline)', baseline), ('top-k + merge', measure(0, merge=True))]
+    for diversity in args.diversity:
+        rows.append((f"mmr {diversity:g}", measure(diversity, False)))
+        rows.append((f"mmr {diversity:g} + merge", measure(diversity, True)))
+        for budget in args.budget:
+            rows.append((f"mmr {diversity:g} + pack {budget}", measure(diversity, True, budget)))
+
+    print(f"{len(engine):,} chunks | {n} queries | top_k {args.top_k} | {args.candidates} MMR candidates | "
+          f"tokens from {args.tokenizer or '4 characters per token'}\n")
+    for label, r in rows:
+        saved = 1 - r['tokens'] / baseline['tokens']
+        print(f"{label:>24} | {r['tokens']:7.0f} context tokens ({saved:6.1%} saved) | "
+              f"{r['passages']:4.1f} passages | {r['videos']:4.1f} videos | source kept {r['source_kept']:.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Throughput and latency of micro-batched question encodes versus one
+model.encode call per request, at several concurrency levels:
+
+    python -m benchmarks.encode_batch_bench --concurrency 1 4 16 64
+
+By default the real all-MiniLM-L6-v2 model is used. --synthetic replaces it
+with a cost model for machines without the model: a fixed per-call overhead
+plus a per-item cost, with calls serialized because a CPU forward pass
+already uses every core.
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from encode_batcher import EncodeBatcher
+
+QUESTIONS = [
+    "What is cancer?", "How do companies fool customers?", "Who is the oldest human?",
+    "Tell me about shrinkflation", "What is planned obsolescence?", "How can I sleep better?",
+    "Is sugar bad for health?", "What causes diabetes?", "How does smoking affect lungs?",
+]
+
+
+class SyntheticModel:
+    """Holds one "CPU" for overhead_ms + per_item_ms * len(texts); returns random vectors."""
+
+    def __init__(self, overhead_ms=8.0, per_item_ms=1.0, dim=384):
+        self.overhead = overhead_ms / 1000
+        self.per_item = per_item_ms / 1000
+        self.dim = dim
+        self._cpu = threading.Lock()
+
+    def encode(self, texts, show_progress_bar=False):
+        with self._cpu:
+            time.sleep(self.overhead + self.per_item * len(texts))
+        return np.random.default_rng().standard_normal((len(texts), self.dim)).astype(np.float32)
+
+
+def drive(encode_one, concurrency, requests_per_worker):
+    """Run concurrency closed-loop workers; return (qps, p50 ms, p99 ms)."""
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(worker_id):
+        local = []
+        for i in range(requests_per_worker):
+            text = QUESTIONS[(worker_id + i) % len(QUESTIONS)] + f" #{worker_id}-{i}"
+            t = time.perf_counter()
+            encode_one(text)
+            local.append((time.perf_counter() - t) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--requests', type=int, default=20, help='requests per worker')
+    parser.add_argument('--max-batch', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--synthetic', action='store_true')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        model = SyntheticModel()
+    else:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer('all-MiniLM-L6-v2')
+
+    batcher = EncodeBatcher(model, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    single = lambda text: model.encode([text], show_progress_bar=False)[0]
+
+    print(f"{'conc':>5} | {'per-request qps':>15} {'p50':>8} {'p99':>8} | {'batched qps':>11} {'p50':>8} {'p99':>8}")
+    for concurrency in args.concurrency:
+        a = drive(single, concurrency, args.requests)
+        b = drive(batcher.encode, concurrency, args.requests)
+        print(f"{concurrency:>5} | {a[0]:>15.1f} {a[1]:>6.1f}ms {a[2]:>6.1f}ms | "
+              f"{b[0]:>11.1f} {b[1]:>6.1f}ms {b[2]:>6.1f}ms")
+    print(f"\nmean batch size: {batcher.stats()['mean_batch_size']:.1f}")
+
+
+if __name__ == '__main__':
+    main()
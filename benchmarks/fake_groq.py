@@ -0,0 +1,201 @@
+"""
+Local stand-in for the Groq chat completions API.
+
+Speaks the OpenAI-compatible wire format used by the groq SDK, both plain and
+streaming (server-sent events), with configurable latency and failure
+injection. Point the app at it with GROQ_BASE_URL:
+
+    python -m benchmarks.fake_groq --port 8100 --first-token-ms 300 --token-ms 20
+    GROQ_BASE_URL=http://127.0.0.1:8100 GROQ_API_KEY=fake gunicorn main:app
+
+It can also be started in-process (e.g. from a load test):
+
+    server = FakeGroqServer(port=0, first_token_ms=100).start()
+    ... server.base_url ...
+    server.stop()
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ANSWER = (
+    "<strong>Video Title:</strong> Stub Answer<br>"
+    "<strong>Video URL:</strong> <a href=\"https://www.youtube.com/watch?v=stub\" target=\"_blank\">"
+    "https://www.youtube.com/watch?v=stub</a>"
+    "<p>This answer was produced by the local fake Groq server.</p>"
+    "<strong>Main Explanation:</strong><ul>"
+    "<li><strong>Point:</strong> Deterministic text used for testing and load generation "
+    "<a href=\"https://www.youtube.com/watch?v=stub&t=60s\" target=\"_blank\">[1.00 – 1.50 min]</a></li>"
+    "</ul><strong>Conclusion:</strong><p>Done.</p>"
+)
+
+
+class FakeGroqConfig:
+    """Behaviour knobs; may be changed while the server is running."""
+
+    def __init__(self, first_token_ms=200.0, token_ms=10.0, answer=DEFAULT_ANSWER,
+                 tokens_per_chunk=4, error_rate=0.0, error_status=429, retry_after=1):
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.answer = answer
+        self.tokens_per_chunk = tokens_per_chunk
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+
+
+class FakeGroqServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, **config):
+        self.config = FakeGroqConfig(**config)
+        self.requests = 0
+        self.streams = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        super().__init__((host, port), FakeGroqHandler)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-groq', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def split_tokens(text, tokens_per_chunk):
+    """Split text into word-ish pieces, tokens_per_chunk words per streamed chunk."""
+    words = text.split(' ')
+    pieces = [' '.join(words[i:i + tokens_per_chunk]) for i in range(0, len(words), tokens_per_chunk)]
+    return [p if i == 0 else ' ' + p for i, p in enumerate(pieces)]
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        config = server.config
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+            return
+
+        with server._lock:
+            server.requests += 1
+            fail = random.random() < config.error_rate
+            if fail:
+                server.errors += 1
+        if fail:
+            self._send_json(
+                config.error_status,
+                {'error': {'message': 'Injected failure from fake Groq', 'type': 'fake_error'}},
+                headers={'Retry-After': str(config.retry_after)},
+            )
+            return
+
+        time.sleep(config.first_token_ms / 1000.0)
+        model = request.get('model', 'fake-model')
+        prompt_chars = sum(len(m.get('content', '')) for m in request.get('messages', []))
+        usage = {
+            'prompt_tokens': prompt_chars // 4,
+            'completion_tokens': len(config.answer) // 4,
+            'total_tokens': prompt_chars // 4 + len(config.answer) // 4,
+        }
+        base = {'id': 'chatcmpl-fake', 'created': int(time.time()), 'model': model, 'system_fingerprint': 'fake'}
+
+        if not request.get('stream'):
+            self._send_json(200, {
+                **base,
+                'object': 'chat.completion',
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': config.answer},
+                    'finish_reason': 'stop',
+                    'logprobs': None,
+                }],
+                'usage': usage,
+            })
+            return
+
+        with server._lock:
+            server.streams += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            pieces = split_tokens(config.answer, config.tokens_per_chunk)
+            for i, piece in enumerate(pieces):
+                if i:
+                    time.sleep(config.token_ms / 1000.0)
+                chunk = {
+                    **base,
+                    'object': 'chat.completion.chunk',
+                    'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': piece},
+                                 'finish_reason': None, 'logprobs': None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+            final = {
+                **base,
+                'object': 'chat.completion.chunk',
+                'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop', 'logprobs': None}],
+                'x_groq': {'usage': usage},
+            }
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode('utf-8'))
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--first-token-ms', type=float, default=200)
+    parser.add_argument('--token-ms', type=float, default=10)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=429)
+    args = parser.parse_args()
+
+    server = FakeGroqServer(args.host, args.port, first_token_ms=args.first_token_ms,
+                            token_ms=args.token_ms, error_rate=args.error_rate,
+                            error_status=args.error_status)
+    print(f"Fake Groq listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+Local stand-in for YouTube's playlist, video and transcript lookups.
+
+Serves the JSON API harvester.HTTPSource speaks, with synthetic playlists,
+channels and transcripts (deterministic per video id), configurable
+latency and two kinds of 429 blocks:
+
+    - an IP block: more than --max-rps requests in one second blocks every
+      request for --block-seconds, like YouTube's "blocking requests from
+      your IP"
+    - random 429s at --block-rate
+
+Point the harvester at it with --source-url:
+
+    python -m benchmarks.fake_youtube --port 8300 --latency-ms 200 --max-rps 5
+    python harvester.py PLfake1 PLfake2 @fakechannel --source-url http://127.0.0.1:8300
+
+It can also be started in-process (e.g. from a benchmark):
+
+    server = FakeYouTubeServer(port=0, latency_ms=50).start()
+    ... server.base_url ...
+    server.stop()
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import urllib.parse
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("so today we are going to talk about sugar cancer sleep health the body heart brain "
+         "doctors research study people food exercise why this matters and what you can do").split()
+
+DEFAULT_PLAYLISTS = {'PLfake1': 20, 'PLfake2': 20}
+# The channel shares its first videos with PLfake1, as real channels and playlists do
+DEFAULT_CHANNELS = {'@fakechannel': 10}
+
+
+class FakeYouTubeConfig:
+    """Behaviour knobs; may be changed while the server is running."""
+
+    def __init__(self, latency_ms=100.0, jitter_ms=0.0, max_rps=0, block_seconds=5.0, block_rate=0.0,
+                 retry_after=True, no_transcript_rate=0.05, error_rate=0.0, minutes=(5, 20)):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.max_rps = max_rps
+        self.block_seconds = block_seconds
+        self.block_rate = block_rate
+        self.retry_after = retry_after
+        self.no_transcript_rate = no_transcript_rate
+        self.error_rate = error_rate
+        self.minutes = minutes
+
+
+def video_ids(name, count):
+    return [f"{name.lstrip('@')}-{i:03d}" for i in range(count)]
+
+
+class FakeYouTubeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, playlists=None, channels=None, **config):
+        self.config = FakeYouTubeConfig(**config)
+        self.playlists = {name: video_ids(name, n) for name, n in (playlists or DEFAULT_PLAYLISTS).items()}
+        first_playlist = next(iter(self.playlists.values()), [])
+        self.channels = {name: first_playlist[:n // 2] + video_ids(name, n - n // 2)
+                         for name, n in (channels or DEFAULT_CHANNELS).items()}
+        self.requests = 0
+        self.blocked = 0
+        self.errors = 0
+        self.transcripts = 0
+        self.blocked_until = 0.0
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self._thread = None
+        super().__init__((host, port), FakeYouTubeHandler)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-youtube', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def admit(self):
+        """None to serve the request, or the seconds the client is blocked for."""
+        config = self.config
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            if now < self.blocked_until:
+                self.blocked += 1
+                return self.blocked_until - now
+            if config.max_rps:
+                self._recent.append(now)
+                while self._recent[0] <= now - 1.0:
+                    self._recent.popleft()
+                if len(self._recent) > config.max_rps:
+                    self.blocked_until = now + config.block_seconds
+                    self._recent.clear()
+                    self.blocked += 1
+                    return config.block_seconds
+            if random.random() < config.block_rate:
+                self.blocked += 1
+                return 1.0
+        return None
+
+    def video(self, video_id):
+        """Title, duration and transcript of a video, the same on every request."""
+        rng = random.Random(video_id)
+        low, high = self.config.minutes
+        duration = rng.randint(int(low * 60), int(high * 60))
+        entries, start = [], 0.0
+        while start < duration:
+            length = round(rng.uniform(2.0, 6.0), 2)
+            entries.append({'text': ' '.join(rng.choices(WORDS, k=rng.randint(4, 14))),
+                            'start': round(start, 2), 'duration': length})
+            start += length
+        return {
+            'video_id': video_id,
+            'title': f"Fake video {video_id}",
+            'duration': duration,
+            'has_transcript': rng.random() >= self.config.no_transcript_rate,
+            'entries': entries,
+        }
+
+
+class FakeYouTubeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        config = server.config
+        path = urllib.parse.urlparse(self.path).path
+        parts = [urllib.parse.unquote(p) for p in path.strip('/').split('/')]
+        if len(parts) != 2 or parts[0] not in ('playlists', 'channels', 'videos', 'transcripts'):
+            self._send_json(404, {'error': f'Unknown path {path}'})
+            return
+        kind, name = parts
+
+        time.sleep(max(0.0, config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000.0)
+        blocked_for = server.admit()
+        if blocked_for is not None:
+            headers = {'Retry-After': str(math.ceil(blocked_for))} if config.retry_after else {}
+            self._send_json(429, {'error': 'blocking requests from your IP'}, headers=headers)
+            return
+        if random.random() < config.error_rate:
+            with server._lock:
+                server.errors += 1
+            self._send_json(500, {'error': 'Injected failure from fake YouTube'})
+            return
+
+        if kind in ('playlists', 'channels'):
+            listing = (server.playlists if kind == 'playlists' else server.channels).get(name)
+            if listing is None:
+                self._send_json(404, {'error': f'No {kind[:-1]} {name}'})
+                return
+            self._send_json(200, {'title': f"Fake {kind[:-1]} {name}", 'videos': [
+                {'video_id': v, 'url': f"https://www.youtube.com/watch?v={v}"} for v in listing]})
+            return
+        video = server.video(name)
+        if kind == 'videos':
+            self._send_json(200, {'title': video['title'], 'duration': video['duration']})
+            return
+        if not video['has_transcript']:
+            self._send_json(404, {'error': 'no English transcript'})
+            return
+        with server._lock:
+            server.transcripts += 1
+        self._send_json(200, {'language': 'en', 'entries': video['entries']})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8300)
+    parser.add_argument('--latency-ms', type=float, default=100)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--max-rps', type=float, default=0, help='requests per second that trigger an IP block (0: never)')
+    parser.add_argument('--block-seconds', type=float, default=5)
+    parser.add_argument('--block-rate', type=float, default=0.0, help='fraction of requests answered with a random 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 500')
+    args = parser.parse_args()
+
+    server = FakeYouTubeServer(args.host, args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                               max_rps=args.max_rps, block_seconds=args.block_seconds,
+                               block_rate=args.block_rate, error_rate=args.error_rate)
+    print(f"Fake YouTube listening on {server.base_url} "
+          f"(playlists {', '.join(server.playlists)}; channels {', '.join(server.channels)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Transcript harvesting against the local fake YouTube server.
+
+For each worker count, harvests the fake playlists and channel into a
+fresh directory and reports videos per second, how often the server
+blocked us and the limiter's rate at the end. The server blocks the IP
+when it sees more than --max-rps requests in a second, so a limiter set
+above that (--rate) shows the adaptive backoff at work:
+
+    python -m benchmarks.harvest_bench --workers 1 4 8 --latency-ms 200 --rate 600 --max-rps 5
+
+--resume interrupts each run after half the videos and runs it again from
+the saved state, checking that nothing is fetched twice or lost.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+
+from benchmarks.fake_youtube import FakeYouTubeServer
+from harvester import AdaptiveLimiter, Harvester, HTTPSource, JobState
+
+SOURCES = ['https://www.youtube.com/playlist?list=PLfake1', 'PLfake2', 'https://www.youtube.com/@fakechannel']
+
+
+def harvest(server, work, workers, rate, stop_after=None):
+    """One harvester run over SOURCES; stop_after interrupts it once that many videos are saved."""
+    state = JobState(os.path.join(work, 'harvest.sqlite3'))
+    limiter = AdaptiveLimiter(rate / 60, burst=workers, cooldown=2.0)
+    harvester = Harvester(HTTPSource(server.base_url), state, os.path.join(work, 'out'), limiter,
+                          workers=workers, max_blocks=50)
+    if stop_after is not None:
+        def interrupt():
+            while not harvester.stop.is_set() and harvester.results['done'] < stop_after:
+                harvester.stop.wait(0.01)
+            harvester.stop_reason = 'interrupted'
+            harvester.stop.set()
+        threading.Thread(target=interrupt, daemon=True).start()
+    try:
+        return harvester.run(SOURCES)
+    finally:
+        state.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--rate', type=float, default=600, help='limiter requests per minute')
+    parser.add_argument('--latency-ms', type=float, default=200)
+    parser.add_argument('--max-rps', type=float, default=5, help='server IP-blocks above this many requests/s')
+    parser.add_argument('--block-seconds', type=float, default=2)
+    parser.add_argument('--block-rate', type=float, default=0.0)
+    parser.add_argument('--videos', type=int, default=20, help='videos per fake playlist')
+    parser.add_argument('--resume', action='store_true', help='interrupt each run halfway and resume it')
+    args = parser.parse_args()
+
+    server = FakeYouTubeServer(playlists={'PLfake1': args.videos, 'PLfake2': args.videos},
+                               channels={'@fakechannel': args.videos // 2},
+                               latency_ms=args.latency_ms, max_rps=args.max_rps,
+                               block_seconds=args.block_seconds, block_rate=args.block_rate).start()
+    try:
+        for workers in args.workers:
+            work = tempfile.mkdtemp(prefix='harvest-bench-')
+            try:
+                requests_before, blocked_before = server.requests, server.blocked
+                runs = []
+                if args.resume:
+                    runs.append(harvest(server, work, workers, args.rate, stop_after=args.videos))
+                runs.append(harvest(server, work, workers, args.rate))
+                saved = len([f for f in os.listdir(os.path.join(work, 'out')) if f.endswith('.json')])
+                last = runs[-1]
+                seconds = sum(r['seconds'] for r in runs)
+                done = sum(r['done'] for r in runs)
+                print(f"workers={workers:>2} | {seconds:6.1f}s | {done / seconds:5.2f} videos/s | "
+                      f"saved {saved} (done {last['state']['done']}, no transcript {last['state']['no_transcript']}, "
+                      f"failed {last['state']['failed']}, left {last['remaining']}) | "
+                      f"blocks {sum(r['blocked'] for r in runs)} (server {server.blocked - blocked_before}) | "
+                      f"requests {server.requests - requests_before} | "
+                      f"final rate {last['final_rate_per_minute']:.0f}/min"
+                      + (f" | resumed after {runs[0]['done']}" if args.resume else ""))
+                if saved != last['state']['done']:
+                    print(f"  mismatch: {saved} files for {last['state']['done']} videos done")
+            finally:
+                shutil.rmtree(work, ignore_errors=True)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
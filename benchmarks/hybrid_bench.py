@@ -0,0 +1,152 @@
+"""
+Latency of the BM25 index and of hybrid (dense + BM25, RRF-fused) retrieval.
+
+Uses a synthetic Zipf-distributed corpus (the token distribution of real
+transcripts) or the texts of an existing index directory:
+
+    python -m benchmarks.hybrid_bench --size 1000000 --scan-budget 10000 50000 200000
+    python -m benchmarks.hybrid_bench --size 1000000 --dense ivf
+    python -m benchmarks.hybrid_bench --index index
+
+"full scan" adds up every posting list of the query (plain term-at-a-time
+BM25); the other rows use BM25Index.search with the given scan budget and
+must return the same top k.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.ann_bench import make_queries, synthetic_corpus
+from bm25_index import BM25Index, tokenize
+from index_store import ChunkTable
+from retrieval import RetrievalEngine, reciprocal_rank_fusion, top_k_indices
+
+
+def synthetic_tokens(size, vocab_size, doc_length, rng):
+    """Zipf-distributed term ids for size documents; returns (term_ids, doc_offsets, vocab)."""
+    lengths = np.maximum(1, rng.poisson(doc_length, size))
+    doc_offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(lengths, out=doc_offsets[1:])
+    term_ids = (rng.zipf(1.1, int(doc_offsets[-1])) - 1) % vocab_size
+    vocab = {f"t{i}": i for i in range(vocab_size)}
+    return term_ids.astype(np.int32), doc_offsets, vocab
+
+
+def synthetic_questions(term_ids, doc_offsets, n_queries, rng, common_terms=100):
+    """
+    Questions quoting a random document: 1-3 of its content words plus 1-3
+    function words, like "what is the <name> <number> ..." in real questions.
+
+    Zipf term ids below common_terms play the role of function words.
+    """
+    questions = []
+    for d in rng.integers(0, len(doc_offsets) - 1, n_queries):
+        words = term_ids[doc_offsets[d]:doc_offsets[d + 1]]
+        content = words[words >= common_terms]
+        if not len(content):
+            content = words
+        picks = list(rng.choice(content, min(len(content), int(rng.integers(1, 4))), replace=False))
+        picks += list(rng.integers(0, common_terms, int(rng.integers(1, 4))))
+        questions.append(' '.join(f"t{t}" for t in picks))
+    return questions
+
+
+def full_scan(bm25, query_text, top_k):
+    """Reference BM25: add up every posting list of the query terms."""
+    scores = np.zeros(bm25.count, dtype=np.float32)
+    for t in {bm25.vocab[w] for w in tokenize(query_text) if w in bm25.vocab}:
+        start, end = bm25.offsets[t], bm25.offsets[t + 1]
+        scores[bm25.docs[start:end]] += bm25.weights[start:end]
+    return top_k_indices(scores, top_k)
+
+
+def percentiles(times):
+    return f"p50 {np.percentile(times, 50):7.3f} ms | p99 {np.percentile(times, 99):7.3f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--index', default=None, help='use the chunk texts of this index directory')
+    parser.add_argument('--size', type=int, default=1_000_000)
+    parser.add_argument('--vocab', type=int, default=200_000)
+    parser.add_argument('--doc-length', type=int, default=90, help='average tokens per chunk')
+    parser.add_argument('--scan-budget', type=int, nargs='+', default=[10000, 50000, 200000])
+    parser.add_argument('--candidates', type=int, default=50, help='per-retriever list length fused by RRF')
+    parser.add_argument('--dense', choices=['none', 'exact', 'ivf'], default='none',
+                        help='also time the full hybrid path with this dense backend')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--top-k', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    start = time.perf_counter()
+    if args.index:
+        table = ChunkTable(args.index)
+        texts = [table.text(i) for i in range(len(table))]
+        bm25 = BM25Index.build(texts)
+        questions = []
+        for i in rng.integers(0, len(texts), args.queries):
+            words = tokenize(texts[i])
+            questions.append(' '.join(rng.choice(words, min(len(words), 5), replace=False)))
+    else:
+        term_ids, doc_offsets, vocab = synthetic_tokens(args.size, args.vocab, args.doc_length, rng)
+        bm25 = BM25Index.build_from_ids(term_ids, doc_offsets, vocab)
+        questions = synthetic_questions(term_ids, doc_offsets, args.queries, rng)
+        del term_ids
+    size_mb = (bm25.docs.nbytes + bm25.weights.nbytes + bm25.offsets.nbytes) / 1e6
+    print(f"{bm25.count:,} chunks | {len(bm25.vocab):,} terms | {bm25.n_postings:,} postings | "
+          f"{size_mb:.1f} MB | build {time.perf_counter() - start:.1f} s\n")
+
+    truth, times = [], []
+    for q in questions:
+        t = time.perf_counter()
+        truth.append(full_scan(bm25, q, args.candidates)[:args.top_k].tolist())
+        times.append((time.perf_counter() - t) * 1000)
+    print(f"{'bm25 full scan':>28} | {'':>14} | {percentiles(times)}")
+    for scan_budget in args.scan_budget:
+        bm25.scan_budget = scan_budget
+        same, times = 0, []
+        for q, expected in zip(questions, truth):
+            t = time.perf_counter()
+            ids, _ = bm25.search(q, args.candidates)
+            times.append((time.perf_counter() - t) * 1000)
+            same += len(set(expected) & set(ids[:args.top_k].tolist()))
+        print(f"{'bm25 scan_budget=' + str(scan_budget):>28} | agree@{args.top_k} {same / max(1, sum(map(len, truth))):.3f} | "
+              f"{percentiles(times)}")
+
+    # Fusion cost on its own: two candidate lists of the configured length
+    times = []
+    for q in questions:
+        lexical, _ = bm25.search(q, args.candidates)
+        dense = rng.choice(bm25.count, args.candidates, replace=False)
+        t = time.perf_counter()
+        reciprocal_rank_fusion([dense, lexical], args.top_k)
+        times.append((time.perf_counter() - t) * 1000)
+    print(f"{'rrf fusion':>28} | {'':>14} | {percentiles(times)}")
+
+    if args.dense != 'none':
+        bm25.scan_budget = args.scan_budget[0]
+        if args.index:
+            matrix = np.load(f"{args.index}/vectors.npy")
+        else:
+            matrix = synthetic_corpus(bm25.count, max(1, bm25.count // 500), rng)
+        ann = None
+        if args.dense == 'ivf':
+            from ivf_index import IVFIndex
+            ann = IVFIndex.build(matrix)
+        engine = RetrievalEngine(None, matrix, normalized=True, ann=ann, lexical=bm25,
+                                 fusion_candidates=args.candidates)
+        embeddings = make_queries(matrix, len(questions), rng)
+        for label, query_text in (('dense only', False), ('hybrid', True)):
+            times = []
+            for q, embedding in zip(questions, embeddings):
+                t = time.perf_counter()
+                engine.search(embedding, args.top_k, query_text=q if query_text else None)
+                times.append((time.perf_counter() - t) * 1000)
+            print(f"{args.dense + ' ' + label:>28} | {'':>14} | {percentiles(times)}")
+
+
+if __name__ == '__main__':
+    main()
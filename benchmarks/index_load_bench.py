@@ -0,0 +1,59 @@
+"""
+Compare cold load time and resident memory of embeddings.joblib against the
+memory-mapped index directory.
+
+Each format is loaded in a fresh subprocess so the numbers are independent:
+
+    python -m benchmarks.index_load_bench --joblib embeddings.joblib --index index
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+LOADER = r'''
+import json, resource, sys, time
+start = time.perf_counter()
+from retrieval import RetrievalEngine
+import numpy as np
+kind, path = sys.argv[1], sys.argv[2]
+engine = RetrievalEngine.from_joblib(path) if kind == 'joblib' else RetrievalEngine.from_index(path)
+loaded = time.perf_counter()
+engine.search(np.ones(engine.matrix.shape[1], dtype=np.float32), 7)
+queried = time.perf_counter()
+with open('/proc/self/status') as f:
+    status = dict(line.split(':', 1) for line in f)
+def kb(key):
+    return int(status.get(key, '0 kB').split()[0])
+print(json.dumps({
+    'load_s': loaded - start,
+    'first_query_ms': (queried - loaded) * 1000,
+    'rss_mb': kb('VmRSS') / 1024,
+    'rss_private_mb': (kb('RssAnon')) / 1024,
+    'rss_shared_file_mb': kb('RssFile') / 1024,
+    'chunks': len(engine),
+}))
+'''
+
+
+def measure(kind, path):
+    out = subprocess.run([sys.executable, '-c', LOADER, kind, path],
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--joblib', default='embeddings.joblib')
+    parser.add_argument('--index', default='index')
+    args = parser.parse_args()
+
+    for kind, path in (('joblib', args.joblib), ('index', args.index)):
+        r = measure(kind, path)
+        print(f"{kind:>6}: {r['chunks']:,} chunks | load {r['load_s']:.3f} s | "
+              f"first query {r['first_query_ms']:.2f} ms | RSS {r['rss_mb']:.1f} MB "
+              f"(private {r['rss_private_mb']:.1f} MB, file-backed/shared {r['rss_shared_file_mb']:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Bulk ingestion: throughput and peak memory of read_chunks.ingest by corpus size.
+
+Writes synthetic transcript files (random words, 30-second chunks) and runs
+a full ingestion of each size in a fresh process, so peak RSS is measured
+per run. The peak heap (anonymous memory) of the embedding stage should
+stay flat as the corpus grows; the overall peak also holds the IVF,
+quantized and BM25 arrays, and RSS counts the memory-mapped index files,
+which both grow with it:
+
+    python -m benchmarks.ingest_bench --chunks 10000 100000 1000000 --synthetic
+    python -m benchmarks.ingest_bench --chunks 20000 --processes 1 2 4
+
+--synthetic replaces the model with a cost model (see encode_batch_bench)
+so size and memory can be measured on machines without the model; it only
+supports one process. Without it the real all-MiniLM-L6-v2 is used.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from benchmarks.encode_batch_bench import SyntheticModel
+
+CHUNKS_PER_VIDEO = 60
+WORDS = ("health cancer sugar sleep price company customer market oxygen water heart brain study doctor "
+         "india government money people minute problem research result body food exercise").split()
+
+
+class SyntheticEncoder(SyntheticModel):
+    """SyntheticModel with the SentenceTransformer methods ingest uses."""
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, batch_size=64, show_progress_bar=False):
+        return super().encode(texts)
+
+
+def write_corpus(directory, chunks, seed=0):
+    """Synthetic transcript JSON files holding `chunks` chunks in total."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    for video in range((chunks + CHUNKS_PER_VIDEO - 1) // CHUNKS_PER_VIDEO):
+        n = min(CHUNKS_PER_VIDEO, chunks - video * CHUNKS_PER_VIDEO)
+        content = {
+            'video_id': f"v{video:07d}",
+            'video_title': f"Synthetic video {video}",
+            'video_url': f"https://www.youtube.com/watch?v=v{video:07d}",
+            'duration_minutes': n / 2,
+            'chunks': [{'chunk_id': i + 1, 'start_time': i / 2, 'end_time': (i + 1) / 2,
+                        'text': ' '.join(rng.choice(WORDS, 70))} for i in range(n)],
+        }
+        with open(os.path.join(directory, f"{video:07d}.json"), 'w', encoding='utf-8') as f:
+            json.dump(content, f)
+
+
+def run_ingest(source, index, processes, batch_size, synthetic, per_item_ms, results):
+    import read_chunks
+    if synthetic:
+        read_chunks._model = SyntheticEncoder(overhead_ms=1.0, per_item_ms=per_item_ms)
+    results.put(read_chunks.ingest(source, index, full=True, processes=processes, batch_size=batch_size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--processes', type=int, nargs='+', default=[1])
+    parser.add_argument('--batch-size', type=int, default=4096)
+    parser.add_argument('--synthetic', action='store_true', help='use a cost model instead of the real encoder')
+    parser.add_argument('--per-item-ms', type=float, default=0.02, help='synthetic encode cost per chunk')
+    args = parser.parse_args()
+    if args.synthetic and args.processes != [1]:
+        parser.error('--synthetic supports only --processes 1')
+
+    context = multiprocessing.get_context('fork')
+    for chunks in args.chunks:
+        work = tempfile.mkdtemp(prefix='ingest-bench-')
+        try:
+            write_corpus(os.path.join(work, 'src'), chunks)
+            for processes in args.processes:
+                results = context.Queue()
+                proc = context.Process(target=run_ingest, args=(
+                    os.path.join(work, 'src'), os.path.join(work, f'index-{processes}'), processes,
+                    args.batch_size, args.synthetic, args.per_item_ms, results))
+                proc.start()
+                summary = results.get()
+                proc.join()
+                print(f"{chunks:>9} chunks  p={processes} | {summary['seconds']:7.1f}s | "
+                      f"{summary['chunks_per_second']:8.0f} chunks/s | "
+                      f"{summary['chunks_per_second_per_core']:7.0f} /s/core | "
+                      f"peak heap {summary['embed_peak_heap_mb']:.0f} MB embedding, "
+                      f"{summary['peak_heap_mb']:.0f} MB overall | "
+                      f"peak RSS {summary['peak_rss_mb']:.0f} MB (pool {summary['peak_child_rss_mb']:.0f} MB)")
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
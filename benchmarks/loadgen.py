@@ -0,0 +1,385 @@
+"""
+Load test: what a deployment sustains, by gunicorn worker class and count.
+
+Starts a local fake Groq server (configurable latency and streaming), then
+launches the app once per worker class and worker count with GROQ_BASE_URL
+pointing at it. Each launch is driven with either closed-loop clients
+(--concurrency) or open-loop Poisson arrivals (--rate, in requests per
+second):
+
+    python -m benchmarks.loadgen --modes sync async --concurrency 8 64 256 --llm-ms 1500
+    python -m benchmarks.loadgen --modes sync gthread async --workers 1 2 4 --rate 5 20 50
+    python -m benchmarks.loadgen --modes async --endpoint stream --llm-ms 300 --token-ms 20 --chat-ratio 0.3
+
+Worker classes:
+
+    sync     gunicorn sync workers running main:app
+    gthread  gunicorn threaded workers (--threads) running main:app
+    async    gunicorn with uvicorn workers running asgi_app:app
+
+--chat-ratio sends that share of the requests to the chat history API
+instead of /query. Each request appends a message, and every fourth also
+pages the chat list and the chat's messages. The clients log in as
+synthetic users with a session cookie signed by the server's
+FLASK_SECRET_KEY.
+
+Every level reports throughput, latency percentiles (open-loop latency is
+measured from the scheduled arrival, so a backed-up server is not hidden),
+error rates per endpoint, and the peak RSS of every gunicorn worker. The
+answer cache and the Groq rate limits are disabled so that every /query
+reaches the LLM.
+"""
+import argparse
+import base64
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.fake_groq import FakeGroqServer
+
+QUESTIONS = [
+    "What is cancer?", "How do companies fool customers?", "Who is the oldest human?",
+    "Tell me about shrinkflation", "What is planned obsolescence?", "How can I sleep better?",
+]
+
+SERVER_MODES = {
+    'sync': ['gunicorn', '-w', '{workers}', '-b', '127.0.0.1:{port}', 'main:app'],
+    'gthread': ['gunicorn', '-k', 'gthread', '--threads', '{threads}', '-w', '{workers}',
+                '-b', '127.0.0.1:{port}', 'main:app'],
+    'async': ['gunicorn', '-k', 'uvicorn.workers.UvicornWorker', '-w', '{workers}',
+              '-b', '127.0.0.1:{port}', 'asgi_app:app'],
+}
+
+SECRET_KEY = 'loadgen-secret'
+USERS = 64
+
+
+def session_cookie(mode, user):
+    """A signed session cookie logging the client in as user, for main:app or asgi_app:app."""
+    if mode == 'async':
+        # starlette.middleware.sessions: base64 JSON signed with a TimestampSigner
+        from itsdangerous import TimestampSigner
+        data = base64.b64encode(json.dumps({'user': user}).encode('utf-8'))
+        return 'session=' + TimestampSigner(SECRET_KEY).sign(data).decode('utf-8')
+    from flask import Flask
+    from flask.sessions import SecureCookieSessionInterface
+    app = Flask(__name__)
+    app.secret_key = SECRET_KEY
+    return 'session=' + SecureCookieSessionInterface().get_signing_serializer(app).dumps({'user': user})
+
+
+def start_server(mode, port, workers, threads, groq_url, data_dir):
+    cmd = [part.format(port=port, workers=workers, threads=threads) for part in SERVER_MODES[mode]]
+    env = {**os.environ, 'GROQ_BASE_URL': groq_url, 'GROQ_API_KEY': os.getenv('GROQ_API_KEY', 'fake'),
+           # Every request must reach the LLM so the comparison measures serving, not caches
+           'ANSWER_CACHE_SIZE': '0',
+           # The fake Groq server has no quota; the gateway's limits would only reject load
+           'LLM_REQUESTS_PER_MINUTE': '0', 'LLM_TOKENS_PER_MINUTE': '0',
+           'FLASK_SECRET_KEY': SECRET_KEY,
+           'CHAT_DB': os.path.join(data_dir, 'chats.sqlite3'),
+           'SINGLE_FLIGHT_DB': os.path.join(data_dir, 'single-flight.sqlite3'),
+           'SLOW_REQUEST_SECONDS': '1e9'}
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.time() + 300
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{mode} server exited: {proc.stderr.read().decode()[-2000:]}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/readyz')
+            if conn.getresponse().status == 200:
+                return proc
+        except OSError:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError(f"{mode} server did not become ready")
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=20)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# Memory
+
+def rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def child_pids(pid):
+    """Direct children of pid (the gunicorn workers), from /proc."""
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children += [int(c) for c in f.read().split()]
+    except OSError:
+        pass
+    return children
+
+
+class RSSSampler:
+    """Peak RSS of the gunicorn master and each worker, sampled in the background (Linux /proc)."""
+
+    def __init__(self, master_pid, interval=0.5):
+        self.master_pid = master_pid
+        self.interval = interval
+        self.peaks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def sample(self):
+        for pid in [self.master_pid] + child_pids(self.master_pid):
+            kb = rss_kb(pid)
+            if kb is not None:
+                self.peaks[pid] = max(self.peaks.get(pid, 0), kb)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def summary(self):
+        workers = [kb / 1024 for pid, kb in sorted(self.peaks.items()) if pid != self.master_pid]
+        master = self.peaks.get(self.master_pid)
+        return {
+            'master_rss_mb': round(master / 1024, 1) if master else None,
+            'worker_rss_mb': [round(mb, 1) for mb in workers],
+            'total_rss_mb': round(sum(self.peaks.values()) / 1024, 1) if self.peaks else None,
+        }
+
+
+# Requests
+
+def request(port, method, path, body, timeout, cookie=None):
+    """Return (status, ms to the first body byte); the whole body is read."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    headers = {'Content-Type': 'application/json'}
+    if cookie:
+        headers['Cookie'] = cookie
+    try:
+        start = time.perf_counter()
+        conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        response = conn.getresponse()
+        response.read(1)
+        first = (time.perf_counter() - start) * 1000
+        response.read()
+        return response.status, first
+    finally:
+        conn.close()
+
+
+class Workload:
+    """Picks and sends one request: /query (or /query/stream) or a chat history call."""
+
+    def __init__(self, port, mode, endpoint, chat_ratio, timeout, seed=0):
+        self.port = port
+        self.endpoint = endpoint
+        self.chat_ratio = chat_ratio
+        self.timeout = timeout
+        self.cookies = []
+        if chat_ratio > 0:
+            self.cookies = [session_cookie(mode, {'email': f"loadgen-{u}@example.com", 'name': f"Load {u}"})
+                            for u in range(USERS)]
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, client, i):
+        with self._lock:
+            chat = self._random.random() < self.chat_ratio
+        if chat:
+            return self.chat_request(client, i)
+        question = f"{QUESTIONS[(client + i) % len(QUESTIONS)]} ({client}-{i})"
+        path = '/query/stream' if self.endpoint == 'stream' else '/query'
+        status, first = request(self.port, 'POST', path, {'question': question}, self.timeout)
+        return 'query', status, first
+
+    def chat_request(self, client, i):
+        cookie = self.cookies[client % USERS]
+        chat_id = f"c{client}"
+        status, first = request(self.port, 'POST', f"/chats/{chat_id}/messages",
+                                {'role': 'user', 'message': f"message {i} " + 'x' * 200}, self.timeout, cookie)
+        if i % 4 == 0 and status == 200:
+            status, _ = request(self.port, 'GET', '/chats?limit=50', None, self.timeout, cookie)
+            if status == 200:
+                status, _ = request(self.port, 'GET', f"/chats/{chat_id}/messages?limit=100", None,
+                                    self.timeout, cookie)
+        return 'chats', status, first
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}  # kind -> [(latency ms, first byte ms, status)]
+        self._lock = threading.Lock()
+
+    def add(self, kind, latency, first, status):
+        with self._lock:
+            self.samples.setdefault(kind, []).append((latency, first, status))
+
+    def summary(self, wall):
+        result = {}
+        for kind, samples in sorted(self.samples.items()):
+            latencies = np.array([s[0] for s in samples])
+            firsts = np.array([s[1] for s in samples if s[1] is not None])
+            statuses = {}
+            for s in samples:
+                statuses[str(s[2])] = statuses.get(str(s[2]), 0) + 1
+            ok = statuses.get('200', 0)
+            result[kind] = {
+                'requests': len(samples),
+                'throughput_rps': ok / wall,
+                'error_rate': 1 - ok / len(samples),
+                'p50_ms': float(np.percentile(latencies, 50)),
+                'p95_ms': float(np.percentile(latencies, 95)),
+                'p99_ms': float(np.percentile(latencies, 99)),
+                'first_byte_p50_ms': float(np.percentile(firsts, 50)) if len(firsts) else None,
+                'statuses': statuses,
+            }
+        return result
+
+
+def send(workload, recorder, client, i, scheduled):
+    """Send one request; latency counts from scheduled (its arrival time)."""
+    try:
+        kind, status, first = workload(client, i)
+    except Exception as e:
+        kind, status, first = 'error', type(e).__name__, None
+    recorder.add(kind, (time.perf_counter() - scheduled) * 1000, first, status)
+
+
+def drive_closed(workload, concurrency, duration):
+    """Closed-loop clients for `duration` seconds; returns (recorder, wall seconds)."""
+    recorder = Recorder()
+    stop_at = time.perf_counter() + duration
+
+    def client(worker_id):
+        i = 0
+        while time.perf_counter() < stop_at:
+            send(workload, recorder, worker_id, i, time.perf_counter())
+            i += 1
+
+    threads = [threading.Thread(target=client, args=(w,), daemon=True) for w in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return recorder, time.perf_counter() - start
+
+
+def drive_open(workload, rate, duration, max_in_flight, seed=0):
+    """Poisson arrivals at `rate` per second for `duration` seconds; returns (recorder, wall seconds)."""
+    recorder = Recorder()
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        scheduled, i = start, 0
+        while True:
+            scheduled += rng.exponential(1.0 / rate)
+            if scheduled - start >= duration:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, workload, recorder, i, i, scheduled)
+            i += 1
+    return recorder, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=sorted(SERVER_MODES), default=['sync', 'async'])
+    parser.add_argument('--workers', type=int, nargs='+', default=[2])
+    parser.add_argument('--threads', type=int, default=8, help='threads per gthread worker')
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument('--concurrency', type=int, nargs='+', default=None, help='closed-loop clients per level')
+    load.add_argument('--rate', type=float, nargs='+', default=None, help='open-loop arrivals per second per level')
+    parser.add_argument('--max-in-flight', type=int, default=1024, help='open-loop cap on outstanding requests')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per level')
+    parser.add_argument('--endpoint', choices=['query', 'stream'], default='query')
+    parser.add_argument('--chat-ratio', type=float, default=0.0, help='share of requests sent to /chats')
+    parser.add_argument('--llm-ms', type=float, default=1500, help='fake Groq latency to the first token')
+    parser.add_argument('--token-ms', type=float, default=0.0, help='fake Groq delay between streamed chunks')
+    parser.add_argument('--tokens-per-chunk', type=int, default=4)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help='fraction of fake Groq calls failing')
+    parser.add_argument('--llm-error-status', type=int, default=429)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--port', type=int, default=8091)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+    levels = [('rate', r) for r in args.rate] if args.rate else [('concurrency', c) for c in (args.concurrency or [8, 64, 256])]
+
+    fake = FakeGroqServer(first_token_ms=args.llm_ms, token_ms=args.token_ms,
+                          tokens_per_chunk=args.tokens_per_chunk, error_rate=args.llm_error_rate,
+                          error_status=args.llm_error_status).start()
+    results = []
+    try:
+        for mode in args.modes:
+            for workers in args.workers:
+                data_dir = tempfile.mkdtemp(prefix='loadgen-')
+                proc = start_server(mode, args.port, workers, args.threads, fake.base_url, data_dir)
+                try:
+                    workload = Workload(args.port, mode, args.endpoint, args.chat_ratio, args.timeout)
+                    for kind, level in levels:
+                        with RSSSampler(proc.pid) as rss:
+                            if kind == 'rate':
+                                recorder, wall = drive_open(workload, level, args.duration, args.max_in_flight)
+                            else:
+                                recorder, wall = drive_closed(workload, level, args.duration)
+                        r = {'mode': mode, 'workers': workers, 'threads': args.threads if mode == 'gthread' else None,
+                             kind: level, 'endpoints': recorder.summary(wall), **rss.summary()}
+                        results.append(r)
+                        if not args.json:
+                            report(r, kind, level)
+                finally:
+                    stop_server(proc)
+                    shutil.rmtree(data_dir, ignore_errors=True)
+    finally:
+        fake.stop()
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+def report(r, kind, level):
+    label = f"{r['mode']:>7} w={r['workers']}" + (f" t={r['threads']}" if r['threads'] else '')
+    level = f"c={level:<4}" if kind == 'concurrency' else f"rate={level:<6g}"
+    workers = ' '.join(f"{mb:.0f}" for mb in r['worker_rss_mb']) or '?'
+    for endpoint, e in r['endpoints'].items():
+        print(f"{label:>16} {level} {endpoint:>6} | {e['throughput_rps']:7.1f} req/s | "
+              f"p50 {e['p50_ms']:8.0f} ms | p99 {e['p99_ms']:8.0f} ms | errors {e['error_rate']:6.1%} | "
+              f"worker RSS {workers} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Memory footprint and recall@k of int8 / binary codes with float32 rescoring,
+compared to the float32 path and to the float64 Python lists that
+embeddings.joblib keeps in memory:
+
+    python -m benchmarks.quantization_bench --size 100000 --shortlist 20 50 100 200
+    python -m benchmarks.quantization_bench --index index
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.ann_bench import make_queries, synthetic_corpus
+from quantized_index import QuantizedIndex
+from retrieval import top_k_indices
+
+# A Python float is 24 bytes plus an 8-byte list slot; the list header is ~56 bytes
+PYTHON_LIST_BYTES_PER_FLOAT = 32
+PYTHON_LIST_OVERHEAD = 56
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--index', default=None, help='use vectors.npy from this index directory')
+    parser.add_argument('--size', type=int, default=100_000)
+    parser.add_argument('--topics', type=int, default=2_000)
+    parser.add_argument('--shortlist', type=int, nargs='+', default=[20, 50, 100, 200])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.index:
+        matrix = np.load(f"{args.index}/vectors.npy")
+    else:
+        matrix = synthetic_corpus(args.size, args.topics, rng)
+    queries = make_queries(matrix, min(args.queries, matrix.shape[0]), rng)
+    n, dim = matrix.shape
+
+    list_mb = n * (dim * PYTHON_LIST_BYTES_PER_FLOAT + PYTHON_LIST_OVERHEAD) / 1e6
+    print(f"{n:,} vectors x {dim} dims")
+    print(f"{'python lists (joblib)':>22}: {list_mb:9.1f} MB")
+    print(f"{'float32 matrix':>22}: {matrix.nbytes / 1e6:9.1f} MB")
+
+    truth = [set(top_k_indices(matrix @ q, args.top_k).tolist()) for q in queries]
+
+    for kind in ('int8', 'binary'):
+        index = QuantizedIndex.build(matrix, kind=kind)
+        print(f"\n{kind + ' codes':>22}: {index.nbytes / 1e6:9.1f} MB "
+              f"({matrix.nbytes / index.nbytes:.1f}x smaller than float32)")
+        for shortlist in args.shortlist:
+            hits, times = 0, []
+            for q, expected in zip(queries, truth):
+                t = time.perf_counter()
+                ids, _ = index.search(matrix, q, args.top_k, shortlist)
+                times.append((time.perf_counter() - t) * 1000)
+                hits += len(expected & set(ids.tolist()))
+            print(f"{'shortlist=' + str(shortlist):>22}: recall@{args.top_k} {hits / (len(queries) * args.top_k):.3f} | "
+                  f"p50 {np.percentile(times, 50):7.3f} ms | p99 {np.percentile(times, 99):7.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
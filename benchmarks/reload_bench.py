@@ -0,0 +1,161 @@
+"""
+Index hot reload under query load.
+
+Serves a synthetic index through index_reload.IndexReloader (polling the
+index symlink, as main.py does) while --threads threads search and fetch
+rows non-stop, and publishes --generations new index generations, one every
+--every seconds, the way read_chunks.py does. Every chunk text names its
+generation, so a query whose rows come from another generation than the
+snapshot it searched shows up as "mixed".
+
+Reports query latency away from and around the swaps (from publish to one
+second after the new version served its first query), failed and mixed
+queries, how long each new version took to go live after it was published
+(about one to two poll intervals plus the load) and whether the old engines
+were freed:
+
+    python -m benchmarks.reload_bench --size 100000 --generations 3 --threads 4
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from index_reload import IndexReloader
+from index_store import publish_index, write_index
+from retrieval import RetrievalEngine
+
+
+def build(directory, size, dim, generation):
+    df = pd.DataFrame({
+        'video_id': [f"video-{i // 60}" for i in range(size)],
+        'video_title': [f"Video {i // 60}" for i in range(size)],
+        'video_url': [f"https://www.youtube.com/watch?v=video-{i // 60}" for i in range(size)],
+        'duration_minutes': 30.0,
+        'chunk_id': np.arange(size) % 60,
+        'start_time': (np.arange(size) % 60) * 0.5,
+        'end_time': (np.arange(size) % 60) * 0.5 + 0.5,
+        'text': [f"gen{generation} chunk {i}" for i in range(size)],
+    })
+    vectors = np.random.default_rng(generation).standard_normal((size, dim)).astype(np.float32)
+    write_index(df, directory, vectors)
+
+
+def heap_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('RssAnon:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def percentiles(times):
+    if not len(times):
+        return "no queries"
+    return (f"p50 {np.percentile(times, 50):7.3f} ms | p99 {np.percentile(times, 99):7.3f} ms | "
+            f"max {np.max(times):7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=100_000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--generations', type=int, default=3, help='new generations published during the run')
+    parser.add_argument('--every', type=float, default=3.0, help='seconds between publishes')
+    parser.add_argument('--poll', type=float, default=0.5, help='reloader poll interval (INDEX_RELOAD_SECONDS)')
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='reload-bench-')
+    index = os.path.join(work, 'index')
+    try:
+        # Built up front, so only the swaps (not the writes) overlap the queries
+        print(f"Building {args.generations + 1} generations of {args.size} chunks...")
+        builds = []
+        for generation in range(args.generations + 1):
+            builds.append(os.path.join(work, f"build-{generation}"))
+            build(builds[-1], args.size, args.dim, generation)
+
+        def publish(generation):
+            path = f"{index}.gen-{time.time_ns()}"
+            os.replace(builds[generation], path)
+            publish_index(path, index)
+
+        publish(0)
+        query = np.random.default_rng(args.generations + 1).standard_normal(args.dim).astype(np.float32)
+        reloader = IndexReloader(RetrievalEngine.from_index, lambda: os.path.realpath(index),
+                                 warm_up=lambda engine: engine.search(query, 7), interval=args.poll)
+        reloader.load()
+        reloader.watch()
+        heap_before = heap_mb()
+
+        stop = threading.Event()
+        samples = []  # (finished at, ms, generation served)
+        failures, mixed = [], []
+
+        def client(seed):
+            rng = np.random.default_rng(seed)
+            while not stop.is_set():
+                q = rng.standard_normal(args.dim).astype(np.float32)
+                start = time.perf_counter()
+                try:
+                    loaded = reloader.current
+                    indices, _ = loaded.engine.search(q, 7)
+                    rows = loaded.engine.rows(indices)
+                except Exception as e:
+                    failures.append(f"{type(e).__name__}: {e}")
+                    continue
+                finished = time.perf_counter()
+                generations = {text.split()[0] for text in rows['text']}
+                if len(generations) != 1:
+                    mixed.append(generations)
+                samples.append((finished, (finished - start) * 1000, int(next(iter(generations))[3:])))
+
+        threads = [threading.Thread(target=client, args=(seed,)) for seed in range(args.threads)]
+        for t in threads:
+            t.start()
+        published = {}
+        for generation in range(1, args.generations + 1):
+            time.sleep(args.every)
+            published[generation] = time.perf_counter()
+            publish(generation)
+        time.sleep(args.every)
+        stop.set()
+        for t in threads:
+            t.join()
+
+        first_served = {}
+        for finished, _, generation in samples:
+            first_served.setdefault(generation, finished)
+        windows = [(published[g], first_served.get(g, published[g]) + 1.0) for g in published]
+        around = np.array([ms for finished, ms, _ in samples
+                           if any(start <= finished <= end for start, end in windows)])
+        away = np.array([ms for finished, ms, _ in samples
+                         if not any(start <= finished <= end for start, end in windows)])
+        print(f"{len(samples)} queries on {args.threads} threads, {len(failures)} failed, {len(mixed)} mixed generations")
+        print(f"  away from swaps   {len(away):>7} | {percentiles(away)}")
+        print(f"  around swaps      {len(around):>7} | {percentiles(around)}")
+        for generation in sorted(published):
+            if generation not in first_served:
+                print(f"  generation {generation}: never served")
+                continue
+            served = sum(1 for _, _, g in samples if g == generation)
+            print(f"  generation {generation}: live {first_served[generation] - published[generation]:.2f}s "
+                  f"after publish, {served} queries")
+        stats = reloader.stats()
+        print(f"  reloads {stats['reloads']}, failures {stats['failures']}, "
+              f"last load+warm-up {stats['last_reload_seconds']}s, old engines still referenced "
+              f"{stats['retired_in_use']}, heap {heap_before:.0f} -> {heap_mb():.0f} MB")
+        for failure in failures[:5]:
+            print(f"  failed: {failure}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
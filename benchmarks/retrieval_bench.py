@@ -0,0 +1,83 @@
+"""
+Microbenchmark: legacy per-request retrieval vs RetrievalEngine.
+
+The legacy path is what process_question used to do on every call:
+np.vstack over the DataFrame column, sklearn cosine_similarity and a full
+argsort. Run with:
+
+    python -m benchmarks.retrieval_bench --sizes 10000 100000 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics.pairwise import cosine_similarity
+
+from retrieval import FrameTable, RetrievalEngine
+
+DIM = 384
+
+
+def legacy_search(embedding_column, question_embedding, top_k):
+    """The original process_question retrieval path."""
+    similarities = cosine_similarity(
+        np.vstack(embedding_column),
+        [question_embedding]
+    ).flatten()
+    return similarities.argsort()[::-1][:top_k]
+
+
+def time_calls(fn, repeats):
+    """Return the median wall time of fn() in milliseconds."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def run(size, top_k, repeats, rng):
+    matrix = rng.standard_normal((size, DIM)).astype(np.float32)
+    query = rng.standard_normal(DIM).astype(np.float32)
+
+    # The joblib file stores Python lists; at 1M rows that would need >10 GB,
+    # so large corpora fall back to per-row arrays (a lower bound for legacy).
+    if size <= 100_000:
+        column = np.empty(size, dtype=object)
+        column[:] = [row.astype(np.float64).tolist() for row in matrix]
+        column_kind = 'lists'
+    else:
+        column = list(matrix.astype(np.float64))
+        column_kind = 'arrays'
+
+    engine = RetrievalEngine(FrameTable(pd.DataFrame(index=range(size))), matrix)
+
+    legacy_ms = time_calls(lambda: legacy_search(column, query, top_k), repeats)
+    engine_ms = time_calls(lambda: engine.search(query, top_k), repeats)
+
+    legacy_top = set(legacy_search(column, query, top_k).tolist())
+    engine_top = set(engine.search(query, top_k)[0].tolist())
+
+    label = f"({column_kind})"
+    print(f"{size:>9,} chunks {label:<8} | legacy {legacy_ms:9.2f} ms | "
+          f"engine {engine_ms:8.2f} ms | speedup {legacy_ms / engine_ms:6.1f}x | "
+          f"same top-{top_k}: {legacy_top == engine_top}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--top-k', type=int, default=7)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    for size in args.sizes:
+        run(size, args.top_k, args.repeats, rng)
+
+
+if __name__ == '__main__':
+    main()
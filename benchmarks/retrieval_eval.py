@@ -0,0 +1,393 @@
+"""
+Offline retrieval quality and speed, and a regression check between runs.
+
+The labelled question set is generated from the transcript JSON files. Each
+question is built from one chunk and labelled with that chunk's video and
+time span, so the labels survive re-chunking and re-embedding. Generate it
+once (it is committed as benchmarks/retrieval_questions.json):
+
+    python -m benchmarks.retrieval_eval questions
+
+Then evaluate the retrieval path of process_question (encode, dense or
+hybrid search, MMR) with no network. Questions are encoded by the
+locally cached sentence-transformers model:
+
+    python -m benchmarks.retrieval_eval run --index index --output eval.json
+    python -m benchmarks.retrieval_eval run --scale 1 10 100 1000 --backend ivf
+    python -m benchmarks.retrieval_eval run --e2e --llm-ms 300      # also time /query against a local Groq stub
+    python -m benchmarks.retrieval_eval run --baseline eval.json    # exit 1 if recall dropped
+
+A retrieved chunk counts as relevant when it comes from the question's video
+and covers at least half of the shorter of the two time spans. --scale N
+adds N-1 synthetic distractor chunks per real chunk. Each distractor blends
+two real chunks' embeddings (plus noise) and their words, so it sits in the
+same region of the embedding space and shares the vocabulary. Distractors
+are never relevant.
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bm25_index import BM25Index, tokenize
+from extractive import STOPWORDS, split_sentences
+from passages import mmr_select
+from retrieval import RetrievalEngine, normalize_rows
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(__file__), 'retrieval_questions.json')
+TRANSCRIPTS = 'transcripts_json_YT_Transcript/*.json'
+
+
+# Question set
+
+def keyword_question(words, rng):
+    return rng.choice([
+        "What does the video say about {}?",
+        "Explain {}",
+        "Tell me about {}",
+    ]).format(', '.join(words[:-1]) + ' and ' + words[-1] if len(words) > 1 else words[0])
+
+
+def distinctive_terms(text, idf, n=3):
+    """The n highest tf-idf content words of text, in order of first use."""
+    counts = {}
+    for w in tokenize(text):
+        if w not in STOPWORDS and len(w) > 3 and w.isalpha():
+            counts[w] = counts.get(w, 0) + 1
+    best = sorted(counts, key=lambda w: -counts[w] * idf.get(w, 0.0))[:n]
+    order = {w: i for i, w in enumerate(tokenize(text))}
+    return sorted(best, key=order.get)
+
+
+def sentence_question(text, rng, drop=0.2):
+    """A sentence of text with a share of its words dropped, or None."""
+    sentences = [s for s in split_sentences(text) if 8 <= len(s.split()) <= 40]
+    if not sentences:
+        return None
+    words = re.sub(r'["“”]', '', sentences[int(rng.integers(len(sentences)))]).split()
+    keep = rng.random(len(words)) >= drop
+    keep[0] = True
+    return ' '.join(w for w, k in zip(words, keep) if k).rstrip('.!') + '?'
+
+
+def generate_questions(pattern, per_video, seed):
+    rng = np.random.default_rng(seed)
+    videos = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding='utf-8') as f:
+            videos.append(json.load(f))
+    texts = [c['text'] for v in videos for c in v['chunks']]
+    df = {}
+    for text in texts:
+        for w in set(tokenize(text)):
+            df[w] = df.get(w, 0) + 1
+    idf = {w: float(np.log(len(texts) / n)) for w, n in df.items()}
+
+    questions, seen = [], set()
+    for video in videos:
+        chunks = video['chunks']
+        for i, pick in enumerate(rng.choice(len(chunks), min(per_video, len(chunks)), replace=False)):
+            chunk = chunks[int(pick)]
+            kind = 'keywords' if i % 2 == 0 else 'sentence'
+            if kind == 'sentence':
+                question = sentence_question(chunk['text'], rng)
+                if question is None:
+                    kind = 'keywords'
+            if kind == 'keywords':
+                words = distinctive_terms(chunk['text'], idf)
+                if not words:
+                    continue
+                question = keyword_question(words, rng)
+            if question.lower() in seen:
+                continue
+            seen.add(question.lower())
+            questions.append({
+                'question': question,
+                'kind': kind,
+                'video_id': video['video_id'],
+                'start_time': chunk['start_time'],
+                'end_time': chunk['end_time'],
+            })
+    return questions
+
+
+# Corpus
+
+def load_corpus(index, joblib_path):
+    """Return (matrix, texts, video_ids, starts, ends) of the real corpus."""
+    if index:
+        engine = RetrievalEngine.from_index(index)
+        rows = engine.rows(range(len(engine)))
+    else:
+        engine = RetrievalEngine.from_joblib(joblib_path)
+        rows = engine.table.df
+    return (engine.matrix, list(rows['text']), rows['video_id'].to_numpy(),
+            rows['start_time'].to_numpy(dtype=np.float64), rows['end_time'].to_numpy(dtype=np.float64))
+
+
+def scaled_corpus(matrix, texts, scale, rng):
+    """The real vectors plus (scale - 1) distractors per real chunk; returns (matrix, term_ids, offsets, vocab)."""
+    n = len(texts)
+    vocab = {}
+    token_ids = [np.array([vocab.setdefault(w, len(vocab)) for w in tokenize(t)], dtype=np.int32) for t in texts]
+    extra = n * (scale - 1)
+    vectors = np.empty((n + extra, matrix.shape[1]), dtype=np.float32)
+    vectors[:n] = matrix
+    docs = list(token_ids)
+    for start in range(n, n + extra, 65536):
+        size = min(65536, n + extra - start)
+        a, b = rng.integers(0, n, size), rng.integers(0, n, size)
+        mix = rng.uniform(0.3, 0.7, (size, 1)).astype(np.float32)
+        noise = rng.standard_normal((size, matrix.shape[1])).astype(np.float32) * 0.02
+        vectors[start:start + size] = normalize_rows(mix * matrix[a] + (1 - mix) * matrix[b] + noise)
+        for i, j, m in zip(a, b, mix[:, 0]):
+            first, second = token_ids[i], token_ids[j]
+            docs.append(np.concatenate([first[:int(len(first) * m)], second[int(len(second) * m):]]))
+    offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+    np.cumsum([len(d) for d in docs], out=offsets[1:])
+    return vectors, np.concatenate(docs), offsets, vocab
+
+
+def build_engine(vectors, term_ids, offsets, vocab, backend, hybrid, nprobe, shortlist, scan_budget):
+    ann = None
+    if backend == 'ivf':
+        from ivf_index import IVFIndex
+        ann = IVFIndex.build(vectors)
+        ann.nprobe = nprobe
+    elif backend in ('int8', 'binary'):
+        from quantized_index import QuantizedIndex
+        ann = QuantizedIndex.build(vectors, backend)
+        ann.shortlist = shortlist
+    lexical = None
+    if hybrid:
+        lexical = BM25Index.build_from_ids(term_ids, offsets, vocab)
+        lexical.scan_budget = scan_budget
+    return RetrievalEngine(None, vectors, normalized=True, ann=ann, lexical=lexical)
+
+
+# Evaluation
+
+def percentiles(values):
+    return {f"p{p}": round(float(np.percentile(values, p)), 3) for p in (50, 95, 99)}
+
+
+def relevant(label, video_ids, starts, ends, indices):
+    """Boolean per retrieved index: same video and at least half of the shorter span covered."""
+    hits = np.zeros(len(indices), dtype=bool)
+    real = indices < len(video_ids)
+    ids = indices[real]
+    overlap = np.minimum(ends[ids], label['end_time']) - np.maximum(starts[ids], label['start_time'])
+    shorter = np.minimum(ends[ids] - starts[ids], label['end_time'] - label['start_time'])
+    hits[real] = (video_ids[ids] == label['video_id']) & (overlap >= 0.5 * np.maximum(shorter, 1e-9))
+    return hits
+
+
+def evaluate(engine, questions, embeddings, corpus, ks, candidates, diversity, encode_ms):
+    video_ids, starts, ends = corpus
+    depth = max(ks)
+    found = {k: [] for k in ks}
+    reciprocal, search_ms, mmr_ms, total_ms = [], [], [], []
+    for q, embedding, encode in zip(questions, embeddings, encode_ms):
+        start = time.perf_counter()
+        indices, scores = engine.search(embedding, max(depth, candidates) if diversity > 0 else depth,
+                                        query_text=q['question'])
+        searched = time.perf_counter()
+        if diversity > 0:
+            indices = indices[mmr_select(engine.vectors(indices), scores, depth, diversity)]
+        done = time.perf_counter()
+        search_ms.append((searched - start) * 1000)
+        mmr_ms.append((done - searched) * 1000)
+        total_ms.append(encode + (done - start) * 1000)
+
+        hits = relevant(q, video_ids, starts, ends, np.asarray(indices, dtype=np.int64))
+        for k in ks:
+            found[k].append(bool(hits[:k].any()))
+        first = np.flatnonzero(hits)
+        reciprocal.append(1.0 / (first[0] + 1) if len(first) else 0.0)
+
+    result = {f"recall@{k}": round(float(np.mean(found[k])), 4) for k in ks}
+    result['mrr'] = round(float(np.mean(reciprocal)), 4)
+    result['latency_ms'] = {'encode': percentiles(encode_ms), 'search': percentiles(search_ms),
+                            'mmr': percentiles(mmr_ms), 'total': percentiles(total_ms)}
+    result['qps'] = round(len(questions) / (sum(total_ms) / 1000), 1)
+    result['by_kind'] = {
+        kind: {f"recall@{k}": round(float(np.mean([f for f, q in zip(found[k], questions) if q['kind'] == kind])), 4)
+               for k in ks}
+        for kind in sorted({q['kind'] for q in questions})
+    }
+    return result
+
+
+def encode_questions(model_name, questions):
+    """Encode one question at a time, as process_question does; returns (embeddings, per-question ms)."""
+    os.environ.setdefault('HF_HUB_OFFLINE', '1')
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name)
+    model.encode(["warm-up"])
+    embeddings, times = [], []
+    for q in questions:
+        start = time.perf_counter()
+        embeddings.append(model.encode([q['question']])[0])
+        times.append((time.perf_counter() - start) * 1000)
+    return normalize_rows(np.asarray(embeddings, dtype=np.float32)), times
+
+
+def end_to_end(questions, index, llm_ms, token_ms):
+    """Time POST /query through main.app against a deterministic local Groq stub."""
+    from benchmarks.fake_groq import FakeGroqServer
+    server = FakeGroqServer(port=0, first_token_ms=llm_ms, token_ms=token_ms).start()
+    os.environ.update({
+        'GROQ_BASE_URL': server.base_url, 'GROQ_API_KEY': os.getenv('GROQ_API_KEY', 'fake'),
+        'INDEX_DIR': index or 'index',
+        # Every question must run the whole pipeline
+        'ANSWER_CACHE_SIZE': '0', 'SINGLE_FLIGHT_DB': '',
+        'LLM_REQUESTS_PER_MINUTE': '0', 'LLM_TOKENS_PER_MINUTE': '0',
+        'CHAT_DB': os.path.join(tempfile.mkdtemp(), 'chats.sqlite3'),
+        'SLOW_REQUEST_SECONDS': '1e9',
+    })
+    import main
+    client = main.app.test_client()
+    client.post('/query', json={'question': 'warm-up'})
+    times, failures = [], 0
+    for q in questions:
+        start = time.perf_counter()
+        response = client.post('/query', json={'question': q['question']})
+        times.append((time.perf_counter() - start) * 1000)
+        failures += int(response.status_code != 200)
+    server.stop()
+    return {'latency_ms': percentiles(times), 'qps': round(len(times) / (sum(times) / 1000), 2),
+            'failures': failures, 'llm_ms': llm_ms}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, max_drop):
+    """Print recall/MRR/latency against a baseline run; return False if quality dropped by more than max_drop."""
+    ok = True
+    previous = {run['scale']: run for run in baseline['runs']}
+    for run in results['runs']:
+        old = previous.get(run['scale'])
+        if old is None:
+            continue
+        for metric in [m for m in run if m.startswith('recall@')] + ['mrr']:
+            if metric not in old:
+                continue
+            delta = run[metric] - old[metric]
+            flag = ''
+            if delta < -max_drop:
+                flag, ok = '  REGRESSION', False
+            print(f"scale {run['scale']:>5} {metric:>10}: {old[metric]:.4f} -> {run[metric]:.4f} ({delta:+.4f}){flag}")
+        p95, old_p95 = run['latency_ms']['total']['p95'], old['latency_ms']['total']['p95']
+        print(f"scale {run['scale']:>5} {'p95 ms':>10}: {old_p95:.3f} -> {p95:.3f}")
+    return ok
+
+
+def run(args):
+    with open(args.questions, encoding='utf-8') as f:
+        questions = json.load(f)
+    if args.limit:
+        questions = questions[:args.limit]
+    matrix, texts, video_ids, starts, ends = load_corpus(args.index, args.joblib)
+    embeddings, encode_ms = encode_questions(args.model, questions)
+    if embeddings.shape[1] != matrix.shape[1]:
+        sys.exit(f"{args.model} gives {embeddings.shape[1]}-d vectors but the corpus has {matrix.shape[1]}-d ones")
+
+    results = {
+        'meta': {
+            'commit': git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'model': args.model,
+            'corpus': args.index or args.joblib, 'chunks': len(texts), 'questions': len(questions),
+            'backend': args.backend, 'hybrid': args.hybrid, 'candidates': args.candidates,
+            'diversity': args.diversity, 'seed': args.seed,
+        },
+        'runs': [],
+    }
+    for scale in args.scale:
+        rng = np.random.default_rng(args.seed)
+        start = time.perf_counter()
+        vectors, term_ids, offsets, vocab = scaled_corpus(matrix, texts, scale, rng)
+        engine = build_engine(vectors, term_ids, offsets, vocab, args.backend, args.hybrid,
+                              args.nprobe, args.shortlist, args.scan_budget)
+        build_s = time.perf_counter() - start
+        result = evaluate(engine, questions, embeddings, (video_ids, starts, ends), args.k,
+                          args.candidates, args.diversity, encode_ms)
+        results['runs'].append({'scale': scale, 'chunks': len(engine), 'build_seconds': round(build_s, 2), **result})
+        recalls = ' '.join(f"{m} {result[m]:.3f}" for m in result if m.startswith('recall@'))
+        print(f"scale {scale:>5} | {len(engine):>9,} chunks | {recalls} | mrr {result['mrr']:.3f} | "
+              f"p50 {result['latency_ms']['total']['p50']:.2f} ms p99 {result['latency_ms']['total']['p99']:.2f} ms | "
+              f"{result['qps']:.0f} q/s")
+        del engine, vectors
+
+    if args.e2e:
+        results['e2e'] = end_to_end(questions, args.index, args.llm_ms, args.token_ms)
+        e2e = results['e2e']
+        print(f"/query end to end | p50 {e2e['latency_ms']['p50']:.1f} ms p99 {e2e['latency_ms']['p99']:.1f} ms | "
+              f"{e2e['qps']:.1f} q/s | {e2e['failures']} failures | stub LLM {args.llm_ms:g} ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.max_recall_drop):
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('questions', help='generate the labelled question set')
+    generate.add_argument('--transcripts', default=TRANSCRIPTS, help='glob of transcript JSON files')
+    generate.add_argument('--per-video', type=int, default=20)
+    generate.add_argument('--output', default=QUESTIONS_PATH)
+    generate.add_argument('--seed', type=int, default=0)
+
+    evaluate_cmd = commands.add_parser('run', help='evaluate retrieval')
+    evaluate_cmd.add_argument('--questions', default=QUESTIONS_PATH)
+    evaluate_cmd.add_argument('--index', default='index', help='index directory (empty to use --joblib)')
+    evaluate_cmd.add_argument('--joblib', default='embeddings.joblib')
+    evaluate_cmd.add_argument('--model', default='all-MiniLM-L6-v2')
+    evaluate_cmd.add_argument('--scale', type=int, nargs='+', default=[1], help='corpus size multipliers')
+    evaluate_cmd.add_argument('--k', type=int, nargs='+', default=[1, 3, 5, 7])
+    evaluate_cmd.add_argument('--backend', choices=['exact', 'ivf', 'int8', 'binary'], default='exact')
+    evaluate_cmd.add_argument('--nprobe', type=int, default=8)
+    evaluate_cmd.add_argument('--shortlist', type=int, default=100)
+    evaluate_cmd.add_argument('--hybrid', type=int, choices=[0, 1], default=1)
+    evaluate_cmd.add_argument('--scan-budget', type=int, default=10000)
+    evaluate_cmd.add_argument('--candidates', type=int, default=20, help='MMR candidates, as MMR_CANDIDATES')
+    evaluate_cmd.add_argument('--diversity', type=float, default=0.3, help='as MMR_DIVERSITY; 0 disables MMR')
+    evaluate_cmd.add_argument('--limit', type=int, default=0, help='use only the first N questions')
+    evaluate_cmd.add_argument('--e2e', action='store_true', help='also time POST /query with a stub LLM')
+    evaluate_cmd.add_argument('--llm-ms', type=float, default=0.0, help='stub LLM latency to the first token')
+    evaluate_cmd.add_argument('--token-ms', type=float, default=0.0)
+    evaluate_cmd.add_argument('--output', default=None, help='write the results as JSON')
+    evaluate_cmd.add_argument('--baseline', default=None, help='results JSON of an earlier run to compare with')
+    evaluate_cmd.add_argument('--max-recall-drop', type=float, default=0.02)
+    evaluate_cmd.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'questions':
+        questions = generate_questions(args.transcripts, args.per_video, args.seed)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(questions, f, indent=1, ensure_ascii=False)
+        print(f"{len(questions)} questions written to {args.output}")
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
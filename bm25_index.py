@@ -0,0 +1,283 @@
+"""
+BM25 inverted index over the chunk texts, for hybrid lexical + dense retrieval.
+
+Dense MiniLM similarity misses exact names, numbers and Hinglish terms; BM25
+catches them. The index is stored as flat arrays next to the embeddings:
+
+    bm25_vocab.json    terms, in term-id order
+    bm25_offsets.npy   int64 CSR offsets: term t's postings are [offsets[t], offsets[t+1])
+    bm25_docs.npy      int32 chunk ids of all postings, ascending within each term
+    bm25_weights.npy   float32 precomputed BM25 weight (idf * saturated tf) per posting
+    bm25_upper.npy     float32 largest weight of each term
+    bm25.json          count, average length and parameters
+
+Search is exact but avoids walking the long posting lists of common words
+(MaxScore style): the rarest query terms are scanned in full, and the common
+terms are then only looked up, by binary search, for the chunks that can
+still reach the top k given each term's largest weight.
+
+Build it for an existing index directory with:
+
+    python -m bm25_index index
+"""
+import argparse
+import json
+import os
+import re
+import unicodedata
+from array import array
+
+import numpy as np
+
+from index_store import ChunkTable
+from retrieval import top_k_indices
+
+# Word characters plus Devanagari vowel signs, which \w does not match
+TOKEN = re.compile(r'[\w\u0900-\u097F]+')
+
+BLOCK_DOCS = 65536
+
+# Rough cost of one binary-search lookup relative to scanning one posting
+LOOKUP_COST = 16
+
+
+def tokenize(text):
+    """Lowercased word tokens; punctuation and symbols are dropped."""
+    return TOKEN.findall(unicodedata.normalize('NFKC', text).casefold())
+
+
+def block_postings(term_ids, doc_offsets, first, n_terms):
+    """
+    (docs, terms, tf) postings of one block of documents, in document order.
+
+    The block's documents are first, first + 1, ...; document first + i owns
+    term_ids[doc_offsets[i]:doc_offsets[i + 1]]. One (doc, term) key per
+    token; the unique keys give the term frequencies.
+    """
+    n_terms = max(n_terms, 1)
+    lengths = np.diff(doc_offsets)
+    doc_of_token = np.repeat(np.arange(first, first + len(lengths), dtype=np.int64), lengths)
+    tokens = term_ids[doc_offsets[0]:doc_offsets[-1]]
+    keys, counts = np.unique(doc_of_token * n_terms + tokens, return_counts=True)
+    return (keys // n_terms).astype(np.int32), (keys % n_terms).astype(np.int32), counts.astype(np.float32)
+
+
+class BM25Index:
+    """BM25 posting lists over the rows of the corpus, with per-term upper bounds."""
+
+    def __init__(self, vocab, offsets, docs, weights, upper, count, avgdl, k1=1.2, b=0.75, scan_budget=10000):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.docs = docs
+        self.weights = weights
+        self.upper = upper
+        self.count = count
+        self.avgdl = avgdl
+        self.k1 = k1
+        self.b = b
+        # Postings scanned in full before the remaining terms are only looked up
+        self.scan_budget = scan_budget
+
+    @classmethod
+    def build(cls, texts, k1=1.2, b=0.75):
+        """Tokenize an iterable of chunk texts and build the index, a block of documents at a time."""
+        vocab = {}
+        blocks = []
+        doc_lengths = array('q')
+
+        def add_block(term_ids, doc_offsets):
+            offsets = np.frombuffer(doc_offsets, dtype=np.int64)
+            blocks.append(block_postings(np.frombuffer(term_ids, dtype=np.int32), offsets,
+                                         len(doc_lengths), len(vocab)))
+            doc_lengths.extend(np.diff(offsets).tolist())
+
+        term_ids, doc_offsets = array('i'), array('q', [0])
+        for text in texts:
+            for token in tokenize(text):
+                term_ids.append(vocab.setdefault(token, len(vocab)))
+            doc_offsets.append(len(term_ids))
+            if len(doc_offsets) > BLOCK_DOCS:
+                add_block(term_ids, doc_offsets)
+                term_ids, doc_offsets = array('i'), array('q', [0])
+        if len(doc_offsets) > 1:
+            add_block(term_ids, doc_offsets)
+        return cls.from_postings(blocks, np.frombuffer(doc_lengths, dtype=np.int64), vocab, k1=k1, b=b)
+
+    @classmethod
+    def build_from_ids(cls, term_ids, doc_offsets, vocab, k1=1.2, b=0.75):
+        """
+        Build from already tokenized documents.
+
+        term_ids holds the term id of every token of every document;
+        document d owns term_ids[doc_offsets[d]:doc_offsets[d + 1]].
+        """
+        count = len(doc_offsets) - 1
+        blocks = [block_postings(term_ids, doc_offsets[first:min(first + BLOCK_DOCS, count) + 1], first, len(vocab))
+                  for first in range(0, count, BLOCK_DOCS)]
+        return cls.from_postings(blocks, np.diff(doc_offsets), vocab, k1=k1, b=b)
+
+    @classmethod
+    def from_postings(cls, blocks, doc_lengths, vocab, k1=1.2, b=0.75):
+        """Build from the (docs, terms, tf) of consecutive blocks of documents (see block_postings)."""
+        count = len(doc_lengths)
+        avgdl = float(doc_lengths.mean()) if count else 0.0
+        docs = np.concatenate([block[0] for block in blocks]) if blocks else np.empty(0, dtype=np.int32)
+        terms = np.concatenate([block[1] for block in blocks]) if blocks else np.empty(0, dtype=np.int32)
+        tf = np.concatenate([block[2] for block in blocks]) if blocks else np.empty(0, dtype=np.float32)
+        del blocks[:]
+
+        df = np.bincount(terms, minlength=len(vocab))
+        idf = np.log1p((count - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = k1 * (1 - b + b * doc_lengths[docs].astype(np.float32) / (avgdl or 1.0))
+        weights = (idf[terms] * tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+
+        del tf, norm
+        # Blocks are in document order, so a stable sort by term keeps each list doc-ascending
+        order = np.argsort(terms, kind='stable')
+        del terms
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=offsets[1:])
+        weights = weights[order]
+        upper = np.zeros(len(vocab), dtype=np.float32)
+        nonempty = df > 0
+        upper[nonempty] = np.maximum.reduceat(weights, offsets[:-1][nonempty]) if len(weights) else 0
+        return cls(vocab, offsets, docs[order], weights, upper, count, avgdl, k1=k1, b=b)
+
+    @property
+    def n_postings(self):
+        return len(self.docs)
+
+    def save(self, directory):
+        terms = [None] * len(self.vocab)
+        for term, i in self.vocab.items():
+            terms[i] = term
+        with open(os.path.join(directory, 'bm25_vocab.json'), 'w', encoding='utf-8') as f:
+            json.dump(terms, f, ensure_ascii=False)
+        np.save(os.path.join(directory, 'bm25_offsets.npy'), self.offsets)
+        np.save(os.path.join(directory, 'bm25_docs.npy'), self.docs)
+        np.save(os.path.join(directory, 'bm25_weights.npy'), self.weights)
+        np.save(os.path.join(directory, 'bm25_upper.npy'), self.upper)
+        with open(os.path.join(directory, 'bm25.json'), 'w') as f:
+            json.dump({'count': self.count, 'avgdl': self.avgdl, 'k1': self.k1, 'b': self.b,
+                       'n_terms': len(self.vocab), 'n_postings': int(self.n_postings)}, f, indent=2)
+
+    @classmethod
+    def load(cls, directory, scan_budget=10000):
+        with open(os.path.join(directory, 'bm25.json')) as f:
+            meta = json.load(f)
+        with open(os.path.join(directory, 'bm25_vocab.json'), encoding='utf-8') as f:
+            vocab = {term: i for i, term in enumerate(json.load(f))}
+        return cls(
+            vocab,
+            np.load(os.path.join(directory, 'bm25_offsets.npy')),
+            np.load(os.path.join(directory, 'bm25_docs.npy'), mmap_mode='r'),
+            np.load(os.path.join(directory, 'bm25_weights.npy'), mmap_mode='r'),
+            np.load(os.path.join(directory, 'bm25_upper.npy')),
+            meta['count'], meta['avgdl'], k1=meta['k1'], b=meta['b'], scan_budget=scan_budget,
+        )
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, 'bm25.json'))
+
+    def length(self, t):
+        return int(self.offsets[t + 1] - self.offsets[t])
+
+    def lookup(self, t, candidates):
+        """Weights of term t for the candidate chunk ids (0 where the term is absent)."""
+        start, end = self.offsets[t], self.offsets[t + 1]
+        docs = self.docs[start:end]
+        positions = np.minimum(np.searchsorted(docs, candidates), end - start - 1)
+        found = np.asarray(docs[positions]) == candidates
+        return np.where(found, np.asarray(self.weights[start:end][positions]), 0.0).astype(np.float32)
+
+    def scan(self, t, scores):
+        """Add term t's weights to the dense score array; return the chunk ids it adds."""
+        start, end = self.offsets[t], self.offsets[t + 1]
+        docs = np.asarray(self.docs[start:end])
+        fresh = docs[scores[docs] == 0]
+        # A document appears at most once per posting list, so += is safe here
+        scores[docs] += self.weights[start:end]
+        return fresh
+
+    def search(self, query_text, top_k=50):
+        """Return (indices, scores) of the top_k chunks by BM25 score."""
+        terms = sorted({self.vocab[t] for t in tokenize(query_text) if t in self.vocab}, key=self.length)
+        if not terms:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        scores = np.zeros(self.count, dtype=np.float32)
+        touched = []
+        scanned = 0
+        while True:
+            # Scan the rarest unscanned lists: at least one, then more while within budget
+            budget = 0
+            while scanned < len(terms) and (budget == 0 or budget + self.length(terms[scanned]) <= self.scan_budget):
+                touched.append(self.scan(terms[scanned], scores))
+                budget += self.length(terms[scanned])
+                scanned += 1
+            if len(touched) > 1:
+                touched = [np.concatenate(touched)]
+            candidates = touched[0]
+            partial = scores[candidates]
+            rest = terms[scanned:]
+            if not rest:
+                best = top_k_indices(partial, top_k)
+                return candidates[best].astype(np.int64), partial[best]
+
+            # The remaining (common) terms are only looked up for chunks that can still win
+            candidates, partial = prune(candidates, partial, float(self.upper[rest].sum()), top_k)
+            if len(candidates) * LOOKUP_COST > self.length(rest[0]):
+                continue  # cheaper to scan the next list than to look it up
+            found = self.complete(candidates, partial, rest, top_k)
+            if found is not None:
+                return found
+            # Chunks outside the scanned lists could still win: scan the next list too
+
+    def complete(self, candidates, partial, rest, top_k):
+        """
+        Add the weights of the unscanned terms to the candidates' scores.
+
+        Returns (indices, scores), or None if a chunk outside the candidates
+        could still reach the top_k.
+        """
+        remaining = np.cumsum(self.upper[rest][::-1])[::-1]
+        final = partial
+        for i, t in enumerate(rest):
+            candidates, final = prune(candidates, final, float(remaining[i]), top_k)
+            final = final + self.lookup(t, candidates)
+        best = top_k_indices(final, top_k)
+        # Outside chunks only have the unscanned terms, worth at most remaining[0]
+        if len(best) == top_k and final[best[-1]] >= remaining[0]:
+            return candidates[best].astype(np.int64), final[best]
+        return None
+
+
+def prune(candidates, scores, headroom, top_k):
+    """
+    Drop candidates that cannot reach the top_k even if they gain headroom.
+
+    Scores only grow, so the current k-th best score is a floor for the final one.
+    """
+    if len(candidates) <= top_k:
+        return candidates, scores
+    floor = scores[np.argpartition(scores, -top_k)[-top_k]]
+    keep = scores + headroom >= floor
+    return candidates[keep], scores[keep]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('index_dir')
+    parser.add_argument('--k1', type=float, default=1.2)
+    parser.add_argument('--b', type=float, default=0.75)
+    args = parser.parse_args()
+
+    table = ChunkTable(args.index_dir)
+    bm25 = BM25Index.build((table.text(i) for i in range(len(table))), k1=args.k1, b=args.b)
+    bm25.save(args.index_dir)
+    print(f"Built BM25 index with {len(bm25.vocab)} terms and {bm25.n_postings} postings in {args.index_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+"""
+Chat history in SQLite, shared by all gunicorn workers on a host.
+
+Every chat and every message is its own row, so saving a message is one
+INSERT plus two small UPDATEs however long the conversation is, and clients
+send one message per request instead of their whole history.
+
+    users     email -> version, bumped by every write of that user
+    chats     one row per chat (title, created_at, message_count)
+    messages  one row per message, read in pages by their seq
+
+Reads of hot users are served from an in-process LRU. Each cached entry
+remembers the user's version; a read checks it with a primary-key lookup in
+the same snapshot, so writes made by other workers are never served stale.
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chats (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT NOT NULL,
+    id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (email, id)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    message TEXT NOT NULL,
+    sources TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_chat ON messages (email, chat_id, seq);
+"""
+
+MAX_PAGE_SIZE = 200
+ROLES = ('user', 'assistant')
+# Cached pages kept per user before that user's entry is cleared
+MAX_PAGES_PER_USER = 32
+
+
+def now_iso():
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime()) + 'Z'
+
+
+def page_size(limit, default):
+    try:
+        limit = int(limit) if limit is not None else default
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+class ChatStore:
+    """SQLite-backed chats per user, with pooled connections and an LRU of hot users."""
+
+    COUNTERS = ('hits', 'misses', 'writes')
+
+    def __init__(self, db_path, cache_users=1024, pool_size=8):
+        self.db_path = db_path
+        self.cache_users = cache_users
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()
+        self._pid = os.getpid()
+        self._cache = OrderedDict()  # email -> (version, {page key: result})
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """Borrow a connection from the pool (a fresh pool after a fork)."""
+        if self._pid != os.getpid():
+            self._pool = queue.LifoQueue()
+            self._pid = os.getpid()
+            with self._lock:
+                self._cache.clear()
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            if self._pool.qsize() < self.pool_size:
+                self._pool.put(conn)
+            else:
+                conn.close()
+
+    @contextmanager
+    def _transaction(self, immediate=False):
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    # Reads
+
+    def _read(self, email, key, load):
+        """Return load(conn) for this user, from the LRU when the user has not changed since."""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT version FROM users WHERE email = ?", (email,)).fetchone()
+            version = row['version'] if row else 0
+            with self._lock:
+                entry = self._cache.get(email)
+                if entry is not None and entry[0] == version and key in entry[1]:
+                    self._cache.move_to_end(email)
+                    self.hits += 1
+                    return entry[1][key]
+                self.misses += 1
+            result = load(conn)
+        with self._lock:
+            entry = self._cache.get(email)
+            if entry is None or entry[0] != version or len(entry[1]) >= MAX_PAGES_PER_USER:
+                entry = (version, {})
+            entry[1][key] = result
+            self._cache[email] = entry
+            self._cache.move_to_end(email)
+            while len(self._cache) > self.cache_users:
+                self._cache.popitem(last=False)
+        return result
+
+    def list_chats(self, email, offset=0, limit=None):
+        """Newest chats first: {'chats': [...], 'next_offset': int or None}."""
+        offset = max(0, int(offset or 0))
+        limit = page_size(limit, 50)
+
+        def load(conn):
+            rows = conn.execute(
+                "SELECT id, title, created_at, message_count FROM chats WHERE email = ? "
+                "ORDER BY seq DESC LIMIT ? OFFSET ?", (email, limit + 1, offset)
+            ).fetchall()
+            chats = [{'id': r['id'], 'title': r['title'], 'createdAt': r['created_at'],
+                      'messageCount': r['message_count']} for r in rows[:limit]]
+            return {'chats': chats, 'next_offset': offset + limit if len(rows) > limit else None}
+
+        return self._read(email, ('chats', offset, limit), load)
+
+    def messages(self, email, chat_id, after=0, limit=None):
+        """Messages of a chat, oldest first, after the seq `after`: {'messages': [...], 'next_after': int or None}."""
+        after = max(0, int(after or 0))
+        limit = page_size(limit, 100)
+
+        def load(conn):
+            rows = conn.execute(
+                "SELECT seq, role, message, sources, timestamp FROM messages "
+                "WHERE email = ? AND chat_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (email, chat_id, after, limit + 1)
+            ).fetchall()
+            messages = [{'id': r['seq'], 'role': r['role'], 'message': r['message'],
+                         'sources': json.loads(r['sources']) if r['sources'] else None,
+                         'timestamp': r['timestamp']} for r in rows[:limit]]
+            return {'messages': messages, 'next_after': messages[-1]['id'] if len(rows) > limit else None}
+
+        return self._read(email, ('messages', chat_id, after, limit), load)
+
+    # Writes
+
+    @contextmanager
+    def _write(self, email):
+        with self._transaction(immediate=True) as conn:
+            yield conn
+            conn.execute(
+                "INSERT INTO users (email, version) VALUES (?, 1) "
+                "ON CONFLICT (email) DO UPDATE SET version = version + 1", (email,)
+            )
+        with self._lock:
+            self.writes += 1
+            self._cache.pop(email, None)
+
+    @staticmethod
+    def _ensure_chat(conn, email, chat_id, title='New Chat', created_at=None):
+        conn.execute(
+            "INSERT OR IGNORE INTO chats (email, id, title, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (email, chat_id, title, created_at or now_iso(), time.time())
+        )
+
+    def save_chat(self, email, chat_id, title=None, created_at=None):
+        """Create a chat, or rename it when title is given."""
+        if not chat_id:
+            raise ValueError("chat id is required")
+        with self._write(email) as conn:
+            self._ensure_chat(conn, email, chat_id, title or 'New Chat', created_at)
+            if title:
+                conn.execute("UPDATE chats SET title = ?, updated_at = ? WHERE email = ? AND id = ?",
+                             (title, time.time(), email, chat_id))
+
+    def delete_chat(self, email, chat_id):
+        with self._write(email) as conn:
+            conn.execute("DELETE FROM messages WHERE email = ? AND chat_id = ?", (email, chat_id))
+            conn.execute("DELETE FROM chats WHERE email = ? AND id = ?", (email, chat_id))
+
+    def append_message(self, email, chat_id, role, message, sources=None, timestamp=None):
+        """Append one message (creating the chat if needed) and return its id."""
+        if not chat_id:
+            raise ValueError("chat id is required")
+        if role not in ROLES:
+            raise ValueError(f"role must be one of {', '.join(ROLES)}")
+        if not isinstance(message, str):
+            raise ValueError("message must be a string")
+        with self._write(email) as conn:
+            self._ensure_chat(conn, email, chat_id)
+            seq = conn.execute(
+                "INSERT INTO messages (email, chat_id, role, message, sources, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                (email, chat_id, role, message, json.dumps(sources) if sources is not None else None,
+                 timestamp or now_iso())
+            ).lastrowid
+            conn.execute(
+                "UPDATE chats SET message_count = message_count + 1, updated_at = ? WHERE email = ? AND id = ?",
+                (time.time(), email, chat_id)
+            )
+        return seq
+
+    def replace_chats(self, email, chats):
+        """Replace all chats of a user with the old whole-history format (a list of chats with messages)."""
+        if not isinstance(chats, list):
+            raise ValueError("expected a list of chats")
+        # Check the whole upload first, so a bad item cannot leave the history half replaced
+        for chat in chats:
+            if not isinstance(chat, dict):
+                raise ValueError("each chat must be an object")
+            messages = chat.get('messages') or []
+            if not isinstance(messages, list) or not all(isinstance(m, dict) for m in messages):
+                raise ValueError("chat messages must be a list of objects")
+            for m in messages:
+                if m.get('role', 'user') not in ROLES:
+                    raise ValueError(f"role must be one of {', '.join(ROLES)}")
+                if not isinstance(m.get('message', ''), str):
+                    raise ValueError("message must be a string")
+        with self._write(email) as conn:
+            conn.execute("DELETE FROM messages WHERE email = ?", (email,))
+            conn.execute("DELETE FROM chats WHERE email = ?", (email,))
+            # The list is newest first; insert oldest first so seq order matches
+            for chat in reversed(chats):
+                chat_id = str(chat.get('id') or '')
+                if not chat_id:
+                    continue
+                messages = chat.get('messages') or []
+                conn.execute(
+                    "INSERT OR REPLACE INTO chats (email, id, title, created_at, updated_at, message_count) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (email, chat_id, chat.get('title') or 'New Chat', chat.get('createdAt') or now_iso(),
+                     time.time(), len(messages))
+                )
+                conn.executemany(
+                    "INSERT INTO messages (email, chat_id, role, message, sources, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(email, chat_id, m.get('role', 'user'), m.get('message', ''),
+                      json.dumps(m['sources']) if m.get('sources') is not None else None,
+                      m.get('timestamp') or now_iso()) for m in messages]
+                )
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'cached_users': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'writes': self.writes,
+            }
@@ -0,0 +1,170 @@
+"""
+Transcript chunking: turns caption entries into the chunks that get embedded.
+
+Three strategies, each a single forward pass over the entries with a binary
+search over their start times (or running token counts) to find where a
+chunk ends and where the next one starts:
+
+    time       fixed windows of `duration` seconds, the next one starting
+               `overlap` seconds before the window ends; what the files in
+               transcripts_json were cut with (30 s / 5 s)
+    tokens     windows of at most max_tokens tokens sharing about
+               overlap_tokens with the next, so fast and slow speech give
+               chunks of the same size for the encoder (MiniLM reads at most
+               256 word pieces)
+    sentences  time windows that end on the last sentence boundary after
+               min_duration when there is one (otherwise at `duration`), the
+               overlap starting at the beginning of a sentence where it can
+
+Chunks never split a caption entry, whose timestamps are the finest the
+transcript has, so a sentence boundary is an entry ending in . ! or ?
+(auto-generated captions have none, and then sentences behaves like time).
+Entries must be in start order. Each entry is cleaned once and each chunk's
+text joined once. No chunk lies wholly inside the one before it: after a
+chunk that reaches the last entry, or one followed by a gap too long to
+bridge from its overlap, the next chunk starts fresh.
+
+Chunks are namedtuples with times in minutes, as in the JSON files:
+
+    chunks = chunk_transcript(entries, 'tokens', max_tokens=128, overlap_tokens=16)
+    embeddings = model.encode([chunk.text for chunk in chunks])
+    json.dump([chunk._asdict() for chunk in chunks], f)
+
+Throughput on multi-hour transcripts:
+
+    python -m benchmarks.chunking_bench --hours 1 4 12
+"""
+import re
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from itertools import accumulate
+
+from passages import TokenCounter
+
+Chunk = namedtuple('Chunk', ['chunk_id', 'text', 'start_time', 'end_time'])
+
+SENTENCE_END = re.compile(r'[.!?]["”\')\]]*$')
+
+
+def clean_text(text):
+    """
+    Clean text by removing unwanted characters and formatting
+    """
+    # Drop backslashes, then collapse every run of whitespace (newlines
+    # included) into one space and strip the ends; str.split finds the same
+    # whitespace as the regex \s+ did, several times faster
+    return ' '.join(text.replace('\\', '').split())
+
+
+def prepare(entries):
+    """Start times, end times and cleaned texts of caption entries (objects with text, start, duration)."""
+    starts = [entry.start for entry in entries]
+    ends = [entry.start + entry.duration for entry in entries]
+    texts = [clean_text(entry.text) for entry in entries]
+    return starts, ends, texts
+
+
+def append_chunk(chunks, starts, ends, texts, i, j):
+    """Add entries [i, j) as the next chunk, unless they hold no text."""
+    text = ' '.join([t for t in texts[i:j] if t])
+    if text:
+        chunks.append(Chunk(len(chunks) + 1, text, round(starts[i] / 60, 2), round(ends[j - 1] / 60, 2)))
+
+
+def time_chunks(entries, duration=30, overlap=5):
+    """Windows of duration seconds; the next starts at the first entry after duration - overlap."""
+    if duration <= 0 or not 0 <= overlap < duration:
+        raise ValueError("need duration > 0 and 0 <= overlap < duration")
+    starts, ends, texts = prepare(entries)
+    chunks, i, n = [], 0, len(starts)
+    while i < n:
+        j = bisect_left(starts, starts[i] + duration, i + 1)
+        append_chunk(chunks, starts, ends, texts, i, j)
+        if j >= n:
+            break
+        i = max(bisect_left(starts, starts[i] + duration - overlap, i), i + 1)
+        if starts[j] >= starts[i] + duration:
+            # A gap: a chunk starting in the overlap could not reach past this one
+            i = j
+    return chunks
+
+
+def token_chunks(entries, max_tokens=128, overlap_tokens=16, counter=None):
+    """
+    Windows of at most max_tokens tokens (an entry longer than that is a chunk of its own).
+
+    counter is a passages.TokenCounter; without one, tokens are estimated
+    from the length of the text. Pass TokenCounter(model.tokenizer) for the
+    encoder's exact counts.
+    """
+    if max_tokens <= 0 or not 0 <= overlap_tokens < max_tokens:
+        raise ValueError("need max_tokens > 0 and 0 <= overlap_tokens < max_tokens")
+    starts, ends, texts = prepare(entries)
+    counter = counter or TokenCounter()
+    # total[k] is the number of tokens in entries [0, k)
+    total = list(accumulate(counter.count_many(texts), initial=0))
+    chunks, i, n = [], 0, len(starts)
+    while i < n:
+        j = max(bisect_right(total, total[i] + max_tokens, i + 1) - 1, i + 1)
+        append_chunk(chunks, starts, ends, texts, i, j)
+        if j >= n:
+            break
+        # Earliest entry from which the rest of the chunk fits in overlap_tokens
+        i = max(bisect_left(total, total[j] - overlap_tokens, i + 1, j), i + 1)
+        if total[j + 1] - total[i] > max_tokens:
+            # The next entry does not fit after the overlap; start with it instead
+            i = j
+    return chunks
+
+
+def sentence_chunks(entries, duration=30, overlap=5, min_duration=None):
+    """Time windows cut at a sentence end after min_duration (default duration / 2) where possible."""
+    min_duration = duration / 2 if min_duration is None else min_duration
+    if duration <= 0 or not 0 <= overlap < duration or not 0 <= min_duration <= duration:
+        raise ValueError("need duration > 0, 0 <= overlap < duration and 0 <= min_duration <= duration")
+    starts, ends, texts = prepare(entries)
+    n = len(starts)
+    # last_end[k]: last entry at or before k that ends a sentence (-1 if none)
+    # next_start[k]: first entry at or after k that starts a sentence (n if none)
+    last_end, previous = [], -1
+    for k, text in enumerate(texts):
+        if SENTENCE_END.search(text):
+            previous = k
+        last_end.append(previous)
+    next_start, following = [n] * (n + 1), n
+    for k in range(n - 1, -1, -1):
+        if k == 0 or k - 1 == last_end[k - 1]:
+            following = k
+        next_start[k] = following
+
+    chunks, i, previous_j = [], 0, 0
+    while i < n:
+        j = bisect_left(starts, starts[i] + duration, i + 1)
+        if j < n:
+            b = last_end[j - 1]
+            # The sentence must end after the previous chunk did
+            if b >= max(i, previous_j) and ends[b] - starts[i] >= min_duration:
+                j = b + 1
+        append_chunk(chunks, starts, ends, texts, i, j)
+        if j >= n:
+            break
+        previous_j = j
+        k = max(bisect_left(starts, ends[j - 1] - overlap, i + 1, j), i + 1)
+        # Begin the overlap at a sentence start inside it, else mid-sentence
+        i = next_start[k] if next_start[k] < j else k
+        if starts[j] >= starts[i] + duration:
+            # A gap: a chunk starting in the overlap could not reach past this one
+            i = j
+    return chunks
+
+
+STRATEGIES = {'time': time_chunks, 'tokens': token_chunks, 'sentences': sentence_chunks}
+
+
+def chunk_transcript(entries, strategy='time', **options):
+    """Chunk caption entries with one of STRATEGIES; options are that strategy's keyword arguments."""
+    try:
+        chunker = STRATEGIES[strategy]
+    except KeyError:
+        raise ValueError(f"Unknown chunking strategy: {strategy}")
+    return chunker(entries, **options)
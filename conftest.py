@@ -0,0 +1 @@
+"""pytest configuration: puts the repository root (the flat top-level modules) on sys.path."""
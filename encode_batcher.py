@@ -0,0 +1,80 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class EncodeBatcher:
+    """
+    Micro-batches concurrent single-question encodes into one model.encode call.
+
+    Callers block in encode(); a background thread gathers pending questions
+    for up to max_wait_ms or max_batch items, encodes them together and hands
+    each caller its own vector. The thread is started lazily (and restarted
+    after a fork), so it is safe to create the batcher before gunicorn forks.
+    """
+
+    COUNTERS = ('batches', 'items')
+
+    def __init__(self, model, max_batch=32, max_wait_ms=5):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='encode-batcher', daemon=True)
+                self._thread.start()
+
+    def encode(self, text):
+        """Encode one text, sharing a model.encode call with concurrent callers."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = self.model.encode(texts, show_progress_bar=False)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+            'pending': self._queue.qsize(),
+        }
@@ -0,0 +1,105 @@
+"""
+Model-free extractive answers built from the retrieved chunks.
+
+Used when the LLM is slow or unavailable. Produces the same HTML layout the
+Groq system prompt asks for (title, URL, intro, bullet points with timestamp
+links, conclusion), filled with the transcript sentences that best match the
+question.
+"""
+import html
+import re
+from collections import Counter
+
+SENTENCE_END = re.compile(r'(?<=[.!?])["”\']?\s+')
+WORD = re.compile(r'\w+', re.UNICODE)
+
+STOPWORDS = {
+    'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'been', 'am', 'do', 'does', 'did',
+    'what', 'which', 'who', 'whom', 'why', 'how', 'when', 'where', 'can', 'could', 'should',
+    'would', 'will', 'of', 'in', 'on', 'at', 'to', 'for', 'from', 'by', 'with', 'about',
+    'and', 'or', 'but', 'if', 'it', 'its', 'this', 'that', 'these', 'those', 'i', 'me',
+    'my', 'we', 'our', 'you', 'your', 'he', 'she', 'they', 'them', 'tell', 'explain',
+    'please', 'there', 'their', 'as', 'so', 'than', 'then', 'into', 'also', 'not', 'no',
+}
+
+
+def terms(text):
+    return [w for w in WORD.findall(text.lower()) if w not in STOPWORDS and len(w) > 1]
+
+
+def split_sentences(text):
+    return [s.strip() for s in SENTENCE_END.split(text) if len(s.strip()) > 20]
+
+
+def score_sentence(sentence, question_terms):
+    """Fraction of question terms covered, with a small bonus for repeated hits."""
+    if not question_terms:
+        return 0.0
+    counts = Counter(terms(sentence))
+    covered = sum(1 for t in question_terms if counts[t])
+    hits = sum(counts[t] for t in question_terms)
+    return covered / len(question_terms) + 0.05 * hits
+
+
+def timestamp_link(url, start_time, end_time):
+    # start/end are in minutes; the YouTube t parameter is in seconds
+    seconds = int(round(start_time * 60))
+    return (f'<a href="{html.escape(url)}&t={seconds}s" target="_blank">'
+            f'[{start_time:.2f} – {end_time:.2f} min]</a>')
+
+
+def topic_label(sentence, question_terms, position):
+    """A short bold label for a bullet: the question terms it mentions, else its position."""
+    found = [t for t in question_terms if t in set(terms(sentence))]
+    if found:
+        return ' '.join(found[:3]).title()
+    return f"Excerpt {position}"
+
+
+def extractive_answer(question, relevant_df, max_points=4):
+    """Build an HTML answer from the best sentences of the retrieved chunks."""
+    if relevant_df is None or len(relevant_df) == 0:
+        return "<p>I can only answer based on the provided video content.</p>"
+
+    question_terms = list(dict.fromkeys(terms(question)))
+    candidates = []
+    for rank, (_, row) in enumerate(relevant_df.iterrows()):
+        sentences = split_sentences(row['text']) or [row['text']]
+        for i, sentence in enumerate(sentences):
+            # Earlier (better retrieved) chunks win ties
+            score = score_sentence(sentence, question_terms) + 0.1 / (rank + 1)
+            # Quote the following sentence too, for context
+            candidates.append((score, rank, ' '.join(sentences[i:i + 2]), row))
+    candidates.sort(key=lambda c: (-c[0], c[1]))
+
+    points, used = [], set()
+    for score, rank, sentence, row in candidates:
+        key = (row['video_url'], round(float(row['start_time']), 2))
+        if key in used:
+            continue
+        used.add(key)
+        points.append((sentence, row))
+        if len(points) >= max_points:
+            break
+    # Present bullets in video order, then time order
+    points.sort(key=lambda p: (p[1]['video_url'], float(p[1]['start_time'])))
+
+    videos = list(dict.fromkeys((row['video_title'], row['video_url']) for _, row in points))
+    parts = []
+    for title, url in videos:
+        url = html.escape(url)
+        parts.append(f'<strong>Video Title:</strong> {html.escape(title)}<br>\n'
+                     f'<strong>Video URL:</strong> <a href="{url}" target="_blank">{url}</a><br>')
+    parts.append('\n<p>Here are the parts of the video transcripts that most closely match your question.</p>\n')
+    parts.append('<strong>Main Explanation:</strong>\n<ul>')
+    for position, (sentence, row) in enumerate(points, 1):
+        parts.append(
+            f'<li><strong>{html.escape(topic_label(sentence, question_terms, position))}:</strong> '
+            f'{html.escape(sentence)} '
+            f'{timestamp_link(row["video_url"], float(row["start_time"]), float(row["end_time"]))}</li>'
+        )
+    parts.append('</ul>\n')
+    parts.append('<strong>Conclusion:</strong>\n'
+                 '<p>These excerpts are quoted directly from the transcripts because the AI answer '
+                 'was not available in time; ask again for a fuller explanation.</p>')
+    return '\n'.join(parts)
@@ -0,0 +1,25 @@
+"""
+gunicorn settings, read automatically from the working directory.
+
+GUNICORN_PRELOAD=1 imports the app once in the master with
+STARTUP_MODE=preload: the encoder and the index are loaded there, before the
+workers are forked, so every worker shares those pages copy-on-write instead
+of loading its own copy. Each worker then runs its warm-up encode after the
+fork (torch's thread pools are not carried across fork).
+
+Without it, each worker imports the app itself and loads according to
+STARTUP_MODE (background by default).
+"""
+import os
+import sys
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "0") == "1"
+if preload_app:
+    os.environ["STARTUP_MODE"] = "preload"
+
+
+def post_fork(server, worker):
+    # Only a preloaded app is imported before the fork; warm it up in this worker
+    app_module = sys.modules.get('main')
+    if app_module is not None and hasattr(app_module, 'startup'):
+        app_module.startup.start()
@@ -0,0 +1,574 @@
+"""
+Concurrent, resumable transcript harvester.
+
+Downloads the English transcripts of every video in one or more playlists
+or channels and saves each one as chunked JSON (the input of
+read_chunks.py):
+
+    python harvester.py "https://www.youtube.com/playlist?list=PL..." "https://www.youtube.com/@channel" \\
+        [--output transcripts_json] [--state harvest.sqlite3] [--workers 4] [--rate 30]
+
+A bounded pool of worker threads fetches transcripts. Every request to the
+source, from any worker, first takes a token from one shared
+AdaptiveLimiter, a token bucket (llm_gateway.TokenBucket) that halves its
+rate and pauses all workers when the source blocks us (HTTP 429 or
+YouTube's IP block), then climbs back to the configured rate as requests
+succeed again. After --max-blocks blocks in a row the run stops instead of
+hammering a source that has banned the IP.
+
+Progress lives in a SQLite job state (--state): the videos of every
+playlist and whether each one is pending, done, failed or has no English
+transcript. Transcripts are written atomically, so an interrupted run
+(Ctrl-C, crash, block) loses nothing: running the same command again skips
+the playlists already listed and the videos already saved, and retries the
+rest. --status prints the state without fetching anything.
+
+Transcripts are cut with chunking.py: 30-second windows with a 5-second
+overlap by default, or --chunking tokens / sentences.
+
+--source-url points the harvester at a local fake server instead of
+YouTube (python -m benchmarks.fake_youtube), which injects latency and
+429 blocks for testing and benchmarking.
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+
+from chunking import STRATEGIES, chunk_transcript, clean_text
+from llm_gateway import TokenBucket
+
+LANGUAGES = ['en', 'en-GB', 'en-US']
+# How transcripts are cut unless --chunking says otherwise (chunking.py)
+DEFAULT_CHUNKING = {'strategy': 'time', 'duration': 30, 'overlap': 5}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    url TEXT PRIMARY KEY,
+    title TEXT,
+    video_count INTEGER NOT NULL,
+    listed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS videos (
+    video_id TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    filename TEXT,
+    updated_at REAL
+);
+"""
+# Final states are skipped on resume; pending and failed videos are (re)tried
+STATUSES = ('pending', 'done', 'no_transcript', 'failed')
+
+# One line of a transcript, as youtube_transcript_api returns it
+Entry = namedtuple('Entry', ['text', 'start', 'duration'])
+
+
+class Blocked(Exception):
+    """The source refused the request (HTTP 429 or an IP block); retry_after in seconds if it said."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class NoTranscript(Exception):
+    """The video has no English transcript."""
+
+
+def sanitize_filename(filename):
+    """Remove invalid characters from filename"""
+    return re.sub(r'[<>:"/\\|?*]', '', filename)[:200]
+
+
+def video_id_of(video_url):
+    return video_url.split("v=")[1].split("&")[0]
+
+
+def parse_source(url):
+    """('playlist', id) or ('channel', handle) for a playlist/channel URL; a bare id is a playlist."""
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+    if 'list' in query:
+        return 'playlist', query['list'][0]
+    match = re.search(r'/(@[^/?#]+|channel/[^/?#]+|c/[^/?#]+|user/[^/?#]+)', url)
+    if match:
+        return 'channel', match.group(1)
+    return 'playlist', url
+
+
+class YouTubeSource:
+    """Playlists, channels and transcripts from YouTube (pytube + youtube_transcript_api)."""
+
+    def __init__(self):
+        from youtube_transcript_api import YouTubeTranscriptApi
+        self.api = YouTubeTranscriptApi()
+
+    def list_videos(self, url):
+        """(title, [video urls]) of a playlist or channel."""
+        from pytube import Channel, Playlist
+        is_channel = parse_source(url)[0] == 'channel'
+        listing = Channel(url) if is_channel else Playlist(url)
+        try:
+            title = listing.channel_name if is_channel else listing.title
+        except Exception:
+            title = None
+        return title, list(listing.video_urls)
+
+    def transcript(self, video_id):
+        """English transcript entries, in order; raises NoTranscript or Blocked."""
+        try:
+            return self.api.fetch(video_id, languages=LANGUAGES)
+        except Exception as e:
+            name = type(e).__name__
+            if name in ('RequestBlocked', 'IpBlocked', 'TooManyRequests') or \
+                    "blocking requests from your IP" in str(e):
+                raise Blocked(str(e)[:200])
+            if name in ('NoTranscriptFound', 'TranscriptsDisabled'):
+                raise NoTranscript("No English transcript available")
+            raise
+
+    def video_info(self, video_url):
+        """(title, length in seconds) of a video."""
+        from pytube import YouTube
+        yt = YouTube(video_url)
+        return yt.title, yt.length
+
+
+class HTTPSource:
+    """
+    The same interface over the JSON API of benchmarks/fake_youtube.py:
+
+        GET /playlists/<id>, GET /channels/<handle>   {"title", "videos": [{"video_id", "url"}]}
+        GET /videos/<id>                               {"title", "duration"}
+        GET /transcripts/<id>?languages=en,en-GB       {"entries": [{"text", "start", "duration"}]}
+
+    429 is raised as Blocked (with its Retry-After) and 404 from /transcripts as NoTranscript.
+    """
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _get(self, path):
+        try:
+            with urllib.request.urlopen(self.base_url + path, timeout=self.timeout) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                retry_after = e.headers.get('Retry-After')
+                raise Blocked(f"HTTP 429 from {path}", float(retry_after) if retry_after else None)
+            if e.code == 404 and path.startswith('/transcripts/'):
+                raise NoTranscript("No English transcript available")
+            raise
+
+    def list_videos(self, url):
+        kind, name = parse_source(url)
+        listing = self._get(f"/{kind}s/{urllib.parse.quote(name, safe='')}")
+        return listing.get('title'), [video['url'] for video in listing['videos']]
+
+    def transcript(self, video_id):
+        body = self._get(f"/transcripts/{urllib.parse.quote(video_id, safe='')}?languages={','.join(LANGUAGES)}")
+        return [Entry(e['text'], e['start'], e['duration']) for e in body['entries']]
+
+    def video_info(self, video_url):
+        info = self._get(f"/videos/{urllib.parse.quote(video_id_of(video_url), safe='')}")
+        return info['title'], info['duration']
+
+
+class AdaptiveLimiter:
+    """
+    One token bucket shared by all workers, with adaptive backoff.
+
+    blocked() halves the rate (down to min_rate) and pauses every worker for
+    the source's Retry-After, or cooldown seconds doubling with each block in
+    a row; requests that were in flight and fail during that pause count as
+    the same block. Each success adds back a twentieth of the configured rate.
+    """
+
+    def __init__(self, rate, burst=1, min_rate=None, cooldown=120.0, max_pause=1800.0):
+        self.max_rate = rate
+        self.min_rate = min_rate or rate / 16
+        self.cooldown = cooldown
+        self.max_pause = max_pause
+        self.bucket = TokenBucket(rate, burst)
+        self.paused_until = 0.0
+        self.blocks = 0
+        self.consecutive_blocks = 0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def acquire(self, stop=None):
+        """Wait for a token; returns False if stop (a threading.Event) was set meanwhile."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            pause = self.paused_until - time.monotonic()
+            if pause > 0:
+                stop.wait(pause)
+                continue
+            wait = self.bucket.reserve(1)
+            if wait > 0 and stop.wait(wait):
+                self.bucket.refund(1)
+                break
+            if self.paused_until <= time.monotonic():
+                return True
+            # A block paused everyone while this worker waited; queue up again
+            self.bucket.refund(1)
+        return False
+
+    def succeeded(self):
+        with self._lock:
+            self.consecutive_blocks = 0
+            self.bucket.set_rate(min(self.max_rate, self.bucket.rate + self.max_rate / 20))
+
+    def blocked(self, retry_after=None):
+        """Slow down after a block; returns the pause in seconds."""
+        with self._lock:
+            self.blocks += 1
+            now = time.monotonic()
+            if now < self.paused_until:
+                # Requests already in flight when the block began; it is being handled
+                return self.paused_until - now
+            self.consecutive_blocks += 1
+            self.bucket.set_rate(max(self.min_rate, self.bucket.rate / 2))
+            pause = retry_after if retry_after is not None else \
+                self.cooldown * 2 ** (self.consecutive_blocks - 1)
+            pause = min(pause, self.max_pause)
+            self.paused_until = now + pause
+            return pause
+
+
+class JobState:
+    """Playlists listed and per-video progress of a harvest, in SQLite."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def listed(self, url):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM sources WHERE url = ?", (url,)).fetchone() is not None
+
+    def add_source(self, url, title, video_urls):
+        """Record a playlist's videos; returns how many were new. A video already known keeps its state."""
+        now = time.time()
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO videos (video_id, source, position, url, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(video_id_of(u), url, i, u, now) for i, u in enumerate(video_urls, 1)])
+            added = conn.total_changes - before
+            conn.execute("INSERT OR REPLACE INTO sources (url, title, video_count, listed_at) VALUES (?, ?, ?, ?)",
+                         (url, title, len(video_urls), now))
+        return added
+
+    def todo(self, max_attempts=None):
+        """Videos still to fetch (pending, or failed fewer than max_attempts times), in playlist order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT v.*, s.rowid AS source_order FROM videos v JOIN sources s ON s.url = v.source "
+                "WHERE v.status = 'pending' OR (v.status = 'failed' AND v.attempts < ?) "
+                "ORDER BY source_order, v.position",
+                (max_attempts if max_attempts is not None else 1 << 30,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def update(self, video_id, status, error=None, filename=None, attempt=True):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE videos SET status = ?, error = ?, filename = COALESCE(?, filename), "
+                "attempts = attempts + ?, updated_at = ? WHERE video_id = ?",
+                (status, error, filename, int(attempt), time.time(), video_id))
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM videos GROUP BY status").fetchall()
+        return {**{status: 0 for status in STATUSES}, **{status: n for status, n in rows}}
+
+    def videos(self, status):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(
+                "SELECT * FROM videos WHERE status = ? ORDER BY source, position", (status,))]
+
+    def close(self):
+        self._conn.close()
+
+
+def write_transcript(output_dir, job, entries, title, duration, chunking=DEFAULT_CHUNKING):
+    """Chunk a transcript and save it as JSON (atomically); returns (filename, chunk count)."""
+    options = {k: v for k, v in chunking.items() if k != 'strategy'}
+    chunks = [chunk._asdict() for chunk in chunk_transcript(entries, chunking['strategy'], **options)]
+    full_text = clean_text(" ".join([chunk["text"] for chunk in chunks]))
+    title = sanitize_filename(title) if title else "Unknown_Title"
+    output_data = {
+        "video_id": job['video_id'],
+        "video_url": job['url'],
+        "video_title": title,
+        "duration_minutes": round(duration / 60, 2) if isinstance(duration, (int, float)) else "Unknown",
+        "total_chunks": len(chunks),
+        "chunking": chunking,
+        **({"chunk_duration_seconds": options['duration'], "overlap_seconds": options['overlap']}
+           if 'duration' in options else {}),
+        "language": "English",
+        "chunks": chunks,
+        "full_text": full_text
+    }
+    filename = f"{job['position']:02d}_{title}_{job['video_id']}.json"
+    path = Path(output_dir) / filename
+    tmp = path.with_name(f".{filename}.tmp-{os.getpid()}-{threading.get_ident()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(output_data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+    return filename, len(chunks)
+
+
+class Harvester:
+    """Lists the sources, then fetches every video still to do on a pool of worker threads."""
+
+    def __init__(self, source, state, output_dir, limiter, workers=4, max_attempts=3, max_blocks=5,
+                 chunking=DEFAULT_CHUNKING):
+        self.source = source
+        self.state = state
+        self.output_dir = output_dir
+        self.chunking = chunking
+        self.limiter = limiter
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.max_blocks = max_blocks
+        self.stop = threading.Event()
+        self.stop_reason = None
+        self._lock = threading.Lock()
+        self._queue = []
+        self._in_flight = 0
+        self.results = {'done': 0, 'no_transcript': 0, 'failed': 0, 'blocked': 0}
+
+    def _call(self, fn, *args):
+        """Call the source once under the shared limiter; Blocked slows every worker down."""
+        if not self.limiter.acquire(self.stop):
+            raise InterruptedError("harvest stopped")
+        try:
+            result = fn(*args)
+        except Blocked as e:
+            pause = self.limiter.blocked(e.retry_after)
+            with self._lock:
+                self.results['blocked'] += 1
+            print(f"🛑 Blocked ({e}); all workers pause {pause:.0f}s, "
+                  f"rate now {self.limiter.rate * 60:.1f}/min")
+            if self.limiter.consecutive_blocks >= self.max_blocks:
+                self.stop_reason = f"blocked {self.limiter.consecutive_blocks} times in a row"
+                self.stop.set()
+            raise
+        except NoTranscript:
+            self.limiter.succeeded()
+            raise
+        self.limiter.succeeded()
+        return result
+
+    def list_sources(self, urls, refresh=False):
+        for url in urls:
+            if self.state.listed(url) and not refresh:
+                print(f"📋 {url}: already listed")
+                continue
+            while True:
+                try:
+                    title, video_urls = self._call(self.source.list_videos, url)
+                    break
+                except Blocked:
+                    if self.stop.is_set():
+                        return
+                except InterruptedError:
+                    return
+                except Exception as e:
+                    title, video_urls = None, None
+                    print(f"❌ Could not list {url}: {str(e)[:150]}")
+                    break
+            if video_urls is None:
+                continue
+            added = self.state.add_source(url, title, video_urls)
+            print(f"📋 {title or url}: {len(video_urls)} videos ({added} new)")
+
+    def _next(self):
+        with self._lock:
+            if self._queue:
+                self._in_flight += 1
+                return self._queue.pop(0)
+            return None if not self._in_flight else False
+
+    def _finish(self, job=None):
+        with self._lock:
+            self._in_flight -= 1
+            if job is not None:
+                self._queue.append(job)
+
+    def _work(self):
+        while not self.stop.is_set():
+            job = self._next()
+            if job is None:
+                return
+            if job is False:
+                # Others are still working and may put a blocked video back
+                self.stop.wait(0.05)
+                continue
+            retry = None
+            try:
+                self._fetch(job)
+            except Blocked:
+                retry = job
+            except InterruptedError:
+                pass
+            except NoTranscript:
+                self.state.update(job['video_id'], 'no_transcript')
+                self._count('no_transcript')
+                print(f"⚠️  {job['video_id']}: no English transcript")
+            except Exception as e:
+                self.state.update(job['video_id'], 'failed', error=f"{type(e).__name__}: {e}"[:300])
+                self._count('failed')
+                print(f"❌ {job['video_id']}: {str(e)[:150]}")
+            finally:
+                self._finish(retry)
+
+    def _count(self, status):
+        with self._lock:
+            self.results[status] += 1
+
+    def _fetch(self, job):
+        entries = self._call(self.source.transcript, job['video_id'])
+        # Title and length are optional, so another failure here keeps the
+        # transcript; a block (or a stop) puts the video back in the queue
+        # instead of saving it as Unknown_Title for good
+        title, duration = None, "Unknown"
+        try:
+            title, duration = self._call(self.source.video_info, job['url'])
+        except (Blocked, InterruptedError):
+            raise
+        except Exception:
+            pass
+        filename, n_chunks = write_transcript(self.output_dir, job, entries, title, duration, self.chunking)
+        self.state.update(job['video_id'], 'done', filename=filename)
+        self._count('done')
+        print(f"✅ {job['video_id']}: {n_chunks} chunks ({len(entries)} entries) -> {filename}")
+
+    def run(self, urls, refresh=False, limit=None):
+        """Harvest urls; returns a summary dict. Safe to call again after an interruption."""
+        start = time.perf_counter()
+        Path(self.output_dir).mkdir(parents=True, exist_ok=True)
+        self.list_sources(urls, refresh=refresh)
+        self._queue = self.state.todo(self.max_attempts)[:limit]
+        total = len(self._queue)
+        print(f"🔍 {total} videos to fetch on {self.workers} workers "
+              f"(rate {self.limiter.max_rate * 60:.1f}/min)\n")
+        threads = [threading.Thread(target=self._work, name=f'harvest-{i}', daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stop_reason = 'interrupted'
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+        seconds = time.perf_counter() - start
+        return {
+            'videos': total,
+            **self.results,
+            'remaining': len(self.state.todo(self.max_attempts)),
+            'seconds': round(seconds, 2),
+            'videos_per_second': round(self.results['done'] / seconds, 3) if seconds else 0.0,
+            'final_rate_per_minute': round(self.limiter.rate * 60, 2),
+            'stopped': self.stop_reason,
+            'state': self.state.counts(),
+        }
+
+
+def print_status(state):
+    counts = state.counts()
+    print(f"✅ done {counts['done']}, ⏳ pending {counts['pending']}, "
+          f"⚠️  no English transcript {counts['no_transcript']}, ❌ failed {counts['failed']}")
+    for video in state.videos('failed')[:10]:
+        print(f"  - {video['video_id']} ({video['attempts']} attempts): {video['error']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('urls', nargs='*', help='playlist or channel URLs')
+    parser.add_argument('--output', default='transcripts_json', help='directory for the transcript JSON files')
+    parser.add_argument('--state', default='harvest.sqlite3', help='job state database (resume from it)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=30, help='requests per minute across all workers')
+    parser.add_argument('--burst', type=int, default=2)
+    parser.add_argument('--cooldown', type=float, default=120, help='seconds to pause after a block without Retry-After')
+    parser.add_argument('--max-blocks', type=int, default=5, help='stop after this many blocks in a row')
+    parser.add_argument('--max-attempts', type=int, default=3, help='attempts per video before it is left failed')
+    parser.add_argument('--refresh', action='store_true', help='list playlists again to pick up new videos')
+    parser.add_argument('--limit', type=int, default=None, help='fetch at most this many videos this run')
+    parser.add_argument('--chunking', choices=sorted(STRATEGIES), default='time')
+    parser.add_argument('--chunk-seconds', type=float, default=30, help='time and sentences chunking')
+    parser.add_argument('--overlap-seconds', type=float, default=5)
+    parser.add_argument('--chunk-tokens', type=int, default=128, help='tokens chunking')
+    parser.add_argument('--overlap-tokens', type=int, default=16)
+    parser.add_argument('--source-url', default=None, help='fake server base URL instead of YouTube')
+    parser.add_argument('--status', action='store_true', help='print the job state and exit')
+    args = parser.parse_args(argv)
+
+    state = JobState(args.state)
+    try:
+        if args.status:
+            print_status(state)
+            return None
+        source = HTTPSource(args.source_url) if args.source_url else YouTubeSource()
+        limiter = AdaptiveLimiter(args.rate / 60, burst=args.burst, cooldown=args.cooldown)
+        if args.chunking == 'tokens':
+            chunking = {'strategy': 'tokens', 'max_tokens': args.chunk_tokens, 'overlap_tokens': args.overlap_tokens}
+        else:
+            chunking = {'strategy': args.chunking, 'duration': args.chunk_seconds, 'overlap': args.overlap_seconds}
+        harvester = Harvester(source, state, args.output, limiter, workers=args.workers,
+                              max_attempts=args.max_attempts, max_blocks=args.max_blocks, chunking=chunking)
+        summary = harvester.run(args.urls, refresh=args.refresh, limit=args.limit)
+        print("\n" + "=" * 80)
+        print(f"📊 {summary['done']} saved, {summary['no_transcript']} without English transcript, "
+              f"{summary['failed']} failed, {summary['blocked']} blocks in {summary['seconds']}s "
+              f"({summary['videos_per_second']} videos/s)")
+        print_status(state)
+        if summary['stopped']:
+            print(f"\n🛑 Stopped: {summary['stopped']}. Run the same command again to resume "
+                  f"({summary['remaining']} videos left).")
+        print(f"\n📁 JSON transcripts in: {Path(args.output).absolute()}")
+        return summary
+    finally:
+        state.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Hot reloading of the serving index, without a restart.
+
+read_chunks.py publishes every rebuilt index as a new generation directory
+and repoints the index symlink (index_store.publish_index). An IndexReloader
+notices the new version, either by polling every `interval` seconds or when
+reload() is called (POST /admin/reload), opens and warms it up in that
+background thread while queries keep running on the old one, and then makes
+it live with a single assignment.
+
+A query reads `current` once and uses that snapshot for its search and its
+row lookups, so requests in flight during a swap finish on the index they
+started with and never mix row numbers of two versions. The old engine (its
+memory maps, IVF lists, BM25 postings) is freed when the last of those
+requests drops it; `retired_in_use` in stats() counts the ones still held.
+
+Like Startup, the polling thread belongs to one process: watch() starts it
+in each gunicorn worker after the fork.
+"""
+import os
+import threading
+import time
+import weakref
+from collections import namedtuple
+
+from index_store import index_version
+
+LoadedIndex = namedtuple('LoadedIndex', ['engine', 'version', 'path', 'loaded_at'])
+
+
+class IndexReloader:
+    """
+    Holds the live RetrievalEngine and swaps in a new one when the index changes.
+
+    open_engine(path) builds an engine, locate() returns the path that should
+    be served right now (the resolved generation directory, or an embeddings
+    file) and warm_up(engine), if given, runs on a new engine before it goes
+    live. interval=0 disables polling; reload() still works.
+    """
+
+    COUNTERS = ('reloads', 'failures')
+
+    def __init__(self, open_engine, locate, warm_up=None, interval=10.0):
+        self._open = open_engine
+        self._locate = locate
+        self._warm_up = warm_up
+        self.interval = interval
+        self.current = None  # LoadedIndex; replaced, never modified
+        self._load_lock = threading.Lock()  # one load at a time
+        self._watch_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._seen = None  # new version seen on the last poll, loaded once it holds still
+        self._failed = None  # version whose load failed; polls skip it until it changes
+        self._retired = []  # weak references to engines swapped out
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_reload_seconds = None
+        self.previous_version = None
+
+    @property
+    def version(self):
+        current = self.current
+        return current.version if current is not None else None
+
+    def load(self):
+        """Open the index and make it live without warming it up (the first load, at startup)."""
+        return self.reload(force=True, warm_up=False)
+
+    def reload(self, force=False, warm_up=True):
+        """
+        Open the index locate() points at and make it live, unless it is the live version already.
+
+        Returns {'reloaded', 'version', 'previous_version', 'seconds'}. If the
+        new index fails to open or warm up the exception is raised and the
+        old one stays live.
+        """
+        with self._load_lock:
+            path = self._locate()
+            version = index_version(path)
+            previous = self.current
+            if not force and previous is not None and previous.version == version:
+                return {'reloaded': False, 'version': version}
+            start = time.perf_counter()
+            try:
+                engine = self._open(path)
+                if warm_up and self._warm_up is not None:
+                    self._warm_up(engine)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                self._failed = version
+                raise
+            self.current = LoadedIndex(engine, version, path, time.time())
+            seconds = round(time.perf_counter() - start, 3)
+            self._failed = None
+            self.last_error = None
+            if previous is not None:
+                self._retired = [ref for ref in self._retired if ref() is not None]
+                self._retired.append(weakref.ref(previous.engine))
+                self.reloads += 1
+                self.last_reload_seconds = seconds
+                self.previous_version = previous.version
+                print(f"Index reloaded in {seconds:.2f}s: {previous.version} -> {version}")
+            return {'reloaded': True, 'version': version,
+                    'previous_version': previous.version if previous is not None else None,
+                    'seconds': seconds}
+
+    def check(self):
+        """
+        One poll: reload once a new version has been seen on two polls in a row.
+
+        Waiting for a second look keeps an index that is being rewritten in
+        place from being opened half-way (publish_index swaps in finished
+        generations, which only cost one extra interval). Returns reload()'s
+        summary, or None when nothing was loaded.
+        """
+        try:
+            version = index_version(self._locate())
+        except OSError as e:
+            print(f"Index check failed: {e}")
+            return None
+        if version == self.version or version == self._failed:
+            self._seen = None
+            return None
+        if version != self._seen:
+            self._seen = version
+            return None
+        self._seen = None
+        try:
+            return self.reload()
+        except Exception:
+            print(f"Index reload failed, still serving {self.version}: {self.last_error}")
+            return None
+
+    def watch(self):
+        """Start polling in this process, unless it already is or interval is 0."""
+        if self.interval <= 0:
+            return
+        with self._watch_lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._poll, name='index-reload', daemon=True)
+            self._thread.start()
+
+    def _poll(self):
+        while True:
+            time.sleep(self.interval)
+            self.check()
+
+    def stats(self):
+        current = self.current
+        self._retired = [ref for ref in self._retired if ref() is not None]
+        return {
+            'version': current.version if current is not None else None,
+            'path': current.path if current is not None else None,
+            'loaded_seconds_ago': round(time.time() - current.loaded_at, 1) if current is not None else None,
+            'reloads': self.reloads,
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'last_reload_seconds': self.last_reload_seconds,
+            'previous_version': self.previous_version,
+            'retired_in_use': len(self._retired),
+            'watch_interval_seconds': self.interval,
+        }
@@ -0,0 +1,294 @@
+"""
+On-disk chunk index shared by every gunicorn worker.
+
+Layout of an index directory:
+
+    manifest.json   format version, vector count and dimension
+    vectors.npy     float32 (N, D) matrix of L2-normalized embeddings
+    chunks.npy      structured array with one record per chunk
+    texts.bin       UTF-8 chunk texts, addressed by offset/length in chunks.npy
+    videos.json     one entry per video (id, title, url, duration)
+
+Everything except videos.json is opened with np.memmap, so the large blocks
+live in the OS page cache once and are shared by all worker processes.
+
+Convert an existing embeddings.joblib with:
+
+    python -m index_store embeddings.joblib index
+
+read_chunks.py builds each new index in a generation directory next to the
+live one (index.gen-<ns>) and publishes it with publish_index(), which
+repoints the index symlink atomically; running servers pick it up through
+index_reload.py.
+"""
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import joblib
+
+from retrieval import normalize_rows
+
+FORMAT_VERSION = 1
+
+CHUNK_DTYPE = np.dtype([
+    ('video_idx', '<i4'),
+    ('chunk_id', '<i4'),
+    ('start_time', '<f4'),
+    ('end_time', '<f4'),
+    ('text_offset', '<i8'),
+    ('text_length', '<i4'),
+])
+
+VIDEO_FIELDS = ['video_id', 'video_title', 'video_url', 'duration_minutes']
+
+
+class IndexWriter:
+    """
+    Writes an index directory in pieces, so the corpus is never in memory at once.
+
+    vectors.npy and chunks.npy are preallocated for count rows and filled
+    through memory maps, and texts.bin is appended to. add() appends rows in
+    order; their vectors can be given then or set later with set_vectors()
+    (for instance once an encode batch has finished).
+    """
+
+    def __init__(self, directory, count, dim):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.count = count
+        self.vectors = np.lib.format.open_memmap(os.path.join(directory, 'vectors.npy'), mode='w+',
+                                                 dtype=np.float32, shape=(count, dim))
+        self.chunks = np.lib.format.open_memmap(os.path.join(directory, 'chunks.npy'), mode='w+',
+                                                dtype=CHUNK_DTYPE, shape=(count,))
+        self._texts = open(os.path.join(directory, 'texts.bin'), 'wb')
+        self._text_offset = 0
+        self._video_idx = {}
+        self.videos = []
+        self.rows = 0
+
+    def add(self, df, vectors=None):
+        """Append the rows of a chunk DataFrame (and optionally their vectors); returns the first row number."""
+        first, last = self.rows, self.rows + len(df)
+        if last > self.count:
+            raise ValueError(f"index was sized for {self.count} rows")
+        for video in df[VIDEO_FIELDS].drop_duplicates('video_id').to_dict(orient='records'):
+            if video['video_id'] not in self._video_idx:
+                self._video_idx[video['video_id']] = len(self.videos)
+                self.videos.append(video)
+
+        chunks = np.zeros(len(df), dtype=CHUNK_DTYPE)
+        chunks['video_idx'] = [self._video_idx[v] for v in df['video_id']]
+        chunks['chunk_id'] = df['chunk_id'].to_numpy()
+        chunks['start_time'] = df['start_time'].to_numpy()
+        chunks['end_time'] = df['end_time'].to_numpy()
+        for i, text in enumerate(df['text']):
+            encoded = text.encode('utf-8')
+            self._texts.write(encoded)
+            chunks['text_offset'][i] = self._text_offset
+            chunks['text_length'][i] = len(encoded)
+            self._text_offset += len(encoded)
+        self.chunks[first:last] = chunks
+
+        if vectors is not None:
+            self.set_vectors(slice(first, last), vectors)
+        self.rows = last
+        return first
+
+    def set_vectors(self, rows, vectors):
+        """Store (normalized) vectors for rows, a slice or a list of row numbers."""
+        self.vectors[rows] = normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+    def close(self):
+        """Finish the files and write videos.json and manifest.json; returns the manifest."""
+        if self.rows != self.count:
+            raise ValueError(f"{self.rows} rows written, {self.count} expected")
+        self._texts.close()
+        self.vectors.flush()
+        self.chunks.flush()
+        with open(os.path.join(self.directory, 'videos.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.videos, f, ensure_ascii=False)
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'count': int(self.vectors.shape[0]),
+            'dim': int(self.vectors.shape[1]),
+        }
+        with open(os.path.join(self.directory, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+
+def write_index(df, directory, vectors=None):
+    """
+    Write a chunk DataFrame (as produced by read_chunks.py) to an index directory.
+
+    If vectors is None they are taken from the DataFrame's 'embedding' column.
+    """
+    if vectors is None:
+        vectors = np.vstack(df['embedding'].values)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    writer = IndexWriter(directory, len(df), vectors.shape[1])
+    writer.add(df, vectors)
+    return writer.close()
+
+
+def new_generation(directory):
+    """An empty sibling directory to build the next version of the index in."""
+    path = f"{os.path.normpath(directory)}.gen-{time.time_ns()}"
+    os.makedirs(path)
+    return path
+
+
+def publish_index(generation, directory, keep=2):
+    """
+    Make the index built in generation live at directory, atomically.
+
+    directory becomes a symlink to generation, swapped in with os.replace,
+    so a reader opening directory sees the old index or the new one, never a
+    mix. The newest `keep` generations are kept and older ones deleted
+    (workers that still map their files keep them until they reopen).
+
+    A plain directory written by write_index is first moved aside as a
+    generation older than the new one. A directory cannot be swapped for a
+    symlink in one rename, so during that first publish there is a moment
+    (between two back-to-back renames) with no index path at all: do it
+    while no server is starting up, e.g. before deploying the symlinked
+    layout. Running servers only skip a reload check.
+    """
+    directory = os.path.normpath(directory)
+    link = f"{directory}.link-{os.getpid()}"
+    os.symlink(os.path.basename(os.path.normpath(generation)), link)
+    if os.path.isdir(directory) and not os.path.islink(directory):
+        os.replace(directory, _aside_name(directory, generation))
+    os.replace(link, directory)
+
+    current = os.path.realpath(directory)
+    generations = sorted(glob.glob(f"{directory}.gen-*"), key=_generation_number)
+    for path in generations[:-keep] if keep else generations:
+        if os.path.realpath(path) != current:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _generation_number(path):
+    return int(path.rsplit('-', 1)[1])
+
+
+def _aside_name(directory, generation):
+    """Generation name for a plain index directory, older than the generation replacing it."""
+    number = os.stat(directory).st_mtime_ns
+    try:
+        number = min(number, _generation_number(os.path.normpath(generation)) - 1)
+    except ValueError:
+        pass
+    while os.path.exists(f"{directory}.gen-{number}"):
+        number -= 1
+    return f"{directory}.gen-{number}"
+
+
+def convert_joblib(joblib_path, directory):
+    """Convert a pickled embeddings DataFrame into the index format."""
+    return write_index(joblib.load(joblib_path), directory)
+
+
+def index_exists(directory):
+    return os.path.exists(os.path.join(directory, 'manifest.json'))
+
+
+def corpus_fingerprint(path):
+    """
+    Cheap version string for an index directory or embeddings file.
+
+    Built from modification time and size, so it changes whenever the corpus
+    is rewritten without having to read the data.
+    """
+    if os.path.isdir(path):
+        files = [os.path.join(path, name) for name in ('manifest.json', 'vectors.npy', 'chunks.npy')]
+    else:
+        files = [path]
+    parts = []
+    for name in files:
+        try:
+            st = os.stat(name)
+        except FileNotFoundError:
+            continue
+        parts.append(f"{st.st_mtime_ns:x}-{st.st_size:x}")
+    return ':'.join(parts)
+
+
+def index_version(path):
+    """
+    Version label of the index (or embeddings file) served from path.
+
+    The name of the generation directory the index symlink points to, plus a
+    short hash of its corpus_fingerprint so that rewriting the files in place
+    changes it too, e.g. index.gen-1760000000000000000@3fa2c1d9e0.
+    """
+    path = os.path.realpath(path)
+    digest = hashlib.sha1(corpus_fingerprint(path).encode('utf-8')).hexdigest()[:10]
+    return f"{os.path.basename(path)}@{digest}"
+
+
+class ChunkTable:
+    """Memory-mapped chunk metadata; rows are materialized only when requested."""
+
+    def __init__(self, directory):
+        self.chunks = np.load(os.path.join(directory, 'chunks.npy'), mmap_mode='r')
+        texts_path = os.path.join(directory, 'texts.bin')
+        # np.memmap refuses empty files, which an empty corpus produces
+        if os.path.getsize(texts_path):
+            self.texts = np.memmap(texts_path, dtype=np.uint8, mode='r')
+        else:
+            self.texts = np.empty(0, dtype=np.uint8)
+        with open(os.path.join(directory, 'videos.json'), encoding='utf-8') as f:
+            self.videos = json.load(f)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @property
+    def num_videos(self):
+        return len(self.videos)
+
+    def text(self, i):
+        record = self.chunks[i]
+        start = int(record['text_offset'])
+        return bytes(self.texts[start:start + int(record['text_length'])]).decode('utf-8')
+
+    def take(self, indices):
+        """Return a DataFrame with the same columns read_chunks.py used to write."""
+        rows = []
+        for i in indices:
+            record = self.chunks[i]
+            video = self.videos[int(record['video_idx'])]
+            rows.append({
+                'chunk_id': int(record['chunk_id']),
+                'text': self.text(i),
+                'start_time': round(float(record['start_time']), 2),
+                'end_time': round(float(record['end_time']), 2),
+                **video,
+            })
+        return pd.DataFrame(rows, index=list(indices))
+
+
+def open_index(directory):
+    """Open an index directory, returning (vectors memmap, ChunkTable, manifest)."""
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported index format: {manifest.get('format_version')}")
+    vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r')
+    return vectors, ChunkTable(directory), manifest
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python -m index_store <embeddings.joblib> <index_dir>")
+        sys.exit(1)
+    manifest = convert_joblib(sys.argv[1], sys.argv[2])
+    print(f"Wrote {manifest['count']} vectors ({manifest['dim']} dims) to {sys.argv[2]}")
@@ -0,0 +1,138 @@
+"""
+Inverted-file (IVF) approximate nearest-neighbour index in pure NumPy.
+
+The corpus vectors are clustered with spherical k-means. Each chunk is
+assigned to its closest centroid, and the assignments are stored as one
+CSR-style posting array (ivf_offsets.npy + ivf_ids.npy). A query scores the
+centroids, visits the nprobe closest lists and only scores the vectors in
+those lists exactly.
+
+Build it for an existing index directory with:
+
+    python -m ivf_index index --n-lists 256
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from retrieval import normalize_rows, top_k_indices
+
+# Cap on the k-means training sample, so training memory stays flat on large corpora
+MAX_SAMPLE = 65536
+
+
+def spherical_kmeans(vectors, n_lists, iterations=20, sample_size=None, seed=0):
+    """
+    Cluster unit vectors by cosine similarity and return float32 centroids.
+
+    Training runs on a random sample (default 256 points per list, at most
+    MAX_SAMPLE) so build time and memory stay bounded on very large corpora.
+    """
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    n_lists = max(1, min(n_lists, n))
+    sample_size = sample_size or min(256 * n_lists, MAX_SAMPLE)
+    if n > sample_size:
+        sample = np.asarray(vectors[np.sort(rng.choice(n, sample_size, replace=False))], dtype=np.float32)
+    else:
+        sample = np.asarray(vectors, dtype=np.float32)
+
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        counts = np.bincount(assignment, minlength=n_lists)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty lists with random points so every list is used
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids.astype(np.float32)
+
+
+def assign(vectors, centroids, batch_size=8192):
+    """Return the closest centroid for every vector, in batches."""
+    assignment = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], batch_size):
+        block = np.asarray(vectors[start:start + batch_size], dtype=np.float32)
+        assignment[start:start + batch_size] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+
+class IVFIndex:
+    """Centroids plus posting lists over the rows of the corpus matrix."""
+
+    def __init__(self, centroids, offsets, ids, nprobe=8):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, vectors, n_lists=None, iterations=20, seed=0):
+        """Train centroids on (normalized) vectors and build the posting lists."""
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(vectors.shape[0])))
+        centroids = spherical_kmeans(vectors, n_lists, iterations=iterations, seed=seed)
+        assignment = assign(vectors, centroids)
+        ids = np.argsort(assignment, kind='stable').astype(np.int64)
+        counts = np.bincount(assignment, minlength=len(centroids))
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(centroids, offsets, ids)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def save(self, directory):
+        np.save(os.path.join(directory, 'ivf_centroids.npy'), self.centroids)
+        np.save(os.path.join(directory, 'ivf_offsets.npy'), self.offsets)
+        np.save(os.path.join(directory, 'ivf_ids.npy'), self.ids)
+        with open(os.path.join(directory, 'ivf.json'), 'w') as f:
+            json.dump({'n_lists': self.n_lists, 'count': int(len(self.ids))}, f, indent=2)
+
+    @classmethod
+    def load(cls, directory, nprobe=8):
+        return cls(
+            np.load(os.path.join(directory, 'ivf_centroids.npy')),
+            np.load(os.path.join(directory, 'ivf_offsets.npy')),
+            np.load(os.path.join(directory, 'ivf_ids.npy'), mmap_mode='r'),
+            nprobe=nprobe,
+        )
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, 'ivf.json'))
+
+    def candidates(self, query, nprobe):
+        """Return the chunk ids stored in the nprobe lists closest to the query."""
+        lists = top_k_indices(self.centroids @ query, nprobe)
+        return np.concatenate([self.ids[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+
+    def search(self, matrix, query, top_k=7, nprobe=None):
+        """Score only the candidate rows of matrix and return (indices, scores)."""
+        ids = np.sort(self.candidates(query, nprobe or self.nprobe))
+        scores = np.asarray(matrix[ids]) @ query
+        best = top_k_indices(scores, top_k)
+        return ids[best], scores[best]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('index_dir')
+    parser.add_argument('--n-lists', type=int, default=None)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    vectors = np.load(os.path.join(args.index_dir, 'vectors.npy'), mmap_mode='r')
+    ivf = IVFIndex.build(vectors, n_lists=args.n_lists, iterations=args.iterations)
+    ivf.save(args.index_dir)
+    print(f"Built IVF index with {ivf.n_lists} lists over {len(ivf.ids)} vectors in {args.index_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,357 @@
+"""
+Admission control and retry policy for calls to the Groq API.
+
+Every LLM call goes through an LLMGateway, which provides:
+
+    - a bounded number of concurrent upstream calls (slots)
+    - a bounded FIFO queue in front of them with a maximum wait; a caller
+      that finds a free slot never queues, and when the queue is full, or
+      the wait would exceed the limit, callers are rejected at once with
+      GatewayRejected (served as HTTP 503 + Retry-After)
+    - token-bucket rate limiting on requests/minute and tokens/minute to
+      stay inside the Groq quota
+    - a per-request deadline shared by queueing, retries and the call itself
+    - jittered exponential backoff retries for 429, 5xx, timeouts and
+      connection errors, honouring the server's Retry-After header
+
+The sync app uses admit()/retrying()/call(); the ASGI app uses their async
+counterparts admit_async()/retrying_async()/call_async(), which share the
+same slots, buckets and counters. A released slot is handed straight to the
+first queued caller, thread or coroutine; coroutines wait on a future of
+their own event loop, so no thread is tied up per waiter. The limits are
+per process (see WEB_CONCURRENCY in main.py).
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+
+class GatewayRejected(Exception):
+    """The gateway refused the request before calling upstream (overload)."""
+
+    def __init__(self, reason, retry_after=1.0):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at rate_per_second."""
+
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Take amount tokens, possibly going into debt; return seconds to wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= min(amount, self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+    def set_rate(self, rate_per_second):
+        """Change the refill rate from now on (tokens already accrued are kept)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate_per_second
+
+
+class ThreadWaiter:
+    """A thread queued for a slot; granted is set, under the gateway lock, when one is handed to it."""
+
+    def __init__(self):
+        self.granted = False
+        self._event = threading.Event()
+
+    def wake(self):
+        self._event.set()
+
+    def wait(self, timeout):
+        self._event.wait(timeout)
+
+
+class TaskWaiter:
+    """A coroutine queued for a slot, woken through its event loop."""
+
+    def __init__(self):
+        self.granted = False
+        self._loop = asyncio.get_running_loop()
+        self._future = self._loop.create_future()
+
+    def wake(self):
+        try:
+            self._loop.call_soon_threadsafe(self._set)
+        except RuntimeError:
+            pass  # The loop is closed; the waiter hands the slot back when it leaves
+
+    def _set(self):
+        if not self._future.done():
+            self._future.set_result(None)
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._future, timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+def status_code_of(exc):
+    code = getattr(exc, 'status_code', None)
+    if code is None and getattr(exc, 'response', None) is not None:
+        code = getattr(exc.response, 'status_code', None)
+    return code
+
+
+def is_retryable(exc):
+    """429, 5xx, timeouts and connection errors are worth retrying."""
+    code = status_code_of(exc)
+    if code is not None:
+        return code == 429 or code >= 500
+    name = type(exc).__name__
+    return 'Timeout' in name or 'Connection' in name
+
+
+def retry_after_of(exc):
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMGateway:
+    """Thread-safe admission control, rate limiting and retries for one upstream."""
+
+    COUNTERS = ('calls', 'rejected', 'retries', 'failures')
+
+    def __init__(self, max_concurrency=8, max_queue=32, max_queue_wait=5.0,
+                 requests_per_minute=30, tokens_per_minute=6000, deadline=30.0,
+                 max_retries=2, backoff_base=0.5, backoff_max=8.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._free = max_concurrency
+        self._waiters = deque()
+        # Quotas are per minute, so a full minute's budget may be spent in a burst
+        self._request_bucket = TokenBucket(requests_per_minute / 60.0, requests_per_minute) \
+            if requests_per_minute else None
+        self._token_bucket = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) \
+            if tokens_per_minute else None
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.active = 0
+        self.calls = 0
+        self.rejected = 0
+        self.retries = 0
+        self.failures = 0
+
+    def stats(self):
+        return {
+            'active': self.active,
+            'waiting': self.waiting,
+            'calls': self.calls,
+            'rejected': self.rejected,
+            'retries': self.retries,
+            'failures': self.failures,
+        }
+
+    def _reject(self, reason, retry_after):
+        with self._lock:
+            self.rejected += 1
+        raise GatewayRejected(reason, retry_after)
+
+    def _reserve_rate(self, cost_tokens, expires_at):
+        """Reserve request and token budget; return the seconds to wait for it, or reject if too long."""
+        waits = []
+        reserved = []
+        for bucket, amount in ((self._request_bucket, 1), (self._token_bucket, cost_tokens)):
+            if bucket is not None and amount:
+                waits.append(bucket.reserve(amount))
+                reserved.append((bucket, amount))
+        wait = max(waits, default=0.0)
+        if wait > self.max_queue_wait or time.monotonic() + wait > expires_at:
+            for bucket, amount in reserved:
+                bucket.refund(amount)
+            self._reject('rate limit', wait)
+        return wait
+
+    def _enqueue(self, waiter):
+        """Take a free slot if there is one (True); otherwise queue waiter (False), or reject if the queue is full."""
+        with self._lock:
+            if self._free:
+                self._free -= 1
+                return True
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise GatewayRejected('queue full', self.max_queue_wait)
+            self._waiters.append(waiter)
+            self.waiting += 1
+        return False
+
+    def _queue_timeout(self, expires_at):
+        return max(0.0, min(self.max_queue_wait, expires_at - time.monotonic()))
+
+    def _leave(self, waiter):
+        """Take waiter out of the queue; True if it was handed a slot first."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            self.waiting -= 1
+            return False
+
+    def _release(self):
+        """Hand the slot to the first queued caller, or free it."""
+        with self._lock:
+            if not self._waiters:
+                self._free += 1
+                return
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self.waiting -= 1
+        waiter.wake()
+
+    @contextmanager
+    def _active(self):
+        with self._lock:
+            self.active += 1
+            self.calls += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    @contextmanager
+    def admit(self, cost_tokens=0, deadline=None):
+        """
+        Hold one upstream slot for the body of the with-block.
+
+        Yields the absolute (time.monotonic) deadline for the request.
+        """
+        expires_at = time.monotonic() + (deadline or self.deadline)
+        waiter = ThreadWaiter()
+        if not self._enqueue(waiter):
+            waiter.wait(self._queue_timeout(expires_at))
+            if not self._leave(waiter):
+                self._reject('queue wait exceeded', self.max_queue_wait)
+        try:
+            wait = self._reserve_rate(cost_tokens, expires_at)
+            if wait > 0:
+                time.sleep(wait)
+            with self._active():
+                yield expires_at
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def admit_async(self, cost_tokens=0, deadline=None):
+        """admit() for coroutines: queueing and rate-limit waits do not block the event loop."""
+        expires_at = time.monotonic() + (deadline or self.deadline)
+        waiter = TaskWaiter()
+        if not self._enqueue(waiter):
+            try:
+                await waiter.wait(self._queue_timeout(expires_at))
+            except asyncio.CancelledError:
+                if self._leave(waiter):
+                    self._release()
+                raise
+            if not self._leave(waiter):
+                self._reject('queue wait exceeded', self.max_queue_wait)
+        try:
+            wait = self._reserve_rate(cost_tokens, expires_at)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            with self._active():
+                yield expires_at
+        finally:
+            self._release()
+
+    def _remaining(self, expires_at):
+        """Seconds left before the deadline; raises TimeoutError once it has passed."""
+        remaining = expires_at - time.monotonic()
+        if remaining <= 0:
+            with self._lock:
+                self.failures += 1
+            raise TimeoutError('LLM deadline exceeded')
+        return remaining
+
+    def _retry_delay(self, exc, attempt, expires_at):
+        """Seconds to wait before retrying after exc, or None to give up (counted as a failure)."""
+        if not is_retryable(exc) or attempt >= self.max_retries:
+            delay = None
+        else:
+            delay = retry_after_of(exc)
+            if delay is None:
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                delay = random.uniform(delay / 2, delay)  # jitter spreads out synchronized retries
+            if time.monotonic() + delay >= expires_at:
+                delay = None
+        with self._lock:
+            if delay is None:
+                self.failures += 1
+            else:
+                self.retries += 1
+        return delay
+
+    def retrying(self, fn, expires_at):
+        """
+        Call fn(timeout) until it succeeds, retrying transient failures.
+
+        Stops when max_retries is reached or the deadline would be missed.
+        """
+        attempt = 0
+        while True:
+            remaining = self._remaining(expires_at)
+            try:
+                return fn(remaining)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, expires_at)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+
+    async def retrying_async(self, fn, expires_at):
+        """retrying() for a coroutine function fn(timeout)."""
+        attempt = 0
+        while True:
+            remaining = self._remaining(expires_at)
+            try:
+                return await fn(remaining)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, expires_at)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def call(self, fn, cost_tokens=0, deadline=None):
+        """Admit, then run fn(timeout) with retries inside the request deadline."""
+        with self.admit(cost_tokens, deadline) as expires_at:
+            return self.retrying(fn, expires_at)
+
+    async def call_async(self, fn, cost_tokens=0, deadline=None):
+        """call() for a coroutine function fn(timeout)."""
+        async with self.admit_async(cost_tokens, deadline) as expires_at:
+            return await self.retrying_async(fn, expires_at)
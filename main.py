@@ -1,14 +1,31 @@
-from flask import Flask, render_template, request, jsonify , session, redirect, url_for
-from sklearn.metrics.pairwise import cosine_similarity
-from transcripts_json_YT_Transcript.read_chunks import model  
+from flask import Flask, render_template, request, jsonify , session, redirect, url_for, Response, stream_with_context
+from transcripts_json_YT_Transcript.read_chunks import load_model
+from retrieval import RetrievalEngine
+from index_store import index_exists
+from index_reload import IndexReloader
+from bm25_index import BM25Index
+from query_cache import EmbeddingCache, SemanticAnswerCache, normalize_question
+from encode_batcher import EncodeBatcher
+from single_flight import SingleFlight
+from chat_store import ChatStore
+from startup import Startup, NotReady
+from metrics import registry, record, span, trace, traced, timed, flatten_stats
+from llm_gateway import LLMGateway, GatewayRejected, status_code_of, retry_after_of
+from extractive import extractive_answer
+from passages import mmr_select, merge_adjacent, pack_context, TokenCounter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from authlib.integrations.flask_client import OAuth 
 from dotenv import load_dotenv
 from functools import wraps
-import pandas as pd
-import numpy as np
-import joblib
 import groq
+import atexit
+import hmac
+import json
 import os
+import queue
+import tempfile
+import threading
+import time
 
 # Load environment variables
 load_dotenv()
@@ -33,15 +50,115 @@ google = oauth.register(
 api_key = os.getenv("GROQ_API_KEY")
 if not api_key:
     raise ValueError("GROQ_API_KEY not found in .env file")
-client = groq.Groq(api_key=api_key)
+# GROQ_BASE_URL points the client at a local stand-in (benchmarks/fake_groq.py)
+# Retries are handled by llm_gateway, so the SDK's own retries are disabled
+client = groq.Groq(api_key=api_key, base_url=os.getenv("GROQ_BASE_URL") or None, max_retries=0)
+
+# Bounded concurrency, queueing, rate limits and retries around every Groq call.
+# LLM_REQUESTS_PER_MINUTE and LLM_TOKENS_PER_MINUTE are the Groq quota for the
+# whole server: each worker process gets 1/WEB_CONCURRENCY of it (gunicorn
+# also reads WEB_CONCURRENCY as its default worker count). Concurrency and
+# queue limits are per worker.
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+llm_gateway = LLMGateway(
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "32")),
+    max_queue_wait=float(os.getenv("LLM_MAX_QUEUE_WAIT", "5")),
+    requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "30")) / WEB_CONCURRENCY,
+    tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", "12000")) / WEB_CONCURRENCY,
+    deadline=float(os.getenv("LLM_DEADLINE_SECONDS", "30")),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "2"))
+)
+
+# Past this many seconds without an LLM answer (or first streamed token) the
+# user gets an extractive answer built from the retrieved chunks instead; 0 disables
+ANSWER_DEADLINE = float(os.getenv("ANSWER_DEADLINE_SECONDS", "8"))
+# Groq calls run here so the request thread can stop waiting at the deadline
+llm_pool = ThreadPoolExecutor(max_workers=llm_gateway.max_concurrency + llm_gateway.max_queue)
+fallback_counts = {'llm': 0, 'extractive': 0}
+fallback_lock = threading.Lock()
 
 # Load embeddings once at startup
 # print("Loading embeddings...")
-df = joblib.load('embeddings.joblib')
+# Prefer the memory-mapped index (shared across gunicorn workers) and fall
+# back to the pickled DataFrame when it has not been built yet.
+INDEX_DIR = os.getenv("INDEX_DIR", "index")
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "exact")  # "exact", "ivf", "int8" or "binary"
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+RESCORE_SHORTLIST = int(os.getenv("RESCORE_SHORTLIST", "100"))
+# Fuse BM25 keyword matches with the dense ranking (python -m bm25_index index)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+BM25_SCAN_BUDGET = int(os.getenv("BM25_SCAN_BUDGET", "10000"))
+CORPUS_PATH = INDEX_DIR if index_exists(INDEX_DIR) else 'embeddings.joblib'
 # print(f" Loaded {len(df)} chunks from {df['video_title'].nunique()} videos\n")
 
+# The encoder and the first engine are loaded by load_resources(), which runs
+# according to STARTUP_MODE (see startup.py): "eager", "background", "lazy" or
+# "preload". Queries wait up to STARTUP_WAIT_SECONDS for them, then get a 503.
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background")
+STARTUP_WAIT_SECONDS = float(os.getenv("STARTUP_WAIT_SECONDS", "60"))
+model = None
+
+# Every INDEX_RELOAD_SECONDS each worker checks whether a new index generation
+# was published (or the embeddings file rewritten) and swaps it in without a
+# restart (see index_reload.py); 0 leaves only POST /admin/reload, which needs
+# the ADMIN_TOKEN bearer token (unset disables the admin endpoints)
+INDEX_RELOAD_SECONDS = float(os.getenv("INDEX_RELOAD_SECONDS", "10"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Retrieve this many candidates, then keep a diverse top-k by maximal marginal
+# relevance (0 diversity keeps the plain ranking)
+MMR_CANDIDATES = int(os.getenv("MMR_CANDIDATES", "20"))
+MMR_DIVERSITY = float(os.getenv("MMR_DIVERSITY", "0.3"))
+
+# The passages sent to Groq are packed into this many context tokens, counted
+# with the embedding model's tokenizer (4 characters per token without one)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+token_counter = TokenCounter()  # the model's tokenizer once loaded
+prompt_token_stats = {'requests': 0, 'total': 0, 'max': 0, 'trimmed': 0}
+prompt_stats_lock = threading.Lock()
+
+# Batch concurrent question encodes into one model.encode call
+encoder = EncodeBatcher(
+    None,  # the model, once loaded
+    max_batch=int(os.getenv("ENCODE_BATCH_SIZE", "32")),
+    max_wait_ms=float(os.getenv("ENCODE_BATCH_WAIT_MS", "5"))
+)
+
+# Cache question embeddings so repeated questions skip the encoder
+embedding_cache = EmbeddingCache(
+    max_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "2048")),
+    ttl_seconds=float(os.getenv("EMBEDDING_CACHE_TTL", "86400")),
+    path=os.getenv("EMBEDDING_CACHE_PATH") or None
+)
+embedding_cache.load()
+atexit.register(embedding_cache.save)
+
+# Reuse answers for paraphrased questions that retrieve the same chunks
+answer_cache = SemanticAnswerCache(
+    max_size=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+)
+
+# Identical questions asked at the same time share one pipeline run, within a
+# worker and (through a SQLite lease file) across gunicorn workers on the host.
+# A follower stops waiting for the leader after the request deadline (answer
+# deadline plus retrieval, or the LLM deadline) and answers on its own.
+single_flight = SingleFlight(
+    db_path=os.getenv("SINGLE_FLIGHT_DB", os.path.join(tempfile.gettempdir(), "ragrathee-single-flight.sqlite3")) or None,
+    lease_seconds=float(os.getenv("SINGLE_FLIGHT_LEASE_SECONDS", "120")),
+    max_wait=float(os.getenv("SINGLE_FLIGHT_MAX_WAIT",
+                             str(ANSWER_DEADLINE + 2 if ANSWER_DEADLINE > 0 else llm_gateway.deadline)))
+)
+
+# Chat history lives in SQLite so every worker (and restart) sees the same
+# chats; the most recently active users' pages are cached in memory
+chat_store = ChatStore(
+    os.getenv("CHAT_DB", "chats.sqlite3"),
+    cache_users=int(os.getenv("CHAT_CACHE_USERS", "1024"))
+)
+
 # CORE FUNCTIONS
-user_chats = {}  # In-memory storage for user chats
 
 # Login required decorator
 def login_required(f):
@@ -57,27 +174,7 @@ def create_embeddings(text_list, model):
     embeddings = model.encode(text_list, show_progress_bar=False)
     return embeddings
 
-def format_context(relevant_df):
-    """Format the retrieved chunks into a clean context string."""
-    context_parts = []
-    for idx, row in relevant_df.iterrows():
-        context_parts.append(
-            f"Video: {row['video_title']}\n"
-            f"Video URL: {row['video_url']}\n"
-            f"Timestamp: [{row['start_time']:.2f} - {row['end_time']:.2f} minutes]\n"
-            f"Content: {row['text']}\n"
-        )
-    return "\n---\n".join(context_parts)
-
-def query_groq(question, context):
-    """Query Groq API with the question and context."""
-    try:
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {
-                    "role": "system",
-    "content": """You are a helpful assistant that answers questions based on video transcripts.
+SYSTEM_PROMPT = """You are a helpful assistant that answers questions based on video transcripts.
 
     CRITICAL: Use ONLY HTML tags in your response. NO markdown syntax at all.
 
@@ -150,51 +247,298 @@ def query_groq(question, context):
      if user say anything hateful, respond with "I am here to provide helpful and respectful information. Let's keep our conversation positive and focused on the video content
      If user reply "How are you? reply -> I am an AI assistant, and I don't have personal feelings or emotions, but I can provide information on how to maintain good health and well-being related to the Dhruv Rathe video.
     and also in answer don't provide any video related answer don't provide any URL , Title , Main Explaination or Conclusion. """
-                },
-                {
-                    "role": "user",
-                    "content": f"""Context from videos:
+
+def build_messages(question, context):
+    """Build the chat messages sent to Groq for a question and its context."""
+    return [
+        {
+            "role": "system",
+            "content": SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": f"""Context from videos:
                             {context}
 
                     Question: {question}
 
                     Provide a detailed answer with citations (Video title, Video URL and timestamps)."""
-                }
-            ],
-            temperature=0.3,
-            max_tokens=1000
-        )
+        }
+    ]
+
+SYSTEM_PROMPT_TOKENS = token_counter.count(SYSTEM_PROMPT)
+
+# Completion limit for every Groq call (main.py and asgi_app.py)
+MAX_ANSWER_TOKENS = int(os.getenv("MAX_ANSWER_TOKENS", "1000"))
+
+def estimate_tokens(messages):
+    """Rough token cost of a request (about 4 characters per token) for rate limiting."""
+    return sum(len(m['content']) for m in messages) // 4 + MAX_ANSWER_TOKENS
+
+def upstream_overloaded(e):
+    """Turn a Groq 429 that survived the gateway's retries into a fast rejection."""
+    if status_code_of(e) == 429:
+        return GatewayRejected('upstream rate limited', retry_after_of(e) or llm_gateway.max_queue_wait)
+    return None
+
+def query_groq(question, context):
+    """
+    Query Groq API with the question and context.
+    
+    Raises GatewayRejected when the gateway (or Groq's rate limit) refuses the call.
+    """
+    messages = build_messages(question, context)
+    try:
+        with span('llm'):
+            response = llm_gateway.call(
+                lambda timeout: client.chat.completions.create(
+                    model="llama-3.3-70b-versatile",
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=MAX_ANSWER_TOKENS,
+                    timeout=timeout
+                ),
+                cost_tokens=estimate_tokens(messages)
+            )
         return response.choices[0].message.content
+    except GatewayRejected:
+        raise
     except Exception as e:
+        rejected = upstream_overloaded(e)
+        if rejected is not None:
+            raise rejected
         error_msg = f"Error querying Groq API: {str(e)}"
         print(error_msg)
         return error_msg
 
-def process_question(question, top_results=7, verbose=False):
+def stream_groq(question, context):
+    """Query Groq API with streaming, yielding answer text pieces as they arrive."""
+    messages = build_messages(question, context)
+    # The gateway slot is held until the stream is fully consumed or closed
+    with llm_gateway.admit(estimate_tokens(messages)) as expires_at:
+        try:
+            stream = llm_gateway.retrying(
+                lambda timeout: client.chat.completions.create(
+                    model="llama-3.3-70b-versatile",
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=MAX_ANSWER_TOKENS,
+                    stream=True,
+                    timeout=timeout
+                ),
+                expires_at
+            )
+        except Exception as e:
+            rejected = upstream_overloaded(e)
+            if rejected is not None:
+                raise rejected
+            raise
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+def count_answer(kind):
+    with fallback_lock:
+        fallback_counts[kind] += 1
+    registry.inc('answers', kind)
+
+def fallback_answer(question, relevant_df, reason):
+    """Extractive answer used when the LLM misses the deadline or fails."""
+    print(f"Using extractive answer: {reason}")
+    count_answer('extractive')
+    with span('fallback'):
+        return extractive_answer(question, relevant_df)
+
+def answer_within_deadline(question, relevant_df, context, on_late_answer=None):
+    """
+    Query Groq, falling back to an extractive answer after ANSWER_DEADLINE seconds.
+
+    Returns (answer, is_fallback). A Groq answer that arrives after the
+    deadline is passed to on_late_answer so it can still be cached.
+    Raises GatewayRejected like query_groq.
     """
-    Process a question and return answer with sources.
+    if ANSWER_DEADLINE <= 0:
+        answer = query_groq(question, context)
+    else:
+        future = llm_pool.submit(query_groq, question, context)
+        try:
+            answer = future.result(timeout=ANSWER_DEADLINE)
+        except FutureTimeout:
+            if on_late_answer is not None:
+                future.add_done_callback(
+                    lambda f: f.exception() is None and on_late_answer(f.result())
+                )
+            return fallback_answer(question, relevant_df, f"no answer within {ANSWER_DEADLINE:g}s"), True
+    if answer.startswith("Error querying Groq API"):
+        return fallback_answer(question, relevant_df, answer), True
+    count_answer('llm')
+    return answer, False
+
+def pieces_within_deadline(pieces, deadline):
     """
-    if not question.strip():
-        return None, "Please enter a valid question!"
-    
-    # Create embedding for the question
-    question_embedding = create_embeddings([question], model)[0]
-    
-    # Calculate similarities
-    similarities = cosine_similarity(
-        np.vstack(df['embedding'].values),
-        [question_embedding]
-    ).flatten()
+    Yield from the pieces generator, raising TimeoutError if the first piece
+    takes longer than deadline seconds.
+
+    The generator runs in a background thread; after a timeout it is closed
+    as soon as it produces anything, releasing its gateway slot.
+    """
+    handoff = queue.Queue()
+    abandoned = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for piece in pieces:
+                if abandoned.is_set():
+                    break
+                handoff.put((True, piece))
+            handoff.put((True, done))
+        except BaseException as e:
+            handoff.put((False, e))
+        finally:
+            pieces.close()
+
+    llm_pool.submit(produce)
+    first = True
+    try:
+        while True:
+            try:
+                ok, item = handoff.get(timeout=deadline if first else None)
+            except queue.Empty:
+                raise TimeoutError(f"no answer within {deadline:g}s")
+            if not ok:
+                raise item
+            if item is done:
+                return
+            first = False
+            yield item
+    finally:
+        # Timed out, failed, or the client went away: stop the producer
+        abandoned.set()
+
+def build_sources(relevant_df):
+    """Convert retrieved rows into the JSON-serializable sources list."""
+    sources = []
+    for idx, row in relevant_df.iterrows():
+        sources.append({
+            'video_title': row['video_title'],
+            'video_url': row['video_url'],
+            'chunk_id': int(row['chunk_id']),
+            'start_time': float(row['start_time']),
+            'end_time': float(row['end_time']),
+            'text': row['text']
+        })
+    return sources
+
+def truncate_sources(sources, max_chars=200):
+    """Shorten source texts for API responses."""
+    return [
+        {**src, 'text': src['text'][:max_chars] + '...' if len(src['text']) > max_chars else src['text']}
+        for src in sources
+    ]
+
+def retrieve(question, top_results=7, verbose=False):
+    """
+    Embed a question and find its top chunks.
+
+    Returns (question_embedding, top_indices, loaded), where loaded is the
+    index snapshot (index_reload.LoadedIndex) the indices refer to; pass it
+    on to relevant_passages. Raises NotReady if the encoder and index are
+    not loaded within STARTUP_WAIT_SECONDS.
+    """
+    startup.wait(STARTUP_WAIT_SECONDS)
+    # One snapshot per query: a reload swapping in a new index meanwhile does not affect it
+    loaded = live_index.current
+    engine = loaded.engine
+    # Create embedding for the question (cached by normalized text)
+    with span('encode'):
+        question_embedding = embedding_cache.get_or_compute(
+            question, lambda: encoder.encode(question)
+        )
     
     # Get top results
-    top_indices = similarities.argsort()[::-1][:top_results]
+    if MMR_DIVERSITY > 0:
+        with span('search'):
+            top_indices, top_scores = engine.search(question_embedding, max(top_results, MMR_CANDIDATES),
+                                                    query_text=question)
+        with span('mmr'):
+            picks = mmr_select(engine.vectors(top_indices), top_scores, top_results, MMR_DIVERSITY)
+        top_indices, top_scores = top_indices[picks], top_scores[picks]
+    else:
+        with span('search'):
+            top_indices, top_scores = engine.search(question_embedding, top_results, query_text=question)
     
     if verbose:
         print(f"\n🔍 Found top {top_results} relevant chunks")
-        print(f"   Similarity scores: {similarities[top_indices]}\n")
+        print(f"   Similarity scores: {top_scores}\n")
+    
+    return question_embedding, top_indices, loaded
+
+def cached_answer(question_embedding, top_indices, corpus_version):
+    """Answer-cache lookup: (answer, sources) or None."""
+    with span('answer_cache'):
+        return answer_cache.lookup(question_embedding, top_indices, version=corpus_version)
+
+def relevant_passages(loaded, top_indices):
+    """Rows for the retrieved chunks of the loaded index, with neighbouring chunks merged into one passage."""
+    with span('passages'):
+        return merge_adjacent(loaded.engine.rows(top_indices))
+
+def build_context(question, relevant_df, verbose=False):
+    """
+    Pack the passages into the context token budget and count the prompt size.
+
+    Returns (context, packed_df); packed_df holds the passages the model sees.
+    """
+    with span('context'):
+        context, packed_df, context_tokens = pack_context(relevant_df, CONTEXT_TOKEN_BUDGET, token_counter)
+        prompt_tokens = SYSTEM_PROMPT_TOKENS + token_counter.count(build_messages(question, context)[1]['content'])
+    registry.observe('prompt_tokens', prompt_tokens)
+    trimmed = len(packed_df) < len(relevant_df) or not packed_df['text'].equals(relevant_df['text'].iloc[:len(packed_df)])
+    with prompt_stats_lock:
+        prompt_token_stats['requests'] += 1
+        prompt_token_stats['total'] += prompt_tokens
+        prompt_token_stats['max'] = max(prompt_token_stats['max'], prompt_tokens)
+        prompt_token_stats['trimmed'] += int(trimmed)
+    if verbose:
+        print(f"Prompt tokens: {prompt_tokens} (context {context_tokens}/{CONTEXT_TOKEN_BUDGET}, "
+              f"{len(packed_df)}/{len(relevant_df)} passages{', trimmed' if trimmed else ''})")
+    return context, packed_df
+
+def prompt_stats():
+    with prompt_stats_lock:
+        stats = dict(prompt_token_stats)
+    stats['mean'] = round(stats['total'] / stats['requests'], 1) if stats['requests'] else 0.0
+    stats['context_budget'] = CONTEXT_TOKEN_BUDGET
+    return stats
+
+def process_question(question, top_results=7, verbose=False):
+    """
+    Process a question and return answer, sources and the version of the index used.
+    
+    Concurrent calls with the same normalized question are coalesced into one.
+    """
+    if not question.strip():
+        return None, "Please enter a valid question!", None
+    
+    key = f"{top_results}:{normalize_question(question)}"
+    answer, sources, index_version = single_flight.do(key, lambda: answer_question(question, top_results, verbose))
+    return answer, sources, index_version
+
+def answer_question(question, top_results=7, verbose=False):
+    """Run retrieval and generation for one question; returns (answer, sources, index_version)."""
+    question_embedding, top_indices, loaded = retrieve(question, top_results, verbose)
+    corpus_version = loaded.version
+    
+    # Same meaning and same retrieved chunks -> reuse the stored answer
+    cached = cached_answer(question_embedding, top_indices, corpus_version)
+    if cached is not None:
+        if verbose:
+            print("\n Answer served from cache\n")
+        return (*cached, corpus_version)
     
     # Get relevant chunks
-    relevant_df = df.iloc[top_indices].copy()
+    relevant_df = relevant_passages(loaded, top_indices)
     
     # Display retrieved chunks if verbose
     if verbose:
@@ -207,39 +551,193 @@ def process_question(question, top_results=7, verbose=False):
             print(f"Text: {row['text'][:150]}...")
             print("-" * 80)
     
-    # Format context
-    context = format_context(relevant_df)
+    # Pack the passages into the prompt's token budget
+    context, packed_df = build_context(question, relevant_df, verbose)
     
     # Query Groq API
     if verbose:
         print("\n Thinking....\n")
     
-    answer = query_groq(question, context)
+    # Prepare sources (the passages the model actually saw)
+    sources = build_sources(packed_df)
     
-    # Prepare sources
-    sources = []
-    for idx, row in relevant_df.iterrows():
-        sources.append({
-            'video_title': row['video_title'],
-            'video_url': row['video_url'],
-            'chunk_id': int(row['chunk_id']),
-            'start_time': float(row['start_time']),
-            'end_time': float(row['end_time']),
-            'text': row['text']
-        })
+    def store(answer):
+        answer_cache.store(question_embedding, top_indices, answer, sources, version=corpus_version)
+    
+    def store_late(answer):
+        if not answer.startswith("Error querying Groq API"):
+            store(answer)
     
-    return answer, sources
+    with span('generate'):
+        answer, is_fallback = answer_within_deadline(question, relevant_df, context, on_late_answer=store_late)
+    
+    # Only real Groq answers are cached; extractive fallbacks are retried next time
+    if not is_fallback:
+        store(answer)
+    
+    return answer, sources, corpus_version
+
+def sse_event(event, data):
+    """Format one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_question(question, top_results=7):
+    """
+    Generate server-sent events for a question.
 
-# Helper functions for user chat management
-def get_user_chats(user_email):
-    """Get chats for a specific user."""
-    if user_email not in user_chats:
-        user_chats[user_email] = []
-    return user_chats[user_email]
+    Sends the sources as soon as retrieval finishes, then the answer text as
+    it streams from Groq, then a final 'done' event.
+    """
+    question_embedding, top_indices, loaded = retrieve(question, top_results)
+    corpus_version = loaded.version
+    
+    cached = cached_answer(question_embedding, top_indices, corpus_version)
+    if cached is not None:
+        answer, sources = cached
+        yield sse_event('sources', {'sources': truncate_sources(sources), 'question': question,
+                                    'index_version': corpus_version})
+        yield sse_event('token', {'text': answer})
+        startup.served()
+        yield sse_event('done', {'cached': True})
+        return
+    
+    relevant_df = relevant_passages(loaded, top_indices)
+    context, packed_df = build_context(question, relevant_df)
+    sources = build_sources(packed_df)
+    yield sse_event('sources', {'sources': truncate_sources(sources), 'question': question,
+                                'index_version': corpus_version})
+    
+    parts = []
+    pieces = timed('llm', stream_groq(question, context))
+    if ANSWER_DEADLINE > 0:
+        pieces = pieces_within_deadline(pieces, ANSWER_DEADLINE)
+    started = time.perf_counter()
+    try:
+        for piece in pieces:
+            if not parts:
+                record('first_token', time.perf_counter() - started)
+            parts.append(piece)
+            yield sse_event('token', {'text': piece})
+    except GatewayRejected as e:
+        yield sse_event('error', {'error': 'Server is busy, please retry shortly.', 'retry_after': e.retry_after})
+        return
+    except Exception as e:
+        error_msg = f"Error querying Groq API: {str(e)}"
+        print(error_msg)
+        # Missed the first-token deadline or failed before answering: fall back
+        if not parts:
+            yield sse_event('token', {'text': fallback_answer(question, relevant_df, error_msg)})
+            startup.served()
+            yield sse_event('done', {'cached': False, 'fallback': True})
+            return
+        yield sse_event('error', {'error': error_msg})
+        return
+    
+    count_answer('llm')
+    answer_cache.store(question_embedding, top_indices, "".join(parts), sources, version=corpus_version)
+    startup.served()
+    yield sse_event('done', {'cached': False})
+
+def collect_stats():
+    """Corpus size plus cache and encoder counters."""
+    loaded = live_index.current
+    return {
+        **(loaded.engine.corpus_stats if loaded is not None else {}),
+        'index': live_index.stats(),
+        'startup': startup.status(),
+        'embedding_cache': embedding_cache.stats(),
+        'answer_cache': answer_cache.stats(),
+        'encoder': encoder.stats(),
+        'single_flight': single_flight.stats(),
+        'llm_gateway': llm_gateway.stats(),
+        'answers': dict(fallback_counts),
+        'prompt_tokens': prompt_stats(),
+        'chat_store': chat_store.stats()
+    }
 
-def save_user_chats(user_email, chats):
-    """Save chats for a specific user."""
-    user_chats[user_email] = chats
+# Every numeric /stats value (cache hit rates, queue depths, corpus size, ...)
+# is also exported on /metrics: as a counter when its source lists it in
+# COUNTERS (hits, calls, rejections...), otherwise as a gauge. The answer
+# counts are left out; they are the answers counter below.
+registry.counter('answers', 'Answers served, by kind (llm or extractive).', label='kind')
+
+def stats_counters():
+    sources = {'index': live_index, 'embedding_cache': embedding_cache, 'answer_cache': answer_cache,
+               'encoder': encoder, 'single_flight': single_flight, 'llm_gateway': llm_gateway,
+               'chat_store': chat_store}
+    names = {f"{section}_{key}" for section, source in sources.items() for key in source.COUNTERS}
+    return names | {'prompt_tokens_requests', 'prompt_tokens_total', 'prompt_tokens_trimmed'}
+
+def stats_metrics():
+    counters = stats_counters()
+    stats = collect_stats()
+    stats.pop('answers')
+    return [(name, f"/stats value {name}.", value, 'counter' if name in counters else 'gauge')
+            for name, value in flatten_stats(stats)]
+
+registry.gauges(stats_metrics)
+
+def busy_response(e):
+    """503 + Retry-After for a question the LLM gateway refused."""
+    response = jsonify({'error': 'Server is busy, please retry shortly.', 'reason': e.reason})
+    response.headers['Retry-After'] = str(max(1, int(round(e.retry_after))))
+    return response, 503
+
+def not_ready_response(e):
+    response = jsonify({'error': str(e), 'state': e.state})
+    response.headers['Retry-After'] = str(max(1, int(round(e.retry_after))))
+    return response, 503
+
+# Requests slower than this are logged with their per-stage timings
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "5"))
+
+# STARTUP
+
+WARM_UP_QUESTION = "What is planned obsolescence?"
+
+def corpus_path():
+    """What to serve right now: the generation the index symlink points to, or the embeddings file."""
+    return os.path.realpath(INDEX_DIR) if CORPUS_PATH == INDEX_DIR else CORPUS_PATH
+
+def open_engine(path):
+    """Build the retrieval engine for an index directory or embeddings file."""
+    if os.path.isdir(path):
+        return RetrievalEngine.from_index(path, backend=RETRIEVAL_BACKEND,
+                                          nprobe=IVF_NPROBE, shortlist=RESCORE_SHORTLIST,
+                                          hybrid=HYBRID_SEARCH and BM25Index.exists(path),
+                                          scan_budget=BM25_SCAN_BUDGET)
+    return RetrievalEngine.from_joblib(path, hybrid=HYBRID_SEARCH)
+
+def warm_engine(engine):
+    """One search on a reloaded engine before it goes live, through the shared encoder."""
+    embedding = embedding_cache.get_or_compute(WARM_UP_QUESTION, lambda: encoder.encode(WARM_UP_QUESTION))
+    engine.search(embedding, 7, query_text=WARM_UP_QUESTION)
+
+live_index = IndexReloader(open_engine, corpus_path, warm_up=warm_engine, interval=INDEX_RELOAD_SECONDS)
+
+def load_resources():
+    """Load the embedding model (importing torch) and the retrieval engine."""
+    global model, token_counter, SYSTEM_PROMPT_TOKENS
+    model = load_model()
+    live_index.load()
+    token_counter = TokenCounter(getattr(model, 'tokenizer', None))
+    SYSTEM_PROMPT_TOKENS = token_counter.count(SYSTEM_PROMPT)
+    encoder.model = model
+
+def warm_up():
+    """One encode and one search, so the first real query does not pay for lazy initialisation."""
+    embedding = model.encode([WARM_UP_QUESTION], show_progress_bar=False)[0]
+    live_index.current.engine.search(embedding, 7, query_text=WARM_UP_QUESTION)
+    # Runs in every process (after the fork under --preload), like the watcher thread must
+    live_index.watch()
+
+startup = Startup(load_resources, warm_up)
+if STARTUP_MODE == "eager":
+    startup.start(background=False)
+elif STARTUP_MODE == "preload":
+    startup.start(background=False, warm_up=False)
+elif STARTUP_MODE == "background":
+    startup.start()
 
 #Authetication Route
 @app.route('/login')
@@ -300,49 +798,125 @@ def query_endpoint():
             return jsonify({'error': 'Question is required'}), 400
         
         # Process the question
-        answer, sources = process_question(question, verbose=False)
+        with trace('/query', SLOW_REQUEST_SECONDS):
+            answer, sources, index_version = process_question(question, verbose=False)
         
         if answer is None:
             return jsonify({'error': sources}), 400
         
-        # Truncate source text for API response
-        api_sources = []
-        for src in sources:
-            api_sources.append({
-                **src,
-                'text': src['text'][:200] + '...' if len(src['text']) > 200 else src['text']
-            })
-        
+        startup.served()
         return jsonify({
             'answer': answer,
-            'sources': api_sources,
-            'question': question
+            'sources': truncate_sources(sources),
+            'question': question,
+            'index_version': index_version
         })
         
+    except GatewayRejected as e:
+        return busy_response(e)
+    except NotReady as e:
+        return not_ready_response(e)
     except Exception as e:
         print(f"Error in /query: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/query/stream', methods=['POST'])
+def query_stream_endpoint():
+    """Handle user queries, streaming the answer as server-sent events."""
+    data = request.get_json(silent=True) or {}
+    question = data.get('question', '').strip()
+    
+    if not question:
+        return jsonify({'error': 'Question is required'}), 400
+    
+    # Wait for the model here: once the stream starts, the status is already 200
+    try:
+        startup.wait(STARTUP_WAIT_SECONDS)
+    except NotReady as e:
+        return not_ready_response(e)
+    
+    return Response(
+        stream_with_context(traced('/query/stream', stream_question(question), SLOW_REQUEST_SECONDS)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/chats', methods=['POST'])
 @login_required
 def save_chats():
-    """Save chats for the current user."""
+    """Replace all chats of the current user (the old whole-history upload)."""
     try:
         user_email = session['user']['email']
-        chats = request.get_json()
-        save_user_chats(user_email, chats)
+        chats = request.get_json(silent=True)  # malformed JSON: None, rejected as not a list
+        chat_store.replace_chats(user_email, chats)
         return jsonify({'success': True})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/chats', methods=['GET'])
 @login_required
 def get_chats():
-    """Get chats for the current user."""
+    """List the current user's chats, newest first (?offset=&limit=)."""
     try:
         user_email = session['user']['email']
-        chats = get_user_chats(user_email)
-        return jsonify(chats)
+        page = chat_store.list_chats(user_email, request.args.get('offset', 0), request.args.get('limit'))
+        return jsonify(page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/chats/<chat_id>', methods=['PUT'])
+@login_required
+def save_chat(chat_id):
+    """Create a chat or rename it."""
+    try:
+        data = request.get_json(silent=True) or {}
+        chat_store.save_chat(session['user']['email'], chat_id, data.get('title'), data.get('createdAt'))
+        return jsonify({'success': True})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/chats/<chat_id>', methods=['DELETE'])
+@login_required
+def delete_chat(chat_id):
+    """Delete a chat and its messages."""
+    try:
+        chat_store.delete_chat(session['user']['email'], chat_id)
+        return jsonify({'success': True})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/chats/<chat_id>/messages', methods=['GET'])
+@login_required
+def get_chat_messages(chat_id):
+    """Messages of a chat, oldest first (?after=<message id>&limit=)."""
+    try:
+        page = chat_store.messages(session['user']['email'], chat_id,
+                                   request.args.get('after', 0), request.args.get('limit'))
+        return jsonify(page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/chats/<chat_id>/messages', methods=['POST'])
+@login_required
+def append_chat_message(chat_id):
+    """Append one message to a chat."""
+    try:
+        data = request.get_json(silent=True) or {}
+        message_id = chat_store.append_message(
+            session['user']['email'], chat_id, data.get('role'), data.get('message'),
+            data.get('sources'), data.get('timestamp')
+        )
+        return jsonify({'success': True, 'id': message_id})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -350,16 +924,58 @@ def get_chats():
 def stats():
     """Get statistics about the database."""
     try:
-        unique_videos = df['video_  title'].nunique()
-        total_chunks = len(df)
-        
-        return jsonify({
-            'total_videos': unique_videos,
-            'total_chunks': total_chunks
-        })
+        return jsonify(collect_stats())
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def admin_authorized(authorization):
+    """True if an Authorization header carries ADMIN_TOKEN as a bearer token."""
+    scheme, _, token = (authorization or '').partition(' ')
+    return bool(ADMIN_TOKEN) and scheme.lower() == 'bearer' and hmac.compare_digest(token.strip(), ADMIN_TOKEN)
+
+def reload_index(force=False):
+    """
+    Load the current index version in this worker, as the watcher would.
+
+    Returns (payload, status code). Other workers pick the new version up
+    on their next INDEX_RELOAD_SECONDS poll.
+    """
+    startup.wait(STARTUP_WAIT_SECONDS)
+    try:
+        return live_index.reload(force=force), 200
+    except Exception as e:
+        print(f"Index reload failed, still serving {live_index.version}: {live_index.last_error}")
+        return {'error': live_index.last_error, 'version': live_index.version}, 500
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """Swap in a newly published index now (body {"force": true} reloads even an unchanged one)."""
+    if not admin_authorized(request.headers.get('Authorization')):
+        return jsonify({'error': 'Admin token required'}), 403
+    try:
+        data = request.get_json(silent=True) or {}
+        payload, status = reload_index(force=bool(data.get('force')))
+        return jsonify(payload), status
+    except NotReady as e:
+        return not_ready_response(e)
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving, whether or not the model has loaded."""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: 200 once the encoder and index are loaded and warmed up, 503 before."""
+    startup.start()  # with STARTUP_MODE=lazy the first probe starts loading
+    status = startup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: per-stage latency histograms plus the /stats values as gauges."""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
 
 # MAIN ENTRY POINT
 if __name__ == '__main__':
@@ -0,0 +1,294 @@
+"""
+Per-stage timing spans and Prometheus text-format metrics.
+
+    with span('encode'):
+        question_embedding = ...
+
+records the stage's duration in the ragrathee_stage_seconds histogram. Inside
+a request trace (see trace()) the spans are also collected per request, so
+a slow request can be logged with its breakdown.
+
+Each gunicorn worker keeps its own metrics. With metrics_dir set, workers
+also write snapshots there every flush_seconds and /metrics, whichever
+worker serves it, merges them: histograms and counters are summed over all
+workers (including ones that have exited), gauges are reported per live
+worker with a worker label. Empty the directory when the service starts.
+
+A gauge source can mark a value that only grows (a /stats hit count, say) as
+a counter: it is then typed counter, still per live worker, and named with
+the _total suffix.
+"""
+import contextvars
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (250, 500, 750, 1000, 1500, 2000, 2500, 3000, 4000, 6000)
+
+# Spans of the request being handled in this thread or task, or None
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    """Histograms and counters with at most one label each, plus gauge callbacks."""
+
+    def __init__(self, namespace='ragrathee', metrics_dir=None, flush_seconds=5.0):
+        self.namespace = namespace
+        self.metrics_dir = metrics_dir
+        self.flush_seconds = flush_seconds
+        self._histograms = {}  # name -> (help, label, buckets, {label value: [bucket counts..., sum, count]})
+        self._counters = {}    # name -> (help, label, {label value: value})
+        self._gauge_sources = []
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._pid = os.getpid()
+
+    def histogram(self, name, help, label=None, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            self._histograms.setdefault(name, (help, label, tuple(buckets), {}))
+
+    def counter(self, name, help, label=None):
+        with self._lock:
+            self._counters.setdefault(name, (help, label, {}))
+
+    def gauges(self, source):
+        """Register source(), returning [(name, help, value)] or [(name, help, value, kind)], evaluated at every scrape."""
+        self._gauge_sources.append(source)
+
+    def observe(self, name, value, label_value=''):
+        _, _, buckets, series = self._histograms[name]
+        with self._lock:
+            counts = series.get(label_value)
+            if counts is None:
+                counts = series[label_value] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+        self._start_flusher()
+
+    def inc(self, name, label_value='', amount=1):
+        _, _, series = self._counters[name]
+        with self._lock:
+            series[label_value] = series.get(label_value, 0) + amount
+        self._start_flusher()
+
+    # Snapshots and rendering
+
+    def snapshot(self):
+        gauges = []
+        for source in self._gauge_sources:
+            try:
+                gauges.extend(source())
+            except Exception as e:
+                print(f"Metrics gauge source failed: {e}")
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'time': time.time(),
+                'histograms': {name: {'help': h, 'label': label, 'buckets': list(buckets),
+                                      'series': {k: list(v) for k, v in series.items()}}
+                               for name, (h, label, buckets, series) in self._histograms.items()},
+                'counters': {name: {'help': h, 'label': label, 'series': dict(series)}
+                             for name, (h, label, series) in self._counters.items()},
+                'gauges': [list(gauge) for gauge in gauges],
+            }
+
+    def _start_flusher(self):
+        if not self.metrics_dir:
+            return
+        if self._flusher is None or self._pid != os.getpid():
+            with self._lock:
+                if self._flusher is not None and self._pid == os.getpid():
+                    return
+                self._pid = os.getpid()
+                self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def flush(self):
+        """Write this worker's snapshot to metrics_dir (atomically via a temp file)."""
+        if not self.metrics_dir:
+            return
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.metrics_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, os.path.join(self.metrics_dir, f"worker-{os.getpid()}.json"))
+        except Exception as e:
+            print(f"Metrics flush failed: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _snapshots(self):
+        own = self.snapshot()
+        if not self.metrics_dir:
+            return [own]
+        self.flush()
+        snapshots = [own]
+        for path in glob.glob(os.path.join(self.metrics_dir, 'worker-*.json')):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if snapshot.get('pid') != own['pid']:
+                snapshots.append(snapshot)
+        return snapshots
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        snapshots = self._snapshots()
+        ns = self.namespace
+        lines = []
+
+        histograms = {}
+        for snapshot in snapshots:
+            for name, h in snapshot['histograms'].items():
+                merged = histograms.setdefault(name, {**h, 'series': {}})
+                for key, counts in h['series'].items():
+                    total = merged['series'].setdefault(key, [0] * len(counts))
+                    for i, c in enumerate(counts):
+                        total[i] += c
+        for name, h in sorted(histograms.items()):
+            lines += [f"# HELP {ns}_{name} {h['help']}", f"# TYPE {ns}_{name} histogram"]
+            for key, counts in sorted(h['series'].items()):
+                base = [(h['label'], key)] if h['label'] else []
+                for bound, count in zip(h['buckets'] + [float('inf')], counts[:-2] + [counts[-1]]):
+                    lines.append(f"{ns}_{name}_bucket{format_labels(base + [('le', format_value(bound))])} {count}")
+                lines.append(f"{ns}_{name}_sum{format_labels(base)} {format_value(counts[-2])}")
+                lines.append(f"{ns}_{name}_count{format_labels(base)} {counts[-1]}")
+
+        counters = {}
+        for snapshot in snapshots:
+            for name, c in snapshot['counters'].items():
+                merged = counters.setdefault(name, {**c, 'series': {}})
+                for key, value in c['series'].items():
+                    merged['series'][key] = merged['series'].get(key, 0) + value
+        for name, c in sorted(counters.items()):
+            lines += [f"# HELP {ns}_{name}_total {c['help']}", f"# TYPE {ns}_{name}_total counter"]
+            for key, value in sorted(c['series'].items()):
+                labels = [(c['label'], key)] if c['label'] else []
+                lines.append(f"{ns}_{name}_total{format_labels(labels)} {format_value(value)}")
+
+        # Gauges describe a live worker; skip snapshots that stopped being refreshed
+        fresh = [s for s in snapshots if time.time() - s['time'] < 3 * self.flush_seconds]
+        gauges = {}
+        for snapshot in fresh:
+            for name, h, value, *kind in snapshot['gauges']:
+                kind = kind[0] if kind else 'gauge'
+                if kind == 'counter' and not name.endswith('_total'):
+                    name += '_total'
+                gauges.setdefault(name, (h, kind, []))[2].append((snapshot['pid'], value))
+        for name, (h, kind, values) in sorted(gauges.items()):
+            lines += [f"# HELP {ns}_{name} {h}", f"# TYPE {ns}_{name} {kind}"]
+            for pid, value in sorted(values):
+                labels = [('worker', pid)] if self.metrics_dir else []
+                lines.append(f"{ns}_{name}{format_labels(labels)} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry(
+    metrics_dir=os.getenv("METRICS_DIR") or None,
+    flush_seconds=float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+)
+registry.histogram('stage_seconds', 'Time spent in each stage of answering a question.', label='stage')
+registry.histogram('request_seconds', 'Time to handle a request, by endpoint.', label='endpoint')
+registry.histogram('prompt_tokens', 'Tokens in the prompt sent to Groq.', buckets=TOKEN_BUCKETS)
+
+
+def record(stage, seconds):
+    """Add one stage duration to stage_seconds and the current request trace."""
+    registry.observe('stage_seconds', seconds, stage)
+    spans = current_trace.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage):
+    """Time the enclosed block as one stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def trace(endpoint, slow_seconds=None):
+    """
+    Time a whole request and collect its spans.
+
+    Requests slower than slow_seconds are logged with their per-stage breakdown.
+    """
+    spans = []
+    token = current_trace.set(spans)
+    start = time.perf_counter()
+    try:
+        yield spans
+    finally:
+        elapsed = time.perf_counter() - start
+        current_trace.reset(token)
+        registry.observe('request_seconds', elapsed, endpoint)
+        if slow_seconds is not None and elapsed >= slow_seconds:
+            breakdown = ' '.join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in spans)
+            print(f"Slow {endpoint}: {elapsed * 1000:.0f}ms {breakdown}")
+
+
+def timed(stage, iterator):
+    """Yield from iterator, timing it as one stage that ends with its last item (for streams)."""
+    start = time.perf_counter()
+    try:
+        yield from iterator
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def traced(endpoint, iterator, slow_seconds=None):
+    """Yield from iterator inside a request trace (for streamed responses)."""
+    with trace(endpoint, slow_seconds):
+        yield from iterator
+
+
+def flatten_stats(stats, prefix=''):
+    """Numeric leaves of a nested stats dict as [(name, value)], e.g. answer_cache_hit_rate."""
+    values = []
+    for key, value in stats.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.extend(flatten_stats(value, name + '_'))
+        elif isinstance(value, bool):
+            values.append((name, int(value)))
+        elif isinstance(value, (int, float)):
+            values.append((name, value))
+    return values
@@ -0,0 +1,207 @@
+"""
+Post-retrieval passage selection: what actually goes into the Groq prompt.
+
+Transcript chunks are 30 s long with a 5 s overlap, so the raw top results
+are often neighbouring chunks of the same video saying nearly the same thing.
+Two steps remove that redundancy:
+
+    mmr_select      maximal-marginal-relevance selection over the candidate
+                    vectors: each pick trades relevance against similarity
+                    to the passages already picked
+    merge_adjacent  consecutive chunk_ids of the same video become one
+                    passage with one time range; the text the chunks share
+                    is kept once
+
+pack_context then fits the passages into a fixed token budget for the prompt.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+# Longest chunk overlap looked for when merging, in words
+MAX_OVERLAP_WORDS = 200
+
+# A sentence with its closing punctuation and trailing space (or the unterminated tail)
+SENTENCE = re.compile(r'[^.!?]+(?:[.!?]+["”\']?|$)\s*|[.!?]+\s*')
+
+CONTEXT_HEADER = "Passages are tagged [video, start second for &t=, time range in minutes]."
+
+
+def mmr_select(vectors, relevance, k, diversity=0.3):
+    """
+    Pick k rows by maximal marginal relevance and return their positions, best first.
+
+    vectors are the candidates' unit embeddings and relevance their retrieval
+    scores (any scale; min-max normalized here). diversity=0 keeps the
+    retrieval order, higher values penalize near-duplicates more.
+    """
+    n = len(relevance)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    relevance = np.asarray(relevance, dtype=np.float32)
+    spread = relevance.max() - relevance.min()
+    relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones(n, dtype=np.float32)
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    similarity = vectors @ vectors.T
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of every candidate to anything selected so far
+    redundancy = similarity[selected[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < k:
+        scores = (1 - diversity) * relevance - diversity * redundancy
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        available[pick] = False
+        np.maximum(redundancy, similarity[pick], out=redundancy)
+    return np.array(selected, dtype=np.int64)
+
+
+def join_overlapping(first, second):
+    """Concatenate two texts, dropping the words at the start of second that repeat the end of first."""
+    a, b = first.split(), second.split()
+    for n in range(min(len(a), len(b), MAX_OVERLAP_WORDS), 0, -1):
+        if a[-n:] == b[:n]:
+            return ' '.join(a + b[n:])
+    return ' '.join(a + b)
+
+
+def merge_adjacent(relevant_df):
+    """
+    Merge rows with consecutive chunk_ids from the same video.
+
+    The merged passage keeps the first chunk's chunk_id, spans the whole time
+    range and takes the position of its best-ranked chunk. Row order of the
+    input is the ranking.
+    """
+    if len(relevant_df) < 2:
+        return relevant_df
+    ranked = relevant_df.assign(_rank=np.arange(len(relevant_df)))
+    passages = []
+    for _, group in ranked.sort_values(['video_url', 'chunk_id']).groupby('video_url', sort=False):
+        current = None
+        for index, row in group.iterrows():
+            if current is not None and row['chunk_id'] == current['_last_id'] + 1:
+                current['text'] = join_overlapping(current['text'], row['text'])
+                current['end_time'] = max(current['end_time'], row['end_time'])
+                current['_last_id'] = row['chunk_id']
+                current['_rank'] = min(current['_rank'], row['_rank'])
+                continue
+            if current is not None:
+                passages.append(current)
+            current = {**row.to_dict(), '_last_id': row['chunk_id'], '_index': index}
+        passages.append(current)
+    passages.sort(key=lambda p: p['_rank'])
+    index = [p.pop('_index') for p in passages]
+    merged = pd.DataFrame(passages, index=index).drop(columns=['_rank', '_last_id'])
+    return merged[relevant_df.columns]
+
+
+class TokenCounter:
+    """
+    Counts tokens with a local Hugging Face tokenizer.
+
+    Without a tokenizer it estimates 4 characters per token. The MiniLM
+    WordPiece tokenizer splits English a little finer than Llama's, so its
+    counts err on the side of a smaller prompt.
+    """
+
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer
+
+    def count(self, text):
+        return self.count_many([text])[0] if text else 0
+
+    def count_many(self, texts):
+        if self.tokenizer is None:
+            return [(len(text) + 3) // 4 for text in texts]
+        encoded = self.tokenizer(list(texts), add_special_tokens=False, verbose=False)['input_ids']
+        return [len(ids) for ids in encoded]
+
+
+def trim_to_words(text, max_tokens, counter):
+    """Keep the leading words of text within max_tokens; returns (text, tokens)."""
+    words = text.split()
+    low, high = 0, len(words)
+    # Binary search for the most words that fit (counts grow with the prefix)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if counter.count(' '.join(words[:mid])) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    kept = ' '.join(words[:low])
+    return kept, counter.count(kept)
+
+
+def trim_to_tokens(text, max_tokens, counter, min_tokens=0):
+    """
+    Keep whole leading sentences of text within max_tokens; returns (text, tokens).
+
+    When that keeps fewer than min_tokens (a long first sentence, or
+    auto-generated captions with no punctuation at all), cut at the last
+    word that fits instead.
+    """
+    sentences = SENTENCE.findall(text)
+    kept, used = [], 0
+    for sentence, n in zip(sentences, counter.count_many(sentences)):
+        if used + n > max_tokens:
+            break
+        kept.append(sentence)
+        used += n
+    if used < min_tokens:
+        return trim_to_words(text, max_tokens, counter)
+    return ''.join(kept).strip(), used
+
+
+def pack_context(relevant_df, budget, counter, min_passage_tokens=40):
+    """
+    Fill a token budget with passages, most relevant (first row) first.
+
+    Each video's title and URL are listed once; passages cite it by label
+    together with the start second for the YouTube link. The passage that
+    does not fit is cut at a sentence boundary (a word boundary if that
+    leaves less than min_passage_tokens) and packing stops there.
+
+    Returns (context, packed_df, context_tokens); packed_df holds the
+    passages that made it in, with trimmed text.
+    """
+    videos, legend, blocks, packed = {}, [], [], []
+    used = counter.count(CONTEXT_HEADER) + counter.count("Videos:")
+    for index, row in relevant_df.iterrows():
+        label = videos.get(row['video_url'])
+        new_video = label is None
+        if new_video:
+            label = f"V{len(videos) + 1}"
+            line = f"{label}: {row['video_title']} | {row['video_url']}"
+        tag = f"[{label} t={int(round(row['start_time'] * 60))}s {row['start_time']:.2f}-{row['end_time']:.2f} min]"
+        overhead = counter.count(tag) + (counter.count(line) if new_video else 0)
+        room = budget - used - overhead
+        if room < min_passage_tokens:
+            break
+        text = row['text']
+        tokens = counter.count(text)
+        trimmed = tokens > room
+        if trimmed:
+            text, tokens = trim_to_tokens(text, room, counter, min_passage_tokens)
+            if tokens < min_passage_tokens:
+                # Only possible with a single word longer than the room left
+                if packed:
+                    break
+                continue
+        if new_video:
+            videos[row['video_url']] = label
+            legend.append(line)
+        blocks.append(f"{tag} {text}")
+        packed.append((index, {**row.to_dict(), 'text': text}))
+        used += overhead + tokens
+        if trimmed:
+            break
+
+    context = "\n".join([CONTEXT_HEADER, "Videos:", *legend, "", *blocks])
+    packed_df = pd.DataFrame([r for _, r in packed], index=[i for i, _ in packed], columns=relevant_df.columns)
+    return context, packed_df, used
@@ -0,0 +1,129 @@
+"""
+Compact quantized codes for first-pass candidate search.
+
+Two code types are supported:
+
+    int8    per-dimension scaled int8 vectors (4x smaller than float32)
+    binary  sign bits packed 8 per byte, compared by Hamming distance (32x smaller)
+
+The codes pick a shortlist of candidates; the shortlist is then rescored
+exactly against the float32 vectors, which stay memory-mapped on disk and are
+only paged in for the rows that are actually rescored.
+
+Build codes for an existing index directory with:
+
+    python -m quantized_index index --kind int8
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from retrieval import top_k_indices
+
+# Number of set bits for every byte value, for Hamming distance on packed codes
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+BLOCK_ROWS = 8192
+
+
+class QuantizedIndex:
+    """Quantized codes over the rows of the corpus matrix, with exact rescoring."""
+
+    def __init__(self, kind, codes, scale=None, shortlist=100):
+        if kind not in ('int8', 'binary'):
+            raise ValueError(f"Unknown quantization kind: {kind}")
+        self.kind = kind
+        self.codes = codes
+        self.scale = scale
+        self.shortlist = shortlist
+
+    @classmethod
+    def build(cls, vectors, kind='int8'):
+        """Quantize (normalized) vectors, in blocks so memory-mapped input stays cheap."""
+        n, dim = vectors.shape
+        if kind == 'int8':
+            scale = np.zeros(dim, dtype=np.float32)
+            for start in range(0, n, BLOCK_ROWS):
+                block = np.abs(np.asarray(vectors[start:start + BLOCK_ROWS], dtype=np.float32))
+                np.maximum(scale, block.max(axis=0), out=scale)
+            scale = np.where(scale > 0, scale / 127.0, 1.0).astype(np.float32)
+            codes = np.empty((n, dim), dtype=np.int8)
+            for start in range(0, n, BLOCK_ROWS):
+                block = np.asarray(vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+                codes[start:start + BLOCK_ROWS] = np.clip(np.rint(block / scale), -127, 127)
+            return cls(kind, codes, scale)
+        if kind == 'binary':
+            codes = np.empty((n, (dim + 7) // 8), dtype=np.uint8)
+            for start in range(0, n, BLOCK_ROWS):
+                block = np.asarray(vectors[start:start + BLOCK_ROWS])
+                codes[start:start + BLOCK_ROWS] = np.packbits(block > 0, axis=1)
+            return cls(kind, codes)
+        raise ValueError(f"Unknown quantization kind: {kind}")
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def save(self, directory):
+        np.save(os.path.join(directory, f'{self.kind}_codes.npy'), self.codes)
+        if self.scale is not None:
+            np.save(os.path.join(directory, f'{self.kind}_scale.npy'), self.scale)
+        with open(os.path.join(directory, f'{self.kind}.json'), 'w') as f:
+            json.dump({'kind': self.kind, 'count': int(self.codes.shape[0])}, f, indent=2)
+
+    @classmethod
+    def load(cls, directory, kind, shortlist=100):
+        scale_path = os.path.join(directory, f'{kind}_scale.npy')
+        return cls(
+            kind,
+            np.load(os.path.join(directory, f'{kind}_codes.npy')),
+            np.load(scale_path) if os.path.exists(scale_path) else None,
+            shortlist=shortlist,
+        )
+
+    @staticmethod
+    def exists(directory, kind):
+        return os.path.exists(os.path.join(directory, f'{kind}.json'))
+
+    def approximate_scores(self, query):
+        """Score every row from the codes alone (higher is better)."""
+        n = self.codes.shape[0]
+        if self.kind == 'int8':
+            scaled = query * self.scale
+            scores = np.empty(n, dtype=np.float32)
+            for start in range(0, n, BLOCK_ROWS):
+                scores[start:start + BLOCK_ROWS] = self.codes[start:start + BLOCK_ROWS].astype(np.float32) @ scaled
+            return scores
+        packed = np.packbits(query > 0)
+        scores = np.empty(n, dtype=np.int32)
+        for start in range(0, n, BLOCK_ROWS):
+            distance = POPCOUNT[np.bitwise_xor(self.codes[start:start + BLOCK_ROWS], packed)].sum(axis=1, dtype=np.int32)
+            scores[start:start + BLOCK_ROWS] = -distance
+        return scores
+
+    def search(self, matrix, query, top_k=7, shortlist=None):
+        """Pick a shortlist from the codes, rescore it on matrix and return (indices, scores)."""
+        shortlist = max(top_k, shortlist or self.shortlist)
+        ids = np.sort(top_k_indices(self.approximate_scores(query), shortlist))
+        scores = np.asarray(matrix[ids], dtype=np.float32) @ query
+        best = top_k_indices(scores, top_k)
+        return ids[best], scores[best]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('index_dir')
+    parser.add_argument('--kind', choices=['int8', 'binary'], default='int8')
+    args = parser.parse_args()
+
+    vectors = np.load(os.path.join(args.index_dir, 'vectors.npy'), mmap_mode='r')
+    index = QuantizedIndex.build(vectors, kind=args.kind)
+    index.save(args.index_dir)
+    print(f"Wrote {args.kind} codes for {index.codes.shape[0]} vectors "
+          f"({index.nbytes / 1e6:.1f} MB vs {vectors.nbytes / 1e6:.1f} MB float32) to {args.index_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+
+
+def normalize_question(text):
+    """
+    Normalize a question for cache lookups.
+
+    Case, punctuation/symbols and runs of whitespace are ignored, so
+    "What is cancer?" and "  what is CANCER " share one entry.
+    """
+    text = unicodedata.normalize('NFKC', text).casefold()
+    text = ''.join(' ' if unicodedata.category(ch)[0] in 'PS' else ch for ch in text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU cache of question embeddings with TTL expiry.
+
+    Keys are normalized question strings. If a path is given, the cache can be
+    saved to and restored from disk with joblib so restarts do not start cold.
+    """
+
+    COUNTERS = ('hits', 'misses', 'evictions')
+
+    def __init__(self, max_size=1024, ttl_seconds=3600, path=None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self._entries = OrderedDict()  # key -> (embedding, stored_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expired(self, stored_at, now):
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+
+    def get(self, question):
+        """Return the cached embedding for a question, or None."""
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[1], now):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, question, embedding):
+        key = normalize_question(question)
+        with self._lock:
+            self._entries[key] = (embedding, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, question, compute):
+        """Return the cached embedding, calling compute() and caching it on a miss."""
+        embedding = self.get(question)
+        if embedding is None:
+            embedding = compute()
+            self.put(question, embedding)
+        return embedding
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def save(self):
+        """Write unexpired entries to self.path (atomically via a temp file)."""
+        if not self.path:
+            return
+        now = time.time()
+        with self._lock:
+            entries = [(k, v, t) for k, (v, t) in self._entries.items() if not self._expired(t, now)]
+        # Per-process temp file: several gunicorn workers may save at shutdown
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        joblib.dump(entries, tmp_path)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """Restore entries saved by save(); a missing or unreadable file is ignored."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            entries = joblib.load(self.path)
+        except Exception as e:
+            print(f"Could not load embedding cache from {self.path}: {str(e)}")
+            return
+        now = time.time()
+        with self._lock:
+            for key, embedding, stored_at in entries[-self.max_size:]:
+                if not self._expired(stored_at, now):
+                    self._entries[key] = (embedding, stored_at)
+
+
+class SemanticAnswerCache:
+    """
+    Cache of generated answers keyed on question meaning.
+
+    A lookup hits when a cached question embedding is within a cosine
+    threshold of the new one AND retrieval returned exactly the same set of
+    chunk ids, so a paraphrase only reuses an answer built from the same
+    context. Entries are evicted LRU, and the whole cache is dropped when the
+    corpus version changes.
+    """
+
+    COUNTERS = ('hits', 'misses', 'evictions', 'invalidations')
+
+    def __init__(self, max_size=512, threshold=0.95, version=None):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.version = version
+        self._entries = OrderedDict()  # entry id -> (unit embedding, chunk ids, answer, sources)
+        self._matrix = None  # stacked embeddings of _entries, rebuilt lazily
+        self._matrix_ids = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._matrix = None
+            self.version = version
+
+    def lookup(self, embedding, chunk_ids, version=None):
+        """Return (answer, sources) for a matching cached question, or None."""
+        query = np.asarray(embedding, dtype=np.float32).ravel()
+        query = query / (np.linalg.norm(query) or 1.0)
+        chunk_ids = frozenset(int(i) for i in chunk_ids)
+        with self._lock:
+            self._check_version(version)
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix_ids = list(self._entries)
+                self._matrix = np.vstack([self._entries[i][0] for i in self._matrix_ids])
+            similarities = self._matrix @ query
+            for pos in np.argsort(similarities)[::-1]:
+                if similarities[pos] < self.threshold:
+                    break
+                entry_id = self._matrix_ids[pos]
+                _, cached_ids, answer, sources = self._entries[entry_id]
+                if cached_ids == chunk_ids:
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return answer, [dict(s) for s in sources]
+            self.misses += 1
+            return None
+
+    def store(self, embedding, chunk_ids, answer, sources, version=None):
+        query = np.asarray(embedding, dtype=np.float32).ravel()
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            self._check_version(version)
+            self._entries[self._next_id] = (
+                query, frozenset(int(i) for i in chunk_ids), answer, [dict(s) for s in sources]
+            )
+            self._next_id += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'threshold': self.threshold,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
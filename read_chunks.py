@@ -1,46 +1,391 @@
+"""
+Build the search corpus from the transcript JSON files, incrementally.
+
+    python read_chunks.py [--source transcripts_json] [--index index] [--processes 4] [--full]
+
+The index records the SHA-256 of every source file (ingest.json, with the
+embedding model and its version) and of every chunk text it holds
+(chunk_hashes.npy, one digest per row). A run
+only parses files whose hash changed, only embeds chunk texts the index
+does not already have a vector for, and drops the videos whose file was
+removed, so its cost grows with the size of the change rather than the
+corpus. A different model (or --full) re-embeds everything.
+
+Ingestion streams: chunks are read file by file, texts to embed are
+gathered across files into fixed-size batches (--batch-size), encoded on
+one process or a SentenceTransformer multi-process pool (--processes), and
+their vectors written straight into the new index's memory-mapped
+vectors.npy. The memory this takes stays flat however large the corpus
+(embed_peak_heap_mb in the summary); the IVF, quantized and BM25 builds
+that follow work in blocks but keep their own output arrays in memory. The
+run reports chunks per second per core and its peak memory.
+
+The new index, with its IVF, quantized and BM25 files, is built in a fresh
+generation directory and published by atomically repointing the index
+symlink (index_store.publish_index). --joblib also writes the old
+embeddings.joblib DataFrame (replaced atomically), which does need the
+whole corpus in memory.
+"""
+import argparse
+import hashlib
 import json
 import os
+import resource
+import threading
+import time
 import pandas as pd
 import numpy as np
 import joblib
+from index_store import IndexWriter, ChunkTable, open_index, index_exists, new_generation, publish_index
+from ivf_index import IVFIndex
+from quantized_index import QuantizedIndex
+from bm25_index import BM25Index
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
-from sentence_transformers import SentenceTransformer
 # from sklearn.metrics.pairwise import cosine_similarity
 
+MODEL_NAME = 'all-MiniLM-L6-v2'
+INGEST_MANIFEST = 'ingest.json'
+CHUNK_HASHES = 'chunk_hashes.npy'
+INGEST_VERSION = 2
+# Chunks per encode batch, gathered across files
+BATCH_SIZE = 4096
+
 def create_embeddings(text_list, model):
     """Create embeddings for a list of texts."""
     embeddings = model.encode(text_list, show_progress_bar=True)
     return embeddings
 
-# Load model once
-print("Loading model...")
-model = SentenceTransformer('all-MiniLM-L6-v2')
-print("Model loaded!\n")
+_model = None
+
+def load_model():
+    """Load the model once; runs that embed nothing never import torch."""
+    global _model
+    if _model is None:
+        from sentence_transformers import SentenceTransformer
+        print("Loading model...")
+        _model = SentenceTransformer(MODEL_NAME)
+        print("Model loaded!\n")
+    return _model
+
+def __getattr__(name):
+    # `from read_chunks import model` still works, but loads the model on first use
+    if name == 'model':
+        return load_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def model_key():
+    """Model name and library version; vectors are only reused under the same key."""
+    try:
+        from importlib.metadata import version
+        library = f"sentence-transformers {version('sentence-transformers')}"
+    except Exception:
+        library = 'sentence-transformers unknown'
+    return {'model': MODEL_NAME, 'model_version': library}
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+class ChunkHashes:
+    """Finds rows by chunk text digest in an index's chunk_hashes.npy, without a dict per chunk."""
+
+    def __init__(self, digests):
+        self.digests = digests
+        self.order = np.argsort(digests, kind='stable')
+
+    def lookup(self, keys):
+        """Row of each digest in keys, or -1 where the index has none."""
+        keys = np.asarray(keys, dtype='S32')
+        if not len(self.order) or not len(keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.digests, keys, sorter=self.order), len(self.order) - 1)
+        rows = self.order[pos]
+        return np.where(self.digests[rows] == keys, rows, -1)
+
+def load_previous(index_dir, key):
+    """(vectors, ChunkTable, ChunkHashes, ingest manifest) of the live index, or None if it cannot be reused."""
+    path = os.path.join(index_dir, INGEST_MANIFEST)
+    if not index_exists(index_dir) or not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('ingest_version') != INGEST_VERSION or \
+            {k: manifest.get(k) for k in key} != key:
+        print(f"Index was built with {manifest.get('model')} ({manifest.get('model_version')}); re-embedding everything")
+        return None
+    vectors, table, _ = open_index(index_dir)
+    hashes = ChunkHashes(np.load(os.path.join(index_dir, CHUNK_HASHES), mmap_mode='r'))
+    return vectors, table, hashes, manifest
+
+def read_transcript(path):
+    """Chunk rows (with their video's fields) and the chunk text hashes of one JSON file."""
+    with open(path, encoding='utf-8') as f:
+        content = json.load(f)
+    rows = []
+    for chunk in content['chunks']:
+        rows.append({
+            'chunk_id': chunk['chunk_id'],
+            'text': chunk['text'],
+            'start_time': chunk['start_time'],
+            'end_time': chunk['end_time'],
+            'video_id': content['video_id'],
+            'video_title': content['video_title'],
+            'video_url': content['video_url'],
+            'duration_minutes': content['duration_minutes'],
+        })
+    return pd.DataFrame(rows), [text_sha256(row['text']) for row in rows]
+
+class Embedder:
+    """Encodes batches of texts in this process, or on a multi-process pool across CPU cores."""
+
+    def __init__(self, processes=1, batch_size=64):
+        self.model = load_model()
+        self.batch_size = batch_size
+        self.pool = None
+        if processes > 1:
+            # Each worker gets its share of the cores rather than a thread per core
+            threads = os.environ.get('OMP_NUM_THREADS')
+            os.environ['OMP_NUM_THREADS'] = str(max(1, available_cores() // processes))
+            try:
+                self.pool = self.model.start_multi_process_pool(target_devices=['cpu'] * processes)
+            finally:
+                if threads is None:
+                    os.environ.pop('OMP_NUM_THREADS')
+                else:
+                    os.environ['OMP_NUM_THREADS'] = threads
+        self.seconds = 0.0
+        self.count = 0
+
+    @property
+    def dim(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts):
+        start = time.perf_counter()
+        if self.pool is not None:
+            embeddings = self.model.encode_multi_process(texts, self.pool, batch_size=self.batch_size)
+        else:
+            embeddings = self.model.encode(texts, batch_size=self.batch_size, show_progress_bar=False)
+        self.seconds += time.perf_counter() - start
+        self.count += len(texts)
+        return embeddings
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+def available_cores():
+    return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+
+def peak_rss_mb():
+    """Peak resident memory of this process and of its finished children (Linux reports KB)."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(own / 1024, 1), round(children / 1024, 1)
+
+def heap_mb():
+    """
+    Anonymous (heap) memory of this process in MB, from /proc; None elsewhere.
+
+    RSS also counts the pages of the memory-mapped index files, which the
+    kernel can drop at any time, so it grows with the corpus even when the
+    process's own allocations do not.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('RssAnon:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+class HeapSampler:
+    """Peak of heap_mb() while the block runs, sampled by a background thread."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = heap_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            heap = heap_mb()
+            if heap is not None:
+                self.peak = max(self.peak, heap)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def ingest(source_dir, index_dir, joblib_path=None, full=False, processes=1, batch_size=BATCH_SIZE):
+    """Bring index_dir (and joblib_path) up to date with source_dir; returns a summary dict."""
+    with HeapSampler() as heap:
+        summary = _ingest(source_dir, index_dir, joblib_path, full, processes, batch_size, heap)
+    summary['peak_heap_mb'] = heap.peak
+    summary['peak_rss_mb'], summary['peak_child_rss_mb'] = peak_rss_mb()
+    return summary
+
+def _ingest(source_dir, index_dir, joblib_path, full, processes, batch_size, heap):
+    start = time.perf_counter()
+    key = model_key()
+    previous = None if full else load_previous(index_dir, key)
+    old_vectors, old_table, old_hashes, old_manifest = previous if previous else (None, None, None, {'files': {}})
+    old_files = old_manifest['files']
+
+    names = sorted(f for f in os.listdir(source_dir) if f.endswith('.json'))
+    file_hashes = {name: file_sha256(os.path.join(source_dir, name)) for name in names}
+    unchanged = {n for n in names if n in old_files and old_files[n]['sha256'] == file_hashes[n]}
+    summary = {
+        'files': len(names),
+        'unchanged_files': len(unchanged),
+        'changed_files': sum(1 for n in names if n in old_files and n not in unchanged),
+        'new_files': sum(1 for n in names if n not in old_files),
+        'removed_files': sum(1 for n in old_files if n not in file_hashes),
+    }
+    if previous and len(unchanged) == len(names) and not summary['removed_files']:
+        print(f"Index is up to date ({len(names)} files)")
+        return {**summary, 'chunks': len(old_table), 'reused_chunks': len(old_table),
+                'embedded_chunks': 0, 'seconds': round(time.perf_counter() - start, 2)}
+
+    def old_rows(digests):
+        return old_hashes.lookup(digests) if old_hashes is not None else np.full(len(digests), -1)
+
+    # First pass: row counts and the texts that need embedding, to size the new index
+    files, pending, count = {}, [], 0
+    for name in names:
+        if name in unchanged:
+            entry = old_files[name]
+            rows, video_id = entry['rows'][1], entry['video_id']
+        else:
+            df, digests = read_transcript(os.path.join(source_dir, name))
+            rows, video_id = len(df), (str(df['video_id'].iloc[0]) if len(df) else None)
+            pending.append(np.asarray(digests, dtype='S32')[old_rows(digests) < 0])
+        files[name] = {'sha256': file_hashes[name], 'video_id': video_id, 'rows': [count, rows]}
+        count += rows
+    if not count:
+        raise SystemExit(f"No chunks found in {source_dir}")
+    # Distinct texts to embed, sorted, and the new row that holds each one's vector
+    # once encoded: 40 bytes per text rather than a dict entry
+    pending = np.unique(np.concatenate(pending)) if pending else np.empty(0, dtype='S32')
+    encoded_at = np.full(len(pending), -1, dtype=np.int64)
+
+    embedder = Embedder(processes) if len(pending) else None
+    generation = new_generation(index_dir)
+    writer = IndexWriter(generation, count, embedder.dim if embedder else old_vectors.shape[1])
+    new_hashes = np.lib.format.open_memmap(os.path.join(generation, CHUNK_HASHES), mode='w+',
+                                           dtype='S32', shape=(count,))
+    print(f"{count} chunks, {len(pending)} to embed in batches of {batch_size}"
+          + (f" on {processes} processes" if embedder and processes > 1 else ""))
+
+    # Second pass: write every row; new texts wait in a batch until it is full
+    batch = {}  # pending slot -> (text, [rows])
+
+    def flush():
+        if not batch:
+            return
+        embeddings = embedder.encode([text for text, _ in batch.values()])
+        for (slot, (_, rows)), embedding in zip(batch.items(), embeddings):
+            writer.set_vectors(rows, np.broadcast_to(embedding, (len(rows), len(embedding))))
+            encoded_at[slot] = rows[0]
+        batch.clear()
+        print(f"  embedded {embedder.count}/{len(pending)} "
+              f"({embedder.count / embedder.seconds:.0f} chunks/s)")
+
+    try:
+        for name in names:
+            first, rows = files[name]['rows']
+            if name in unchanged:
+                old_first = old_files[name]['rows'][0]
+                writer.add(old_table.take(range(old_first, old_first + rows)),
+                           old_vectors[old_first:old_first + rows])
+                new_hashes[first:first + rows] = old_hashes.digests[old_first:old_first + rows]
+                continue
+            print("processing: ", name)
+            df, digests = read_transcript(os.path.join(source_dir, name))
+            writer.add(df)
+            new_hashes[first:first + rows] = digests
+            found = old_rows(digests)
+            if (found >= 0).any():
+                writer.set_vectors(first + np.flatnonzero(found >= 0), old_vectors[found[found >= 0]])
+            missing = np.flatnonzero(found < 0)
+            slots = np.searchsorted(pending, np.asarray(digests, dtype='S32')[missing])
+            for i, slot in zip(missing, slots):
+                if encoded_at[slot] >= 0:
+                    writer.vectors[first + i] = writer.vectors[encoded_at[slot]]
+                    continue
+                batch.setdefault(slot, (df['text'].iat[i], []))[1].append(first + i)
+                if len(batch) >= batch_size:
+                    flush()
+        flush()
+    finally:
+        if embedder is not None:
+            embedder.close()
+    writer.close()
+    new_hashes.flush()
+    # Per-chunk bookkeeping is not needed by the steps below
+    del pending, encoded_at
+    # The search indexes built next hold their own output arrays in memory
+    summary['embed_peak_heap_mb'] = heap.peak
+
+    # approximate-search lists, used when RETRIEVAL_BACKEND=ivf
+    vectors = np.load(os.path.join(generation, 'vectors.npy'), mmap_mode='r')
+    IVFIndex.build(vectors).save(generation)
+    # compact codes, used when RETRIEVAL_BACKEND=int8 or binary
+    for kind in ('int8', 'binary'):
+        QuantizedIndex.build(vectors, kind=kind).save(generation)
+    # keyword index fused with the dense ranking (HYBRID_SEARCH)
+    table = ChunkTable(generation)
+    BM25Index.build(table.text(i) for i in range(len(table))).save(generation)
+    with open(os.path.join(generation, INGEST_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump({'ingest_version': INGEST_VERSION, **key, 'files': files}, f)
+    publish_index(generation, index_dir)
+
+    if joblib_path:
+        # save this df (the legacy format main.py falls back to)
+        df = table.take(range(len(table)))
+        df['embedding'] = list(np.asarray(vectors).tolist())
+        tmp = f"{joblib_path}.tmp-{os.getpid()}"
+        joblib.dump(df, tmp)
+        os.replace(tmp, joblib_path)
+
+    embedded = embedder.count if embedder else 0
+    summary.update({'chunks': count, 'reused_chunks': count - embedded, 'embedded_chunks': embedded,
+                    'seconds': round(time.perf_counter() - start, 2)})
+    if embedded:
+        rate = embedded / embedder.seconds
+        summary.update({'encode_seconds': round(embedder.seconds, 2), 'cores': available_cores(),
+                        'chunks_per_second': round(rate, 1),
+                        'chunks_per_second_per_core': round(rate / available_cores(), 1)})
+    return summary
 
 if __name__ == "__main__":
-    # Get all JSON files
-    jsons = [f for f in os.listdir('transcripts_json') if f.endswith('.json')]
-
-    chunks = []
-
-    for json_file in jsons:
-        with open(f"transcripts_json/{json_file}",encoding='utf-8') as f:
-            content = json.load(f)
-        print("processing: ", json_file)
-        
-        print(f"Creating Embeddings for {json_file}")
-        embeddings = create_embeddings([c['text'] for c in content['chunks']], model)
-        
-        for i, chunk in enumerate(content['chunks']):
-            chunk['video_id'] = content['video_id']
-            chunk['video_title'] = content['video_title']
-            chunk['video_url'] = content['video_url']
-            chunk['duration_minutes'] = content['duration_minutes']
-            chunk['embedding'] = embeddings[i].tolist()
-            chunks.append(chunk)
-    df = pd.DataFrame.from_records(chunks)
-    print(df)
-    # save this df 
-    joblib.dump(df, 'embeddings.joblib')
-
-                                 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', default='transcripts_json', help='directory of transcript JSON files')
+    parser.add_argument('--index', default='index')
+    parser.add_argument('--joblib', default=None, help='also write the embeddings DataFrame here (holds the corpus in memory)')
+    parser.add_argument('--full', action='store_true', help='ignore the existing index and re-embed everything')
+    parser.add_argument('--processes', type=int, default=1, help='encoding processes (a SentenceTransformer pool)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='chunks per encode batch, across files')
+    args = parser.parse_args()
+    summary = ingest(args.source, args.index, args.joblib, args.full, args.processes, args.batch_size)
+    print(f"{summary['files']} files ({summary['new_files']} new, {summary['changed_files']} changed, "
+          f"{summary['removed_files']} removed): {summary['chunks']} chunks, "
+          f"{summary['embedded_chunks']} embedded, {summary['reused_chunks']} reused, {summary['seconds']}s, "
+          f"peak heap {summary['peak_heap_mb']} MB (embedding {summary.get('embed_peak_heap_mb')} MB), "
+          f"peak RSS {summary['peak_rss_mb']} MB")
+    if summary['embedded_chunks']:
+        print(f"Encoding: {summary['chunks_per_second']} chunks/s, "
+              f"{summary['chunks_per_second_per_core']} chunks/s per core ({summary['cores']} cores)")
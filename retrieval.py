@@ -0,0 +1,177 @@
+import numpy as np
+import joblib
+
+
+def normalize_rows(matrix):
+    """L2-normalize each row of a matrix (zero rows are left as zeros)."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_indices(scores, k):
+    """Return indices of the k highest scores, best first, without a full sort."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(scores, -k)[-k:]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=60):
+    """
+    Fuse several best-first lists of chunk ids with reciprocal-rank fusion.
+
+    Each id scores sum(1 / (k + rank)) over the lists it appears in, so ids
+    ranked well by any retriever rise without comparing raw score scales.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, i in enumerate(ranking.tolist()):
+            fused[i] = fused.get(i, 0.0) + 1.0 / (k + rank + 1)
+    best = sorted(fused.items(), key=lambda item: -item[1])[:top_k]
+    return (np.array([i for i, _ in best], dtype=np.int64),
+            np.array([score for _, score in best], dtype=np.float32))
+
+
+class FrameTable:
+    """Chunk metadata held in an in-memory DataFrame (the embeddings.joblib path)."""
+
+    def __init__(self, df):
+        self.df = df.reset_index(drop=True)
+        # Counted once; the table never changes after loading
+        self.num_videos = self.df['video_id'].nunique() if 'video_id' in self.df else 0
+
+    def __len__(self):
+        return len(self.df)
+
+    def take(self, indices):
+        return self.df.iloc[indices].copy()
+
+
+class RetrievalEngine:
+    """
+    Exact cosine-similarity search over the chunk embeddings.
+
+    The embeddings are stacked once into a contiguous float32 matrix of
+    L2-normalized rows, so a query is a single matrix-vector product
+    followed by a partial top-k selection.
+    """
+
+    def __init__(self, table, matrix, normalized=False, ann=None, lexical=None, fusion_candidates=50, rrf_k=60):
+        self.table = table
+        # Optional approximate backend (IVFIndex or QuantizedIndex); None means exact search
+        self.ann = ann
+        # Optional BM25Index; when set, searches with query text are hybrid
+        self.lexical = lexical
+        self.fusion_candidates = fusion_candidates
+        self.rrf_k = rrf_k
+        if normalized:
+            # Already unit length on disk (e.g. a memory-mapped index): use as-is
+            self.matrix = matrix
+        else:
+            self.matrix = np.ascontiguousarray(normalize_rows(np.asarray(matrix, dtype=np.float32)))
+        # Fixed for the life of the engine, so computed here rather than per /stats call
+        self.corpus_stats = {
+            'total_videos': table.num_videos if table is not None else 0,
+            'total_chunks': len(self.matrix),
+            'dimensions': int(self.matrix.shape[1]) if self.matrix.ndim == 2 else 0,
+            'hybrid': lexical is not None,
+            'lexical_terms': len(lexical.vocab) if lexical is not None else 0,
+        }
+
+    @classmethod
+    def from_dataframe(cls, df, hybrid=False):
+        """
+        Build the engine from the DataFrame written by read_chunks.py.
+
+        With hybrid=True a BM25 index is built over the texts in memory.
+        """
+        matrix = np.vstack(df['embedding'].values).astype(np.float32)
+        lexical = None
+        if hybrid:
+            from bm25_index import BM25Index
+            lexical = BM25Index.build(df['text'])
+        return cls(FrameTable(df.drop(columns=['embedding'])), matrix, lexical=lexical)
+
+    @classmethod
+    def from_joblib(cls, path='embeddings.joblib', hybrid=False):
+        """Load embeddings.joblib and build the engine."""
+        return cls.from_dataframe(joblib.load(path), hybrid=hybrid)
+
+    @classmethod
+    def from_index(cls, directory, backend='exact', nprobe=8, shortlist=100, hybrid=False, scan_budget=10000):
+        """
+        Open a memory-mapped index directory written by index_store.
+
+        hybrid=True also opens the BM25 index written by bm25_index and fuses
+        its ranking with the dense one for searches that pass query text.
+
+        backend is one of:
+            'exact'   brute force over the float32 vectors
+            'ivf'     IVF lists built by ivf_index, probing nprobe lists
+            'int8'    int8 codes built by quantized_index, rescoring a shortlist
+            'binary'  sign-bit codes built by quantized_index, rescoring a shortlist
+        """
+        from index_store import open_index
+        vectors, table, _ = open_index(directory)
+        ann = None
+        if backend == 'ivf':
+            from ivf_index import IVFIndex
+            if not IVFIndex.exists(directory):
+                raise FileNotFoundError(f"No IVF index in {directory}; run: python -m ivf_index {directory}")
+            ann = IVFIndex.load(directory, nprobe=nprobe)
+        elif backend in ('int8', 'binary'):
+            from quantized_index import QuantizedIndex
+            if not QuantizedIndex.exists(directory, backend):
+                raise FileNotFoundError(
+                    f"No {backend} codes in {directory}; run: python -m quantized_index {directory} --kind {backend}")
+            ann = QuantizedIndex.load(directory, backend, shortlist=shortlist)
+        elif backend != 'exact':
+            raise ValueError(f"Unknown retrieval backend: {backend}")
+        lexical = None
+        if hybrid:
+            from bm25_index import BM25Index
+            if not BM25Index.exists(directory):
+                raise FileNotFoundError(f"No BM25 index in {directory}; run: python -m bm25_index {directory}")
+            lexical = BM25Index.load(directory, scan_budget=scan_budget)
+        return cls(table, vectors, normalized=True, ann=ann, lexical=lexical)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def search(self, query_embedding, top_k=7, query_text=None):
+        """
+        Return (indices, scores) of the top_k chunks for a query embedding.
+
+        If a lexical index is loaded and query_text is given, the dense and
+        BM25 rankings are fused and the scores are RRF scores.
+        """
+        if self.lexical is not None and query_text:
+            dense, _ = self.dense_search(query_embedding, max(top_k, self.fusion_candidates))
+            lexical, _ = self.lexical.search(query_text, max(top_k, self.fusion_candidates))
+            return reciprocal_rank_fusion([dense, lexical], top_k, k=self.rrf_k)
+        return self.dense_search(query_embedding, top_k)
+
+    def dense_search(self, query_embedding, top_k=7):
+        """Embedding-only search, exact or through the approximate backend."""
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        if self.ann is not None:
+            return self.ann.search(self.matrix, query, top_k)
+        scores = self.matrix @ query
+        indices = top_k_indices(scores, top_k)
+        return indices, scores[indices]
+
+    def vectors(self, indices):
+        """Return the unit embeddings of the given chunk indices."""
+        return np.asarray(self.matrix[indices])
+
+    def rows(self, indices):
+        """Return the metadata rows for the given chunk indices as a DataFrame."""
+        return self.table.take(indices)
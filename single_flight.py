@@ -0,0 +1,290 @@
+"""
+Single-flight coalescing of identical in-flight work.
+
+When several callers ask for the same key at the same time, only one of them
+(the leader) runs the work; the others wait and receive the leader's result.
+
+Coalescing happens at two levels:
+
+    in-process     threads of one worker wait on the leader's Future
+    cross-process  gunicorn workers on one host coordinate through a small
+                   SQLite file: the leader holds a lease row for the key and
+                   publishes a JSON result that the other workers poll for
+
+A lease expires after lease_seconds, so a crashed leader cannot block a key.
+Followers wait at most max_wait seconds (the request deadline) for the
+leader, then run the work themselves.
+
+do() serves threads; do_async() serves coroutines (the ASGI app) through the
+same in-flight table and SQLite file, without blocking the event loop.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS flights (
+    key TEXT PRIMARY KEY,
+    token TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    token TEXT PRIMARY KEY,
+    ok INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    finished_at REAL NOT NULL
+);
+"""
+
+
+class LeaderGone(Exception):
+    """The in-process leader was cancelled before it had a result; its followers run the work themselves."""
+
+
+class SingleFlight:
+    """Coalesces concurrent calls per key; pass db_path to coordinate across processes."""
+
+    COUNTERS = ('calls', 'executed', 'coalesced_local', 'coalesced_remote', 'waits_exceeded')
+
+    def __init__(self, db_path=None, lease_seconds=120, poll_interval=0.05, result_ttl=60, max_wait=None):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self.max_wait = max_wait
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.calls = 0
+        self.executed = 0
+        self.coalesced_local = 0
+        self.coalesced_remote = 0
+        self.waits_exceeded = 0
+        if db_path:
+            self._connect()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _join(self, key):
+        """Return (future, is_leader) for key, registering a new flight if there is none."""
+        with self._lock:
+            self.calls += 1
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = Future()
+                return future, True
+            self.coalesced_local += 1
+            return future, False
+
+    def _land(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _waited_out(self):
+        with self._lock:
+            self.waits_exceeded += 1
+
+    def do(self, key, fn):
+        """Return fn()'s result, sharing one execution among concurrent callers of key."""
+        future, leader = self._join(key)
+        if not leader:
+            try:
+                return future.result(timeout=self.max_wait)
+            except FutureTimeout:
+                self._waited_out()
+            except LeaderGone:
+                pass
+            return self._run(fn)
+
+        try:
+            result = self._do_shared(key, fn) if self.db_path else self._run(fn)
+        except BaseException as e:
+            future.set_exception(e if isinstance(e, Exception) else LeaderGone())
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._land(key)
+
+    async def do_async(self, key, fn):
+        """do() for a coroutine function fn: awaits fn() or the leader's result."""
+        future, leader = self._join(key)
+        if not leader:
+            try:
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.max_wait)
+            except asyncio.TimeoutError:
+                self._waited_out()
+            except LeaderGone:
+                pass
+            return await self._run_async(fn)
+
+        try:
+            result = await (self._do_shared_async(key, fn) if self.db_path else self._run_async(fn))
+        except BaseException as e:
+            # A cancelled leader (the client went away) must not cancel its followers
+            future.set_exception(e if isinstance(e, Exception) else LeaderGone())
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._land(key)
+
+    def _run(self, fn):
+        with self._lock:
+            self.executed += 1
+        return fn()
+
+    async def _run_async(self, fn):
+        with self._lock:
+            self.executed += 1
+        return await fn()
+
+    # Cross-process coordination
+
+    def _acquire(self, key):
+        """Return (is_leader, token) for key, taking over expired leases."""
+        conn = self._connect()
+        now = time.time()
+        token = uuid.uuid4().hex
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT token, expires_at FROM flights WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] > now:
+                conn.execute("COMMIT")
+                return False, row[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO flights (key, token, expires_at) VALUES (?, ?, ?)",
+                (key, token, now + self.lease_seconds),
+            )
+            conn.execute("DELETE FROM results WHERE finished_at < ?", (now - self.result_ttl,))
+            conn.execute("COMMIT")
+            return True, token
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _publish(self, key, token, ok, value):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (token, ok, value, finished_at) VALUES (?, ?, ?, ?)",
+                (token, int(ok), value, time.time()),
+            )
+            conn.execute("DELETE FROM flights WHERE key = ? AND token = ?", (key, token))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _poll(self, key, token):
+        """
+        One look at another worker's flight: ('done', result), ('failed', None)
+        when the leader failed, ('lapsed', None) when its lease is gone
+        without a result, or None while it is still running.
+        """
+        conn = self._connect()
+        row = conn.execute("SELECT ok, value FROM results WHERE token = ?", (token,)).fetchone()
+        if row is not None:
+            if row[0]:
+                with self._lock:
+                    self.coalesced_remote += 1
+                return 'done', json.loads(row[1])
+            return 'failed', None
+        flight = conn.execute("SELECT token, expires_at FROM flights WHERE key = ?", (key,)).fetchone()
+        if flight is None or flight[0] != token or flight[1] <= time.time():
+            # The result may have been published between the two reads
+            if conn.execute("SELECT 1 FROM results WHERE token = ?", (token,)).fetchone() is None:
+                return 'lapsed', None
+        return None
+
+    def _wait_until(self):
+        return time.monotonic() + self.max_wait if self.max_wait is not None else float('inf')
+
+    def _do_shared(self, key, fn):
+        wait_until = self._wait_until()
+        while True:
+            is_leader, token = self._acquire(key)
+            if is_leader:
+                try:
+                    result = self._run(fn)
+                except Exception as e:
+                    self._publish(key, token, False, str(e))
+                    raise
+                self._publish(key, token, True, json.dumps(result))
+                return result
+
+            # Another worker owns the key: wait for its result or for the lease to lapse
+            while True:
+                polled = self._poll(key, token)
+                if polled is not None:
+                    break
+                if time.monotonic() >= wait_until:
+                    # Past the request deadline: answer this request without the leader
+                    self._waited_out()
+                    return self._run(fn)
+                time.sleep(self.poll_interval)
+            state, value = polled
+            if state == 'done':
+                return value
+            if state == 'failed':
+                # The leader failed: run the work ourselves rather than share its error
+                return self._run(fn)
+
+    async def _do_shared_async(self, key, fn):
+        wait_until = self._wait_until()
+        while True:
+            # BEGIN IMMEDIATE may wait on another writer, so it runs off the event loop
+            is_leader, token = await asyncio.to_thread(self._acquire, key)
+            if is_leader:
+                try:
+                    result = await self._run_async(fn)
+                except Exception as e:
+                    await asyncio.to_thread(self._publish, key, token, False, str(e))
+                    raise
+                except BaseException:
+                    # Cancelled: end the lease now so other workers do not wait it out
+                    self._publish(key, token, False, 'cancelled')
+                    raise
+                await asyncio.to_thread(self._publish, key, token, True, json.dumps(result))
+                return result
+
+            while True:
+                polled = self._poll(key, token)
+                if polled is not None:
+                    break
+                if time.monotonic() >= wait_until:
+                    self._waited_out()
+                    return await self._run_async(fn)
+                await asyncio.sleep(self.poll_interval)
+            state, value = polled
+            if state == 'done':
+                return value
+            if state == 'failed':
+                return await self._run_async(fn)
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'executed': self.executed,
+            'coalesced_local': self.coalesced_local,
+            'coalesced_remote': self.coalesced_remote,
+            'waits_exceeded': self.waits_exceeded,
+            'in_flight': len(self._inflight),
+        }
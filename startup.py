@@ -0,0 +1,146 @@
+"""
+Loading and warming up the slow parts of the app (the encoder and the index).
+
+Importing the sentence-transformers model pulls in torch and the weights,
+which takes seconds. A Startup runs that load off the import path so the
+process can serve /, /login and /healthz straight away:
+
+    eager       load and warm up while the app module is imported
+    background  load and warm up in a thread started at import (default)
+    lazy        load and warm up on the first query or /readyz probe
+    preload     load at import without warming up; used by gunicorn
+                --preload (gunicorn.conf.py), where the master loads once
+                and every forked worker shares those pages copy-on-write,
+                then warms up in its own process after the fork
+
+Threads do not survive a fork, so loading and warm-up are tracked per
+process: a forked worker finishes whatever its parent had not done yet.
+"""
+import os
+import threading
+import time
+
+
+class NotReady(Exception):
+    """The app is still loading (or failed to load); served as HTTP 503 + Retry-After."""
+
+    def __init__(self, state, retry_after=5.0):
+        super().__init__(f"Service is starting ({state}), please retry shortly.")
+        self.state = state
+        self.retry_after = retry_after
+
+
+def process_start_time():
+    """Wall-clock time this process was started (or forked), from /proc; now elsewhere."""
+    try:
+        with open('/proc/self/stat') as f:
+            # Fields after the command name; starttime is field 22 of the whole line
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+class Startup:
+    """Runs load() once and warm_up() once per process, in a background thread or inline."""
+
+    def __init__(self, load, warm_up=None):
+        self._load = load
+        self._warm_up = warm_up
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self.loaded = False
+        self.state = 'idle'  # idle, loading, loaded, warming, ready or failed
+        self.error = None
+        self.timings = {}
+        self._reset()
+
+    def _reset(self):
+        """Start this process's bookkeeping; what the parent loaded before a fork is kept."""
+        self._pid = os.getpid()
+        self._thread = None
+        self.started_at = process_start_time()
+        self.state = 'loaded' if self.loaded else 'idle'
+        self.timings = {k: v for k, v in self.timings.items() if k == 'load_seconds'}
+
+    @property
+    def ready(self):
+        return self.state == 'ready' and self._pid == os.getpid()
+
+    def start(self, background=True, warm_up=True):
+        """
+        Begin loading (and warming up) in this process unless it is done or under way.
+
+        With background=False, wait for it to finish in the calling thread.
+        A failed load is retried by the next call.
+        """
+        with self._cond:
+            if self._pid != os.getpid():
+                self._reset()
+            thread = self._thread
+            if thread is None and self.state != 'ready' and (warm_up or not self.loaded):
+                thread = self._thread = threading.Thread(target=self._run, args=(warm_up,),
+                                                         name='startup', daemon=True)
+                thread.start()
+        if not background and thread is not None:
+            thread.join()
+
+    def _run(self, warm_up):
+        try:
+            if not self.loaded:
+                self._set_state('loading')
+                start = time.perf_counter()
+                self._load()
+                self.timings['load_seconds'] = round(time.perf_counter() - start, 3)
+                self.loaded = True
+                self._set_state('loaded')
+            if warm_up:
+                self._set_state('warming')
+                start = time.perf_counter()
+                if self._warm_up is not None:
+                    self._warm_up()
+                self.timings['warm_up_seconds'] = round(time.perf_counter() - start, 3)
+                self.timings['ready_after_seconds'] = round(time.time() - self.started_at, 3)
+                self._set_state('ready')
+                print(f"Ready {self.timings['ready_after_seconds']:.1f}s after process start "
+                      f"(load {self.timings.get('load_seconds', 0):.1f}s, warm-up {self.timings['warm_up_seconds']:.2f}s)")
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"Startup failed: {self.error}")
+            self._set_state('failed')
+        finally:
+            with self._cond:
+                self._thread = None
+                self._cond.notify_all()
+
+    def _set_state(self, state):
+        with self._cond:
+            self.state = state
+            if state != 'failed':
+                self.error = None
+            self._cond.notify_all()
+
+    def wait(self, timeout=None):
+        """Start if needed and block until ready; raise NotReady after timeout seconds or on failure."""
+        self.start()
+        with self._cond:
+            self._cond.wait_for(lambda: self.ready or self.state == 'failed', timeout)
+            if not self.ready:
+                raise NotReady(self.state)
+
+    def served(self):
+        """Note a query answered; the first one sets first_query_after_seconds."""
+        if 'first_query_after_seconds' not in self.timings:
+            self.timings['first_query_after_seconds'] = round(time.time() - self.started_at, 3)
+
+    def status(self):
+        return {
+            'state': self.state if self._pid == os.getpid() else ('loaded' if self.loaded else 'idle'),
+            'ready': self.ready,
+            'error': self.error,
+            'uptime_seconds': round(time.time() - self.started_at, 3),
+            **self.timings,
+        }
@@ -158,29 +158,58 @@ async function logout() {
 // ===============================
 // Storage Functions (Server-side)
 // ===============================
+// Chats are listed without their messages; a chat's messages are fetched
+// page by page the first time it is opened (messages === null until then).
 async function loadUserChats() {
     try {
-        const response = await fetch('/chats');
-        if (response.ok) {
-            chats = await response.json();
-            renderChatHistory();
+        const loaded = [];
+        let offset = 0;
+        while (offset !== null) {
+            const response = await fetch(`/chats?offset=${offset}`);
+            if (!response.ok) break;
+            const page = await response.json();
+            page.chats.forEach(chat => loaded.push({ ...chat, messages: null }));
+            offset = page.next_offset;
         }
+        chats = loaded;
+        renderChatHistory();
     } catch (error) {
         console.error('Failed to load chats:', error);
         chats = [];
     }
 }
 
-async function saveChatsToServer() {
-    try {
-        await fetch('/chats', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(chats)
-        });
-    } catch (error) {
-        console.error('Failed to save chats:', error);
+async function loadChatMessages(chat) {
+    const messages = [];
+    let after = 0;
+    while (after !== null) {
+        const response = await fetch(`/chats/${encodeURIComponent(chat.id)}/messages?after=${after}`);
+        if (!response.ok) throw new Error('Failed to load messages');
+        const page = await response.json();
+        messages.push(...page.messages);
+        after = page.next_after;
     }
+    chat.messages = messages;
+}
+
+// Each change is sent on its own (one message, one title, ...), in order,
+// so a save costs the same however long the chat is
+let pendingSave = Promise.resolve();
+
+function sendChatUpdate(path, method, body = null) {
+    pendingSave = pendingSave.then(async () => {
+        const options = { method, headers: { 'Content-Type': 'application/json' } };
+        if (body !== null) options.body = JSON.stringify(body);
+        const response = await fetch(path, options);
+        if (!response.ok) throw new Error(`${method} ${path} failed with ${response.status}`);
+    }).catch(error => {
+        console.error('Failed to save chats:', error);
+    });
+    return pendingSave;
+}
+
+function chatPath(chatId) {
+    return `/chats/${encodeURIComponent(chatId)}`;
 }
 
 // ===============================
@@ -196,18 +225,29 @@ function createNewChat() {
 
     chats.unshift(newChat);
     currentChatId = newChat.id;
-    saveChatsToServer();
+    sendChatUpdate(chatPath(newChat.id), 'PUT', { title: newChat.title, createdAt: newChat.createdAt });
     renderChatHistory();
     clearMessages();
 }
 
-function loadChat(chatId) {
+async function loadChat(chatId) {
     const chat = chats.find(c => c.id === chatId);
     if (!chat) return;
 
     currentChatId = chatId;
     clearMessages();
 
+    if (chat.messages === null) {
+        try {
+            await loadChatMessages(chat);
+        } catch (error) {
+            console.error('Failed to load chat:', error);
+            return;
+        }
+        // Another chat was opened while this one loaded
+        if (currentChatId !== chatId) return;
+    }
+
     chat.messages.forEach(msg => {
         addMessage(msg.message, msg.role, msg.sources, false);
     });
@@ -219,7 +259,7 @@ function updateChatTitle(chatId, firstMessage) {
     const chat = chats.find(c => c.id === chatId);
     if (chat && chat.title === 'New Chat') {
         chat.title = firstMessage.substring(0, 30) + (firstMessage.length > 30 ? '...' : '');
-        saveChatsToServer();
+        sendChatUpdate(chatPath(chatId), 'PUT', { title: chat.title });
         renderChatHistory();
     }
 }
@@ -228,14 +268,14 @@ function renameChat(chatId, newName) {
     const chat = chats.find(c => c.id === chatId);
     if (chat) {
         chat.title = newName;
-        saveChatsToServer();
+        sendChatUpdate(chatPath(chatId), 'PUT', { title: newName });
         renderChatHistory();
     }
 }
 
 function deleteChat(chatId) {
     chats = chats.filter(c => c.id !== chatId);
-    saveChatsToServer();
+    sendChatUpdate(chatPath(chatId), 'DELETE');
     
     if (currentChatId === chatId) {
         if (chats.length > 0) {
@@ -251,18 +291,19 @@ function deleteChat(chatId) {
 function saveMessageToChat(message, role, sources = null) {
     const chat = chats.find(c => c.id === currentChatId);
     if (chat) {
-        chat.messages.push({ 
-            message, 
-            role, 
-            sources, 
-            timestamp: new Date().toISOString() 
-        });
+        const entry = {
+            message,
+            role,
+            sources,
+            timestamp: new Date().toISOString()
+        };
+        chat.messages = chat.messages || [];
+        chat.messages.push(entry);
+        sendChatUpdate(`${chatPath(chat.id)}/messages`, 'POST', entry);
 
         if (role === 'user' && chat.messages.filter(m => m.role === 'user').length === 1) {
             updateChatTitle(currentChatId, message);
         }
-
-        saveChatsToServer();
     }
 }
 
@@ -476,7 +517,7 @@ async function handleSendMessage() {
     const loadingId = addLoadingMessage();
 
     try {
-        const response = await fetch('/query', {
+        const response = await fetch('/query/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ question: message })
@@ -490,13 +531,11 @@ async function handleSendMessage() {
             return;
         }
 
-        if (!response.ok) {
+        if (!response.ok || !response.body) {
             throw new Error('Failed to get response');
         }
 
-        const data = await response.json();
-        removeLoadingMessage(loadingId);
-        addMessage(data.answer, 'assistant', data.sources);
+        await readAnswerStream(response, loadingId);
 
     } catch (error) {
         console.error('Error:', error);
@@ -508,6 +547,75 @@ async function handleSendMessage() {
     }
 }
 
+// ===============================
+// Streaming Answers (Server-Sent Events)
+// ===============================
+async function readAnswerStream(response, loadingId) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let answer = '';
+    let sources = null;
+    let messageText = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const { event, data } = parseSseEvent(buffer.slice(0, boundary));
+            buffer = buffer.slice(boundary + 2);
+
+            if (event === 'sources') {
+                sources = data.sources;
+            } else if (event === 'token') {
+                if (!messageText) {
+                    removeLoadingMessage(loadingId);
+                    messageText = addStreamingMessage();
+                }
+                answer += data.text;
+                messageText.innerHTML = answer;
+                scrollToBottom();
+            } else if (event === 'error') {
+                throw new Error(data.error);
+            }
+        }
+    }
+
+    removeLoadingMessage(loadingId);
+    if (!messageText) {
+        throw new Error('Empty response');
+    }
+    saveMessageToChat(answer, 'assistant', sources);
+}
+
+function parseSseEvent(raw) {
+    let event = 'message';
+    const dataLines = [];
+    raw.split('\n').forEach(line => {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+    });
+    return { event, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : null };
+}
+
+function addStreamingMessage() {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'message assistant';
+    messageDiv.innerHTML = `
+        <div class="message-avatar">AI</div>
+        <div class="message-content">
+            <div class="message-text"></div>
+        </div>
+    `;
+    messagesContainer.appendChild(messageDiv);
+    scrollToBottom();
+    return messageDiv.querySelector('.message-text');
+}
+
 // ===============================
 // Message Display
 // ===============================
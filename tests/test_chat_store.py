@@ -0,0 +1,30 @@
+import pytest
+
+from chat_store import ChatStore
+
+
+@pytest.mark.parametrize('chats', [
+    None,
+    ['not a chat'],
+    [{'id': 'c1', 'messages': 'hello'}],
+    [{'id': 'c1', 'messages': [{'role': 'system', 'message': 'hi'}]}],
+    [{'id': 'c1', 'messages': [{'role': 'user', 'message': 42}]}],
+])
+def test_malformed_upload_is_rejected_before_anything_is_replaced(tmp_path, chats):
+    store = ChatStore(str(tmp_path / 'chats.sqlite3'))
+    store.append_message('a@example.com', 'kept', 'user', 'first question')
+    with pytest.raises(ValueError):
+        store.replace_chats('a@example.com', chats)
+    assert [c['id'] for c in store.list_chats('a@example.com')['chats']] == ['kept']
+
+
+def test_upload_replaces_the_history(tmp_path):
+    store = ChatStore(str(tmp_path / 'chats.sqlite3'))
+    store.append_message('a@example.com', 'old', 'user', 'first question')
+    store.replace_chats('a@example.com', [
+        {'id': 'new', 'title': 'Newer', 'messages': [{'role': 'user', 'message': 'hi'},
+                                                    {'role': 'assistant', 'message': 'hello'}]},
+        {'id': 'older', 'messages': []},
+    ])
+    chats = store.list_chats('a@example.com')['chats']
+    assert [(c['id'], c['messageCount']) for c in chats] == [('new', 2), ('older', 0)]
@@ -0,0 +1,116 @@
+import pytest
+
+from benchmarks.chunking_bench import legacy_chunks, synthetic_entries
+from chunking import chunk_transcript, clean_text, sentence_chunks, time_chunks, token_chunks
+from harvester import Entry
+from passages import TokenCounter
+
+
+def numbered(count, seconds=3.0, words=6, sentence_every=0):
+    """Entries 'e0 ...', 'e1 ...' every `seconds`; every sentence_every-th one ends a sentence."""
+    entries = []
+    for k in range(count):
+        text = f"e{k} " + ' '.join(['word'] * (words - 1))
+        if sentence_every and k % sentence_every == sentence_every - 1:
+            text += '.'
+        entries.append(Entry(text, k * seconds, seconds))
+    return entries
+
+
+def ids(chunk):
+    """Numbers of the entries in a chunk made from numbered() entries."""
+    return [int(word[1:]) for word in chunk.text.split() if word.startswith('e')]
+
+
+def test_time_matches_the_old_chunker_except_repeated_tail_chunks():
+    entries = synthetic_entries(1)
+    old, new = legacy_chunks(entries), time_chunks(entries)
+    assert old[:len(new)] == new
+    # The old loop went on emitting shorter chunks inside the last full one
+    assert len(old) > len(new)
+    assert all(chunk.end_time <= new[-1].end_time for chunk in old[len(new):])
+
+
+def test_time_skips_empty_entries_instead_of_doubling_spaces():
+    entries = [Entry('one', 0, 2), Entry('  \n', 2, 2), Entry('two', 4, 2)]
+    assert time_chunks(entries)[0].text == 'one two'
+    # The old chunker joined the empty entry as well
+    assert legacy_chunks(entries)[0].text == 'one  two'
+
+
+def test_time_window_edge_is_compared_without_rounding_error():
+    # 32.05 - 2.05 is 29.999999999999996 in floats, so the old chunker kept an
+    # entry starting exactly 30 s after the window began; the window is half-open
+    entries = [Entry('first', 2.05, 2), Entry('edge', 32.05, 2)]
+    assert [c.text for c in time_chunks(entries)] == ['first', 'edge']
+    assert legacy_chunks(entries)[0].text == 'first edge'
+
+
+def test_token_windows_respect_max_and_overlap():
+    entries = numbered(200, words=5)
+    counter = TokenCounter()
+    tokens = {k: counter.count(clean_text(entry.text)) for k, entry in enumerate(entries)}
+    chunks = token_chunks(entries, max_tokens=40, overlap_tokens=8, counter=counter)
+
+    covered = set()
+    for previous, chunk in zip([None] + chunks, chunks):
+        members = ids(chunk)
+        assert members == list(range(members[0], members[-1] + 1))
+        assert sum(tokens[k] for k in members) <= 40
+        if previous is not None:
+            shared = set(ids(previous)) & set(members)
+            assert shared and sum(tokens[k] for k in shared) <= 8
+        covered.update(members)
+    assert covered == set(range(200))
+
+
+def test_oversized_entry_is_a_chunk_of_its_own():
+    entries = numbered(3, words=4)
+    entries[1] = Entry('e1 ' + ' '.join(['long'] * 100), 3.0, 3.0)
+    chunks = token_chunks(entries, max_tokens=20, overlap_tokens=4)
+    assert [ids(c) for c in chunks] == [[0], [1], [2]]
+
+
+def test_sentence_cuts_land_on_sentence_ends():
+    entries = numbered(100, seconds=3.0, sentence_every=3)
+    # An overlap of 10 s always holds the start of a sentence here
+    chunks = sentence_chunks(entries, duration=30, overlap=10)
+    for chunk in chunks[:-1]:
+        assert chunk.text.endswith('.')
+    for chunk in chunks[1:]:
+        # The overlap begins at the start of a sentence
+        first = ids(chunk)[0]
+        assert first % 3 == 0
+    assert ids(chunks[-1])[-1] == 99
+
+
+def test_unpunctuated_sentences_fall_back_to_time_windows():
+    entries = numbered(60)
+    assert sentence_chunks(entries) == time_chunks(entries)
+
+
+@pytest.mark.parametrize('strategy', ['time', 'sentences'])
+def test_gap_starts_a_fresh_chunk(strategy):
+    # Ten entries, then nothing for three minutes, then ten more
+    entries = numbered(10) + [Entry(f"e{k}", 200 + (k - 10) * 3.0, 3.0) for k in range(10, 20)]
+    chunks = chunk_transcript(entries, strategy)
+    members = [ids(c) for c in chunks]
+    assert not any(min(m) < 10 <= max(m) for m in members)
+    assert any(m[0] == 10 for m in members)
+    # No chunk lies wholly inside the one before it
+    for previous, current in zip(members, members[1:]):
+        assert not set(current) <= set(previous)
+
+
+@pytest.mark.parametrize('strategy', ['time', 'sentences', 'tokens'])
+def test_last_entry_ends_the_last_chunk(strategy):
+    entries = numbered(37, sentence_every=4)
+    chunks = chunk_transcript(entries, strategy)
+    assert ids(chunks[-1])[-1] == 36
+    assert chunks[-1].end_time == round((entries[-1].start + entries[-1].duration) / 60, 2)
+    assert [c.chunk_id for c in chunks] == list(range(1, len(chunks) + 1))
+
+
+def test_empty_and_single_entry_transcripts():
+    assert chunk_transcript([], 'time') == []
+    assert [c.text for c in chunk_transcript([Entry('only one', 0, 4)], 'tokens')] == ['only one']
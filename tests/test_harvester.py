@@ -0,0 +1,57 @@
+import json
+import os
+
+from harvester import AdaptiveLimiter, Blocked, Entry, Harvester, JobState
+
+PLAYLIST = 'https://www.youtube.com/playlist?list=PLtest'
+VIDEOS = [f"https://www.youtube.com/watch?v=vid-{i}" for i in range(3)]
+
+
+class Source:
+    """In-memory source; video_info of the listed video ids is blocked once each."""
+
+    def __init__(self, block_info=()):
+        self.block_info = set(block_info)
+        self.transcripts = []
+
+    def list_videos(self, url):
+        return 'Test playlist', VIDEOS
+
+    def transcript(self, video_id):
+        self.transcripts.append(video_id)
+        return [Entry(f"words of {video_id} part {i}", i * 10.0, 10.0) for i in range(9)]
+
+    def video_info(self, video_url):
+        video_id = video_url.rsplit('=', 1)[1]
+        if video_id in self.block_info:
+            self.block_info.discard(video_id)
+            raise Blocked('429', retry_after=0.01)
+        return f"Title {video_id}", 90
+
+
+def harvest(tmp_path, source):
+    state = JobState(str(tmp_path / 'harvest.sqlite3'))
+    harvester = Harvester(source, state, str(tmp_path / 'out'), AdaptiveLimiter(1000, burst=10), workers=2)
+    try:
+        return harvester.run([PLAYLIST]), state.counts()
+    finally:
+        state.close()
+
+
+def test_blocked_video_info_requeues_the_video(tmp_path):
+    source = Source(block_info={'vid-1'})
+    summary, counts = harvest(tmp_path, source)
+    assert summary['done'] == 3 and summary['blocked'] == 1 and counts['done'] == 3
+    files = sorted(os.listdir(tmp_path / 'out'))
+    assert files == ['01_Title vid-0_vid-0.json', '02_Title vid-1_vid-1.json', '03_Title vid-2_vid-2.json']
+    with open(tmp_path / 'out' / files[1], encoding='utf-8') as f:
+        saved = json.load(f)
+    assert saved['video_title'] == 'Title vid-1' and saved['duration_minutes'] == 1.5
+    assert source.transcripts.count('vid-1') == 2
+
+
+def test_resume_skips_finished_videos(tmp_path):
+    harvest(tmp_path, Source())
+    source = Source()
+    summary, counts = harvest(tmp_path, source)
+    assert summary['videos'] == 0 and source.transcripts == [] and counts['done'] == 3
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from index_store import index_exists, new_generation, open_index, publish_index, write_index
+
+
+def write(label, directory, size=4):
+    df = pd.DataFrame({
+        'video_id': [f"video-{i}" for i in range(size)],
+        'video_title': [f"{label} {i}" for i in range(size)],
+        'video_url': [f"https://www.youtube.com/watch?v=video-{i}" for i in range(size)],
+        'duration_minutes': 10.0,
+        'chunk_id': np.arange(size),
+        'start_time': np.arange(size) * 0.5,
+        'end_time': np.arange(size) * 0.5 + 0.5,
+        'text': [f"{label} chunk {i}" for i in range(size)],
+    })
+    vectors = np.random.default_rng(size).standard_normal((size, 8)).astype(np.float32)
+    write_index(df, directory, vectors)
+
+
+def first_text(directory):
+    _, chunks, _ = open_index(directory)
+    return [chunks.text(0)]
+
+
+def test_plain_directory_is_moved_aside_as_an_older_generation(tmp_path):
+    index = str(tmp_path / 'index')
+    write('old', index)
+    generation = new_generation(index)
+    write('new', generation)
+
+    publish_index(generation, index)
+
+    assert os.path.islink(index) and os.path.realpath(index) == os.path.realpath(generation)
+    assert first_text(index) == ['new chunk 0']
+    aside = [p for p in tmp_path.iterdir() if p.name.startswith('index.gen-') and str(p) != generation]
+    assert len(aside) == 1
+    assert int(aside[0].name.rsplit('-', 1)[1]) < int(generation.rsplit('-', 1)[1])
+
+
+def test_pruning_keeps_the_newest_generations(tmp_path):
+    index = str(tmp_path / 'index')
+    write('plain', index)
+    published = []
+    for label in ('first', 'second', 'third'):
+        generation = new_generation(index)
+        write(label, generation)
+        publish_index(generation, index, keep=2)
+        published.append(generation)
+        assert first_text(index) == [f"{label} chunk 0"]
+
+    generations = sorted(p.name for p in tmp_path.iterdir() if p.name.startswith('index.gen-'))
+    assert generations == sorted(os.path.basename(p) for p in published[-2:])
+    assert index_exists(index)
+
+
+def test_moved_aside_directory_is_pruned_first(tmp_path):
+    index = str(tmp_path / 'index')
+    write('plain', index)
+    generation = new_generation(index)
+    write('new', generation)
+
+    publish_index(generation, index, keep=1)
+
+    assert [p.name for p in tmp_path.iterdir() if p.name.startswith('index.gen-')] == [os.path.basename(generation)]
+    assert first_text(index) == ['new chunk 0']
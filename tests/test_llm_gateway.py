@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from llm_gateway import GatewayRejected, LLMGateway
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+def gateway(**options):
+    options = {'requests_per_minute': 0, 'tokens_per_minute': 0, 'backoff_base': 0.01, **options}
+    return LLMGateway(**options)
+
+
+def test_free_slot_is_used_without_a_queue():
+    g = gateway(max_concurrency=2, max_queue=0)
+    assert g.call(lambda timeout: 'ok') == 'ok'
+    with g.admit():
+        assert g.call(lambda timeout: 'second slot') == 'second slot'
+    assert g.stats()['rejected'] == 0
+
+
+def test_busy_slots_with_no_queue_reject_at_once():
+    g = gateway(max_concurrency=1, max_queue=0)
+    with g.admit():
+        with pytest.raises(GatewayRejected) as rejected:
+            g.call(lambda timeout: 'never')
+    assert rejected.value.reason == 'queue full'
+    assert g.rejected == 1 and g.waiting == 0
+
+
+def test_queued_caller_gets_the_released_slot():
+    g = gateway(max_concurrency=1, max_queue=1, max_queue_wait=5)
+    holding, release = threading.Event(), threading.Event()
+
+    def hold():
+        with g.admit():
+            holding.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    holding.wait()
+    threading.Timer(0.05, release.set).start()
+    assert g.call(lambda timeout: 'after wait') == 'after wait'
+    thread.join()
+
+
+def test_queue_wait_is_bounded():
+    g = gateway(max_concurrency=1, max_queue=1, max_queue_wait=0.05)
+    with g.admit():
+        with pytest.raises(GatewayRejected) as rejected:
+            g.call(lambda timeout: 'never')
+    assert rejected.value.reason == 'queue wait exceeded'
+    assert g.waiting == 0
+
+
+def test_retries_transient_errors():
+    g = gateway(max_retries=2)
+    attempts = []
+
+    def flaky(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 3:
+            raise RateLimited()
+        return 'ok'
+
+    assert g.call(flaky) == 'ok'
+    assert g.stats()['retries'] == 2 and g.stats()['failures'] == 0
+
+
+def test_async_admission_shares_slots_with_sync_callers():
+    g = gateway(max_concurrency=1, max_queue=0)
+
+    async def ask():
+        async def answer(timeout):
+            return 'ok'
+        return await g.call_async(answer)
+
+    assert asyncio.run(ask()) == 'ok'
+    with g.admit():
+        with pytest.raises(GatewayRejected):
+            asyncio.run(ask())
+
+
+def test_async_waiter_gives_up_its_place_when_cancelled():
+    g = gateway(max_concurrency=1, max_queue=1, max_queue_wait=0.5)
+
+    async def wait_for_slot():
+        async with g.admit_async():
+            pass
+
+    async def cancel_while_queued():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(wait_for_slot(), 0.05)
+
+    with g.admit():
+        asyncio.run(cancel_while_queued())
+        assert g.waiting == 0
+    assert g.call(lambda timeout: 'slot is free again') == 'slot is free again'
+
+
+def test_async_queue_wait_is_measured_per_waiter():
+    g = gateway(max_concurrency=1, max_queue=64, max_queue_wait=0.2)
+
+    async def wait_for_slot():
+        start = time.monotonic()
+        with pytest.raises(GatewayRejected):
+            async with g.admit_async():
+                pass
+        return time.monotonic() - start
+
+    async def crowd():
+        return await asyncio.gather(*(wait_for_slot() for _ in range(50)))
+
+    with g.admit():
+        waited = asyncio.run(crowd())
+    # All give up together, not in batches of executor threads
+    assert max(waited) < 0.6
+    assert g.waiting == 0 and g.rejected == 50
+
+
+def test_released_slot_goes_to_the_first_async_waiter():
+    g = gateway(max_concurrency=1, max_queue=4, max_queue_wait=2)
+    order = []
+
+    async def ask(n):
+        async with g.admit_async():
+            order.append(n)
+            await asyncio.sleep(0.01)
+
+    async def queue_up():
+        async with g.admit_async():
+            tasks = [asyncio.ensure_future(ask(n)) for n in range(4)]
+            await asyncio.sleep(0.05)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(queue_up())
+    assert order == [0, 1, 2, 3]
+    assert g.stats()['active'] == 0 and g._free == 1
@@ -0,0 +1,13 @@
+from metrics import Registry
+
+
+def test_growing_stats_are_rendered_as_counters():
+    registry = Registry(namespace='t')
+    registry.gauges(lambda: [('cache_hits', 'Hits.', 3, 'counter'),
+                             ('prompt_tokens_total', 'Tokens.', 120, 'counter'),
+                             ('cache_size', 'Entries.', 7)])
+    text = registry.render()
+    assert '# TYPE t_cache_hits_total counter\nt_cache_hits_total 3' in text
+    assert '# TYPE t_prompt_tokens_total counter\nt_prompt_tokens_total 120' in text
+    assert '# TYPE t_cache_size gauge\nt_cache_size 7' in text
+
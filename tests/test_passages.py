@@ -0,0 +1,38 @@
+import pandas as pd
+
+from passages import TokenCounter, pack_context, trim_to_tokens
+
+
+def rows(texts):
+    return pd.DataFrame({
+        'video_title': [f"Video {i}" for i in range(len(texts))],
+        'video_url': [f"https://www.youtube.com/watch?v=v{i}" for i in range(len(texts))],
+        'chunk_id': range(len(texts)),
+        'start_time': [1.0] * len(texts),
+        'end_time': [1.5] * len(texts),
+        'text': texts,
+    })
+
+
+def test_unpunctuated_top_passage_is_cut_at_a_word_boundary():
+    counter = TokenCounter()
+    passage = ' '.join(f"word{i % 50}" for i in range(2000))
+    context, packed, used = pack_context(rows([passage, "second passage."]), 300, counter)
+    assert len(packed) == 1
+    text = packed['text'].iloc[0]
+    assert counter.count(text) >= 40 and used <= 300
+    assert passage.startswith(text) and passage[len(text)] == ' '
+    assert text in context
+
+
+def test_sentence_trim_is_kept_when_long_enough():
+    counter = TokenCounter()
+    text = "A first sentence that is long enough to keep on its own here. " * 3 + "x" * 400
+    trimmed, tokens = trim_to_tokens(text, 60, counter, min_tokens=10)
+    assert trimmed.endswith('here.') and tokens <= 60
+
+
+def test_passages_that_fit_are_packed_whole():
+    counter = TokenCounter()
+    context, packed, used = pack_context(rows(["One. Two.", "Three."]), 1000, counter)
+    assert list(packed['text']) == ["One. Two.", "Three."]
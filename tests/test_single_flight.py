@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_run():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def work():
+        started.set()
+        release.wait(5)
+        return 'answer'
+
+    leader = threading.Thread(target=lambda: results.append(flight.do('q', work)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(flight.do('q', lambda: 'second run')))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    follower.join()
+    assert results == ['answer', 'answer']
+    assert flight.stats()['executed'] == 1 and flight.coalesced_local == 1
+
+
+def test_follower_stops_waiting_after_max_wait():
+    flight = SingleFlight(max_wait=0.05)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'slow'
+
+    leader = threading.Thread(target=flight.do, args=('q', slow))
+    leader.start()
+    started.wait(5)
+    try:
+        assert flight.do('q', lambda: 'own answer') == 'own answer'
+    finally:
+        release.set()
+        leader.join()
+    assert flight.waits_exceeded == 1 and flight.executed == 2
+
+
+def test_remote_follower_stops_waiting_after_max_wait(tmp_path):
+    db = str(tmp_path / 'flights.sqlite3')
+    other_worker = SingleFlight(db_path=db)
+    leader, token = other_worker._acquire('q')
+    assert leader
+    flight = SingleFlight(db_path=db, max_wait=0.1, poll_interval=0.01)
+    start = time.monotonic()
+    assert flight.do('q', lambda: 'own answer') == 'own answer'
+    assert time.monotonic() - start < 5
+    assert flight.waits_exceeded == 1
+
+
+def test_remote_follower_gets_the_published_result(tmp_path):
+    db = str(tmp_path / 'flights.sqlite3')
+    other_worker = SingleFlight(db_path=db)
+    _, token = other_worker._acquire('q')
+    threading.Timer(0.05, other_worker._publish, args=('q', token, True, '["answer", []]')).start()
+    flight = SingleFlight(db_path=db, max_wait=5, poll_interval=0.01)
+    assert flight.do('q', lambda: 'second run') == ['answer', []]
+    assert flight.coalesced_remote == 1 and flight.executed == 0
+
+
+def test_async_callers_share_one_run(tmp_path):
+    flight = SingleFlight(db_path=str(tmp_path / 'flights.sqlite3'))
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return 'answer'
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async('q', work) for _ in range(5)))
+
+    assert asyncio.run(main()) == ['answer'] * 5
+    assert len(runs) == 1 and flight.coalesced_local == 4
+
+
+def test_cancelled_async_leader_leaves_followers_running():
+    flight = SingleFlight(max_wait=5)
+
+    async def hang():
+        await asyncio.sleep(10)
+
+    async def own():
+        return 'own answer'
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do_async('q', hang))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flight.do_async('q', own))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(main()) == 'own answer'
+    assert flight.stats()['in_flight'] == 0
@@ -1,10 +1,8 @@
 import json
 import os
 import pandas as pd
-import numpy as np
 import joblib
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
-from sentence_transformers import SentenceTransformer
 # from sklearn.metrics.pairwise import cosine_similarity
 
 def create_embeddings(text_list, model):
@@ -12,12 +10,26 @@ def create_embeddings(text_list, model):
     embeddings = model.encode(text_list, show_progress_bar=True)
     return embeddings
 
-# Load model once
-print("Loading model...")
-model = SentenceTransformer('all-MiniLM-L6-v2')
-print("Model loaded!\n")
+_model = None
+
+def load_model():
+    """Load the embedding model once (importing torch); later calls return the same model."""
+    global _model
+    if _model is None:
+        from sentence_transformers import SentenceTransformer
+        print("Loading model...")
+        _model = SentenceTransformer('all-MiniLM-L6-v2')
+        print("Model loaded!\n")
+    return _model
+
+def __getattr__(name):
+    # `from read_chunks import model` still works, but loads the model on first use
+    if name == 'model':
+        return load_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
+    model = load_model()
     # Get all JSON files
     jsons = [f for f in os.listdir('transcripts_json') if f.endswith('.json')]
 